@@ -6,143 +6,342 @@
 
 import streamlit as st
 import uuid
-import random
-import openai
-from datetime import datetime
+import logging
 import pandas as pd
 from io import BytesIO
 from pathlib import Path
 import os
 import time
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 
 from google.oauth2 import service_account
+from google.auth.transport.requests import Request
 from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseUpload, MediaIoBaseDownload
+
+from turn_records import Turn
+from session_spill import SessionMemoryManager
+from usage_accounting import UsageLedger, load_price_table, usage_from_response
+from log_archive import append_rows, load_dictionary
+from gdrive_ops import DriveOps
+from drive_standin import DriveStandIn, build_http_service
+from fault_injection import LatencyModel
+from turn_log import TurnLogStore
+from state_backend import open_state_backend
+from randomization import PermutedBlockAllocator
+from llm_client import BackgroundLLMClient
+from generation_control import Generation, GenerationLedger
+from response_boxing import response_box
+from transcript_view import render_response, render_transcript
+from profiling import NO_PROFILE, Profiler, profiling_requested
+import tracing
+from tracing import Tracer
+from study_metrics import StudyMetrics
+from operator_dashboard import dashboard_requested, render_operator_dashboard
+from calibration_mode import calibration_requested, render_calibration
+from storage_sync import SpoolWriter, spool_status
+from speculative import SPECULATIVE_PROMPT, Speculation, SpeculationLedger, is_confirmation, offers_revision
+
+# Errors of background work (uploads, snapshots, assignment retries) go to the server log
+logger = logging.getLogger(__name__)
+
+# --- PROFILING ---
+# Opt-in (PROFILE_RERUNS=1 or ?profile=<profiling_token>): writes collapsed stacks and a top-N
+# summary per rerun and per LLM/Drive call, see profiling.py
+PROFILE_DIR = os.environ.get("PROFILE_DIR", str(Path(tempfile.gettempdir()) / "llm_study_profiles" / Path(__file__).stem))
+PROFILING = profiling_requested(st.query_params, st.secrets.get("profiling_token"))
+
+@st.cache_resource
+def get_profiler():
+    return Profiler(PROFILE_DIR)
+
+def profiled(label):
+    return get_profiler().call(label) if PROFILING else NO_PROFILE
+
+if PROFILING:
+    get_profiler().start_rerun()
+
+# --- TRACING ---
+# Opt-in (TRACE_DIR=<dir>): every rerun is one trace with child spans for assignment fetches,
+# pandas parsing, LLM requests, Drive operations and turn log writes, tagged with user_id,
+# variant and task_index. One Trace Event Format file per process, see tracing.py
+TRACE_DIR = os.environ.get("TRACE_DIR")
+
+@st.cache_resource
+def get_tracer():
+    return Tracer(Path(TRACE_DIR) / f"{Path(__file__).stem}-{os.getpid()}.trace.json", process_name=f"{Path(__file__).stem} {os.getpid()}")
+
+if TRACE_DIR:
+    get_tracer().start_rerun(
+        user_id=st.session_state.get("user_id"),
+        variant=st.session_state.get("variant"),
+        task_index=st.session_state.get("current_task_index"),
+    )
+
+# --- Shared clients (built once per process and reused by all sessions and reruns) ---
+@st.cache_resource
+def get_gdrive_credentials():
+    return service_account.Credentials.from_service_account_info(
+        st.secrets["gdrive"], scopes=["https://www.googleapis.com/auth/drive"]
+    )
+
+# Drive stand-ins instead of Google Drive (no Google credentials needed): in process with
+# DRIVE_STANDIN_LATENCY_MS (milliseconds or a distribution, see fault_injection.py), or the HTTP
+# stand-in at DRIVE_API_URL (drive_standin.py, local_emulators.py)
+DRIVE_STANDIN = bool(os.environ.get("DRIVE_STANDIN_LATENCY_MS") or os.environ.get("DRIVE_API_URL"))
+
+@st.cache_resource
+def get_drive_ops():
+    # Session replays and load tests run against an in-process Drive stand-in
+    if os.environ.get("DRIVE_STANDIN_LATENCY_MS"):
+        return DriveOps(DriveStandIn(latency_s=LatencyModel.parse(os.environ["DRIVE_STANDIN_LATENCY_MS"])).build_service, "standin-folder")
+    if os.environ.get("DRIVE_API_URL"):
+        return DriveOps(lambda: build_http_service(os.environ["DRIVE_API_URL"]), st.secrets["gdrive"]["folder_id"])
+    # One DriveOps per process: cached file ids, batched lookups, concurrent uploads
+    return DriveOps(
+        lambda: build("drive", "v3", credentials=get_gdrive_credentials(), cache_discovery=False),
+        st.secrets["gdrive"]["folder_id"],
+    )
+
+@st.cache_resource
+def get_openai_client():
+    # One async client on a background event loop for all sessions; pool limits and HTTP/2
+    # ("auto": when h2 is installed) can be tuned per deployment, see llm_client.py
+    http2 = os.environ.get("LLM_HTTP2", "auto")
+    return BackgroundLLMClient(
+        api_key=st.secrets["openai_api_key"],
+        max_connections=int(os.environ.get("LLM_MAX_CONNECTIONS", 100)),
+        max_keepalive=int(os.environ.get("LLM_MAX_KEEPALIVE", 100)),
+        keepalive_expiry_s=float(os.environ.get("LLM_KEEPALIVE_SECONDS", 60)),
+        http2=None if http2 == "auto" else http2 == "1",
+    )
+
+@st.cache_resource
+def get_background_executor():
+    return ThreadPoolExecutor(max_workers=8, thread_name_prefix="study-prefetch")
 
 # --- Function definition for Google Drive upload ---
 def upload_to_gdrive(file_path, file_name_on_drive):
-    creds = service_account.Credentials.from_service_account_info(st.secrets["gdrive"])
-    service = build("drive", "v3", credentials=creds)
-
-    folder_id = st.secrets["gdrive"]["folder_id"]
-
-    results = service.files().list(
-        q=f"name='{file_name_on_drive}' and '{folder_id}' in parents",
-        fields="files(id)",
-        supportsAllDrives=True
-    ).execute()
-    items = results.get('files', [])
-
-    mimetype = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet" if file_name_on_drive.endswith('.xlsx') else "text/csv"
-
-    media = MediaIoBaseUpload(open(file_path, "rb"),
-                              mimetype=mimetype,
-                              resumable=True)
-
-    if items:
-        file_id = items[0]['id']
-        service.files().update(
-            fileId=file_id,
-            media_body=media,
-            supportsAllDrives=True
-        ).execute()
-    else:
-        file_metadata = {
-            "name": file_name_on_drive,
-            "parents": [folder_id],
-            "mimeType": mimetype
-        }
-        service.files().create(
-            body=file_metadata,
-            media_body=media,
-            fields="id",
-            supportsAllDrives=True
-        ).execute()
+    with profiled("drive-upload"), get_study_metrics().timed("drive-upload"):
+        get_drive_ops().save(file_name_on_drive, Path(file_path).read_bytes())
 
 # --- Function definition for Google Drive download (returns content as bytes) ---
 def download_from_gdrive_to_memory(file_name_on_drive):
-    creds = service_account.Credentials.from_service_account_info(st.secrets["gdrive"])
-    service = build("drive", "v3", credentials=creds)
-
-    folder_id = st.secrets["gdrive"]["folder_id"]
-
-    results = service.files().list(
-        q=f"name='{file_name_on_drive}' and '{folder_id}' in parents",
-        fields="files(id)",
-        supportsAllDrives=True
-    ).execute()
-    items = results.get('files', [])
-
-    if items:
-        file_id = items[0]['id']
-        request = service.files().get_media(fileId=file_id)
-
-        file_content_buffer = BytesIO()
-        downloader = MediaIoBaseDownload(file_content_buffer, request)
-        done = False
-        while done is False:
-            status, done = downloader.next_chunk()
-
-        file_content_buffer.seek(0)
-        return file_content_buffer.getvalue()
-    else:
-        return None
+    with profiled("drive-download"), get_study_metrics().timed("drive-download"):
+        return get_drive_ops().download(file_name_on_drive)
 
 # Set your OpenAI API key
-client = openai.OpenAI(api_key=st.secrets["openai_api_key"])
+client = get_openai_client()
 
 # --- CONFIG ---
 SURVEY_BASE_URL = "https://lmubwl.eu.qualtrics.com/jfe/form/SV_5dLESQuCgLVK6pw"
 LLM_VARIANTS = ["1", "2", "3"]
+# Variants whose responses get the green box around the values/recommendations block
+BOXED_VARIANTS = ["1"]
+STUDY_NAME = "Va_Knowledge"
 ASSIGNMENTS_FILE = "Variant_Assignment_Va_Knowledge.csv"
-CHAT_LOG_FILE = "Chat_Logs_Va_Knowledge.xlsx"
-
-# --- SETUP SESSION STATE ---
-if "user_id" not in st.session_state:
-    st.session_state.user_id = str(uuid.uuid4())[:8]
-
-if "current_task_index" not in st.session_state:
-    st.session_state.current_task_index = 0
-
-if "chat_history" not in st.session_state:
-    st.session_state.chat_history = []
-
-if "show_survey" not in st.session_state:
-    st.session_state.show_survey = False
-
-if "show_landing_page" not in st.session_state:
-    st.session_state.show_landing_page = True
-
-if "distractor_complete" not in st.session_state:
-    st.session_state.distractor_complete = False
+CHAT_LOG_FILE = "Chat_Logs_Va_Knowledge.jsonl.zst"
+LLM_MODEL = "gpt-4.1-nano-2025-04-14"
+# zstd dictionary for the chat log archive (see log_archive.py); frames are written without one if missing
+LOG_DICTIONARY_FILE = Path(__file__).parent / "log_dictionary.zdict"
+# Latest turns of a task drawn in full on every rerun; older ones collapse into one-line
+# summaries that expand on click (0 draws every turn in full), see transcript_view.py
+TRANSCRIPT_WINDOW_TURNS = int(os.environ.get("TRANSCRIPT_WINDOW_TURNS", 4))
+
+# Replicas behind a load balancer (see replicas.py) keep assignments, turn logs and session
+# snapshots in one shared state backend (see state_backend.py): sqlite:///path for the replicas of
+# one host, kv+http://host:port across hosts. Unset, this process keeps them in local files.
+STATE_BACKEND = os.environ.get("STATE_BACKEND")
+
+@st.cache_resource
+def get_state_backend():
+    return open_state_backend(STATE_BACKEND) if STATE_BACKEND else None
+
+# Durable copy of every turn, keyed by turn id: local to this process unless there is a state backend
+TURN_LOG_DIR = os.environ.get("TURN_LOG_DIR", str(Path(tempfile.gettempdir()) / "llm_study_turns" / STUDY_NAME))
+
+@st.cache_resource
+def get_turn_log_store():
+    if get_state_backend():
+        return get_state_backend().turn_log(STUDY_NAME)
+    return TurnLogStore(TURN_LOG_DIR)
+
+@st.cache_resource
+def get_log_dictionary():
+    return load_dictionary(LOG_DICTIONARY_FILE)
+
+# Idle or finished transcripts are moved to local disk once all sessions of this process together
+# hold more than the ceiling
+SESSION_MEMORY_CEILING_MB = int(os.environ.get("SESSION_MEMORY_CEILING_MB", "256"))
+SESSION_IDLE_SECONDS = int(os.environ.get("SESSION_IDLE_SECONDS", "900"))
+SESSION_SPILL_DIR = os.environ.get("SESSION_SPILL_DIR", str(Path(tempfile.gettempdir()) / "llm_study_spill" / STUDY_NAME))
+
+# Prices in USD per 1M tokens; override per model with st.secrets["llm_prices"] or LLM_PRICE_TABLE
+LLM_PRICES = load_price_table(st.secrets.get("llm_prices"))
+USAGE_SNAPSHOT_FILE = os.environ.get("USAGE_SNAPSHOT_FILE", str(Path(tempfile.gettempdir()) / "llm_study_usage" / f"{STUDY_NAME}.json"))
+
+@st.cache_resource
+def get_usage_ledger():
+    return UsageLedger(snapshot_path=USAGE_SNAPSHOT_FILE)
+
+# A logged turn as a Turn, or None; also rebuilds a spilled transcript whose file is gone
+def turn_from_log(turn_id):
+    row = get_turn_log_store().get(turn_id)
+    return Turn.from_log_row(row) if row is not None else None
+
+@st.cache_resource
+def get_session_memory_manager():
+    return SessionMemoryManager(
+        ceiling_bytes=SESSION_MEMORY_CEILING_MB * 2**20,
+        idle_seconds=SESSION_IDLE_SECONDS,
+        spill_dir=SESSION_SPILL_DIR,
+        recover_turn=turn_from_log,
+    )
 
-# --- VARIANT ASSIGNMENT FUNCTIONS ---
-def load_assignments_data_from_gdrive(filename):
-    gdrive_file_name = Path(filename).name
+# With a spool directory, chat log and assignment writes are handed to the storage sync daemon
+# (storage_sync.py), which owns all Drive writes of the host; this process never waits on Drive
+STORAGE_SPOOL_DIR = os.environ.get("STORAGE_SPOOL_DIR")
+
+@st.cache_resource
+def get_spool_writer():
+    return SpoolWriter(STORAGE_SPOOL_DIR) if STORAGE_SPOOL_DIR else None
+
+# Variant 1: prepare the "integrate the recommendations" revision while the participant reads
+# the answer (see speculative.py). Costs an extra LLM call whenever the participant says no.
+SPECULATIVE_REVISIONS = os.environ.get("SPECULATIVE_REVISIONS") == "1"
+
+@st.cache_resource
+def get_speculation_ledger():
+    return SpeculationLedger(lambda response: usage_from_response(response, LLM_MODEL, LLM_PRICES))
+
+# A participant's prompt is answered by a cancellable generation, at most one per session (see
+# generation_control.py)
+@st.cache_resource
+def get_generation_ledger():
+    return GenerationLedger()
+
+# Models offered in the researcher calibration mode (comma-separated env var or secrets list)
+CALIBRATION_MODELS = [m.strip() for m in os.environ["CALIBRATION_MODELS"].split(",") if m.strip()] if os.environ.get("CALIBRATION_MODELS") else list(st.secrets.get("calibration_models", [LLM_MODEL]))
+
+# Live counters for the operator dashboard
+@st.cache_resource
+def get_study_metrics():
+    return StudyMetrics(live_window_seconds=SESSION_IDLE_SECONDS)
+
+# Variants are allocated from a seeded permuted-block schedule (see randomization.py). The local
+# database is rebuilt from the assignments file on Drive when it is missing, e.g. after a redeploy.
+ASSIGNMENT_DB_FILE = os.environ.get("ASSIGNMENT_DB_FILE", str(Path(tempfile.gettempdir()) / "llm_study_assignments.sqlite3"))
+RANDOMIZATION_SEED = st.secrets.get("randomization_seed", STUDY_NAME)
+RANDOMIZATION_BLOCK_SIZE = 6
+# A leased slot is handed to the next participant if no prompt was sent within this time
+ASSIGNMENT_LEASE_SECONDS = 1800
+# Confirming the assignment is retried before the participant is asked to send the prompt again
+ASSIGNMENT_CONFIRM_ATTEMPTS = 3
+ASSIGNMENT_RETRY_SECONDS = 0.5
+ASSIGNMENT_COLUMNS = ["user_id", "variant", "slot", "assigned_at"]
+
+def fetch_assignments_from_gdrive(filename):
+    file_bytes = download_from_gdrive_to_memory(Path(filename).name)
+    if file_bytes:
+        with tracing.span("pandas.read_csv", file=Path(filename).name, bytes=len(file_bytes)):
+            return pd.read_csv(BytesIO(file_bytes), dtype={'user_id': str, 'variant': str})
+    return pd.DataFrame(columns=ASSIGNMENT_COLUMNS, dtype=str)
+
+@st.cache_resource
+def get_assignment_allocator():
+    if get_state_backend():
+        allocator = get_state_backend().allocator(
+            STUDY_NAME, LLM_VARIANTS, RANDOMIZATION_SEED,
+            block_size=RANDOMIZATION_BLOCK_SIZE, lease_seconds=ASSIGNMENT_LEASE_SECONDS,
+        )
+    else:
+        allocator = PermutedBlockAllocator(
+            ASSIGNMENT_DB_FILE, STUDY_NAME, LLM_VARIANTS, RANDOMIZATION_SEED,
+            block_size=RANDOMIZATION_BLOCK_SIZE, lease_seconds=ASSIGNMENT_LEASE_SECONDS,
+        )
+    if allocator.is_empty():
+        allocator.restore(fetch_assignments_from_gdrive(ASSIGNMENTS_FILE).to_dict("records"))
+    return allocator
+
+# --- BACKGROUND WARM-UP ---
+# Runs while the participant reads the landing page, so the first prompt does not pay for
+# building the Drive client, fetching tokens or opening the OpenAI connection.
+def warm_up_clients():
     try:
-        file_bytes = download_from_gdrive_to_memory(gdrive_file_name)
-        if file_bytes:
-            df = pd.read_csv(BytesIO(file_bytes), dtype={'user_id': str, 'variant': str})
-            return df
-        else:
-            return pd.DataFrame(columns=["user_id", "variant"], dtype=str)
-    except Exception as e:
-        st.error(f"Failed to load assignments from Google Drive: {e}. Returning empty DataFrame.")
-        return pd.DataFrame(columns=["user_id", "variant"], dtype=str)
-
+        # Builds a Drive service and caches both file ids with one batch request
+        get_drive_ops().lookup_ids([ASSIGNMENTS_FILE, CHAT_LOG_FILE])
+        get_assignment_allocator()
+        if not DRIVE_STANDIN:
+            credentials = get_gdrive_credentials()
+            if not credentials.valid:
+                credentials.refresh(Request())
+        client.models.retrieve(LLM_MODEL)
+    except Exception:
+        pass  # best effort only, the regular code path builds whatever is missing
 
+# --- VARIANT ASSIGNMENT FUNCTIONS ---
 # --- Save assignments ---
-def save_assignments(df, filename):
-    local_path = Path(filename)
-    gdrive_file_name = local_path.name
-    df.to_csv(local_path, index=False)
+# Runs in the background after a new confirmation. Rows on Drive that this process does not know
+# (assignments from before the schedule, other replicas) are kept.
+def export_assignments():
     try:
-        upload_to_gdrive(local_path, gdrive_file_name)
-    except Exception as e:
-        st.error(f"Failed to upload assignments to Google Drive: {e}")
+        if get_spool_writer():
+            get_spool_writer().submit_assignments(ASSIGNMENTS_FILE, get_assignment_allocator().assignments())
+            return
+        allocated = pd.DataFrame(get_assignment_allocator().assignments(), columns=ASSIGNMENT_COLUMNS)
+        on_drive = fetch_assignments_from_gdrive(ASSIGNMENTS_FILE)
+        on_drive = on_drive[~on_drive["user_id"].isin(allocated["user_id"])]
+        assignments_df = pd.concat([on_drive, allocated], ignore_index=True).reindex(columns=ASSIGNMENT_COLUMNS)
+        local_path = Path(ASSIGNMENTS_FILE)
+        with tracing.span("pandas.to_csv", file=local_path.name, rows=len(assignments_df)):
+            assignments_df.to_csv(local_path, index=False)
+        upload_to_gdrive(local_path, local_path.name)
+    except Exception:
+        logger.exception("Failed to upload assignments to Google Drive")
+
+# Leases a slot while the participant reads the instructions; runs in the background
+def prefetch_variant(user_id):
+    with tracing.span("assignment.lease"):
+        _, variant = get_assignment_allocator().lease(user_id)
+    return variant
+
+def start_variant_prefetch():
+    if "variant" not in st.session_state and "variant_future" not in st.session_state:
+        st.session_state.variant_future = get_background_executor().submit(
+            tracing.wrap(prefetch_variant), st.session_state.user_id
+        )
+
+# The first prompt makes the lease permanent
+def ensure_variant():
+    if "variant" in st.session_state:
+        return
+    future = st.session_state.pop("variant_future", None)
+    if future is not None:
+        try:
+            future.result()
+        except Exception:
+            pass  # confirm() below leases again if needed and reports errors in the UI
+    # Only the schedule assigns variants: a variant picked anywhere else would be missing from the
+    # randomization tables and upset the block balance, so the prompt waits for the allocator
+    for attempt in range(ASSIGNMENT_CONFIRM_ATTEMPTS):
+        try:
+            with tracing.span("assignment.confirm", attempt=attempt):
+                _, variant, newly_confirmed = get_assignment_allocator().confirm(st.session_state.user_id)
+            break
+        except Exception as e:
+            logger.warning("Confirming the variant of %s failed (attempt %d): %s", st.session_state.user_id, attempt + 1, e)
+            if attempt + 1 < ASSIGNMENT_CONFIRM_ATTEMPTS:
+                time.sleep(ASSIGNMENT_RETRY_SECONDS * (attempt + 1))
+    else:
+        st.error("Your message could not be sent because the study could not be started. Please send it again in a moment.")
+        st.stop()
+    st.session_state.variant = variant
+    tracing.set_attributes(variant=st.session_state.variant)
+    if newly_confirmed:
+        get_background_executor().submit(tracing.wrap(export_assignments))
 
 # --- LLM FUNCTIONS ---
-def call_llm(prompt, variant, chat_history_for_llm):
+def llm_messages(prompt, variant, chat_history_for_llm):
     messages = []
 
     # Define the distinct system prompts
@@ -163,12 +362,231 @@ def call_llm(prompt, variant, chat_history_for_llm):
 
     # 3. Finally, append the current user prompt
     messages.append({"role": "user", "content": prompt})
+    return messages
+
+def call_llm(prompt, variant, chat_history_for_llm, model=LLM_MODEL, operation="llm"):
+    messages = llm_messages(prompt, variant, chat_history_for_llm)
+    with profiled(operation), get_study_metrics().timed(operation):
+        response = client.chat.completions.create(
+            model=model,
+            messages=messages
+        )
+    usage = usage_from_response(response, model, LLM_PRICES)
+    return response.choices[0].message.content, usage
+
+# Previous turns of the task as chat messages for call_llm
+def task_history_for_llm(task_index):
+    return [
+        {"role": "user", "content": chat.model_prompt or chat.prompt} if i % 2 == 0 else {"role": "assistant", "content": chat.response}
+        for i, chat in enumerate(st.session_state.chat_history)
+        if chat.task_index == task_index
+    ]
 
-    response = client.chat.completions.create(
-        model="gpt-4.1-nano-2025-04-14", # Using your specified model
-        messages=messages
+def start_speculative_revision(task_index, turn):
+    history = task_history_for_llm(task_index)
+    # Streamed on the LLM client's event loop rather than the background executor, so it does not
+    # hold a worker that prefetches and exports wait for; not timed as the turn's "llm" either
+    future = client.submit_chat_stream({"chunks": 0}, model=LLM_MODEL, messages=llm_messages(SPECULATIVE_PROMPT, turn.variant, history))
+    get_speculation_ledger().started()
+    st.session_state.speculation = Speculation(future, task_index, turn.turn_id)
+
+def discard_speculative_revision():
+    speculation = st.session_state.pop("speculation", None)
+    if speculation is not None:
+        get_speculation_ledger().discard(speculation)
+
+# --- GENERATIONS ---
+def start_generation(prompt, variant, chat_history_for_llm, task_index):
+    progress = {"chunks": 0}
+    future = client.submit_chat_stream(progress, model=LLM_MODEL, messages=llm_messages(prompt, variant, chat_history_for_llm))
+    get_generation_ledger().started()
+    st.session_state.generation = Generation(future, progress, task_index, prompt)
+
+# Waits for the session's generation, logs its turn and returns the Turn. The turn is recorded
+# before the generation leaves the session state and before anything is drawn, so a run that is
+# interrupted at any point leaves either the generation for the next run or the logged turn.
+def finish_generation(status):
+    generation = st.session_state.generation
+    try:
+        with profiled("llm"), get_study_metrics().timed("llm"):
+            response = get_generation_ledger().wait(generation, status)
+    except Exception:
+        st.session_state.pop("generation", None)
+        raise
+    usage = usage_from_response(response, LLM_MODEL, LLM_PRICES)
+    turn = record_turn(generation.task_index, generation.prompt, response.choices[0].message.content, usage)
+    st.session_state.pop("generation", None)
+    status.empty()
+    return turn
+
+# Serves a confirmed speculative revision the same way: its turn is logged before the speculation
+# leaves the session state. If the background call failed, the confirmation is answered by a
+# regular generation.
+def finish_speculation(speculation, status):
+    prepared = get_speculation_ledger().serve(speculation)
+    if prepared is None:
+        task_index = speculation.task_index
+        start_generation(speculation.confirmed_prompt, st.session_state.variant, task_history_for_llm(task_index), task_index)
+        st.session_state.pop("speculation", None)
+        return finish_generation(status)
+    response, usage = prepared
+    turn = record_turn(speculation.task_index, speculation.confirmed_prompt, response, usage, model_prompt=SPECULATIVE_PROMPT)
+    if st.session_state.get("speculation") is speculation:  # record_turn may have started the next one
+        st.session_state.pop("speculation")
+    return turn
+
+# A generation left behind by an interrupted run of this session. A prompt submitted meanwhile
+# was queued behind it: its turn is logged first. "Go to next task" cancels it instead.
+def settle_pending_generation(task_index):
+    speculation = st.session_state.get("speculation")
+    if speculation is not None and speculation.confirmed_prompt is not None:
+        if speculation.task_index != task_index or st.session_state.get(f"next_task_{task_index}"):
+            discard_speculative_revision()
+        else:
+            finish_speculation(speculation, st.empty())
+    generation = st.session_state.get("generation")
+    if generation is None:
+        return
+    if generation.future.cancelled():
+        # Cancelled when the session disconnected; the participant has reconnected since
+        st.session_state.pop("generation")
+        st.info(f"Your message \"{generation.prompt}\" was not answered because the connection was lost. Please send it again.")
+        return
+    if generation.task_index != task_index or st.session_state.get(f"next_task_{task_index}"):
+        st.session_state.pop("generation")
+        get_generation_ledger().cancel(generation, "navigation")
+        return
+    get_generation_ledger().queued()
+    finish_generation(st.empty())
+
+# model_prompt: the user message the model answered, if it was not the participant's prompt
+def record_turn(task_index, prompt, response, usage, model_prompt=None):
+    get_usage_ledger().record(STUDY_NAME, st.session_state.variant, task_index, usage)
+    log_entry = Turn(
+        user_id=st.session_state.user_id,
+        variant=st.session_state.variant,
+        task_index=task_index,
+        prompt=prompt,
+        response=response,
+        usage=usage,
+        box=response_box(response, st.session_state.variant, BOXED_VARIANTS),
+        model_prompt=model_prompt,
     )
-    return response.choices[0].message.content
+    st.session_state.chat_history.append(log_entry)
+    with tracing.span("turn_log.upsert", turn_id=log_entry.turn_id):
+        get_turn_log_store().upsert(log_entry.to_log_row())
+    get_study_metrics().turn(st.session_state.variant)
+    st.session_state.prompt_submitted_for_task[task_index] = True
+    save_session_snapshot()
+    if SPECULATIVE_REVISIONS and st.session_state.variant == "1" and offers_revision(response):
+        start_speculative_revision(task_index, log_entry)
+    return log_entry
+
+# --- SESSION SNAPSHOTS ---
+# With a state backend the participant's progress is saved after every step under a random
+# resume token in the URL (?session=...), so a reload that the load balancer sends to another
+# replica continues the session instead of starting a new one. Turns are restored from the
+# shared turn log.
+def save_session_snapshot():
+    if not get_state_backend():
+        return
+    try:
+        get_state_backend().save_session(STUDY_NAME, st.session_state.resume_token, {
+            "user_id": st.session_state.user_id,
+            "variant": st.session_state.get("variant"),
+            "current_task_index": st.session_state.current_task_index,
+            "prompt_submitted_for_task": {str(i): done for i, done in st.session_state.prompt_submitted_for_task.items()},
+            "show_landing_page": st.session_state.show_landing_page,
+            "distractor_complete": st.session_state.distractor_complete,
+            "show_survey": st.session_state.show_survey,
+            "turn_ids": [turn.turn_id for turn in st.session_state.chat_history],
+            "uploaded_turn_ids": sorted(st.session_state.uploaded_turn_ids),
+        })
+    except Exception:
+        # Logged here and shown once at the top of the next run: record_turn calls this between
+        # logging a turn and releasing its generation, where no element may be drawn
+        logger.exception("Failed to save session snapshot")
+        st.session_state.snapshot_failed = True
+
+def restore_session_snapshot(token):
+    try:
+        snapshot = get_state_backend().load_session(STUDY_NAME, token) if token else None
+    except Exception:
+        logger.exception("Failed to load session snapshot")
+        st.warning("Your earlier progress could not be loaded, so a new session was started.")
+        return False
+    if not snapshot:
+        return False
+    st.session_state.resume_token = token
+    st.session_state.user_id = snapshot["user_id"]
+    if snapshot["variant"] is not None:
+        st.session_state.variant = snapshot["variant"]
+    st.session_state.current_task_index = snapshot["current_task_index"]
+    st.session_state.prompt_submitted_for_task = {int(i): done for i, done in snapshot["prompt_submitted_for_task"].items()}
+    st.session_state.show_landing_page = snapshot["show_landing_page"]
+    st.session_state.distractor_complete = snapshot["distractor_complete"]
+    st.session_state.show_survey = snapshot["show_survey"]
+    st.session_state.uploaded_turn_ids = set(snapshot["uploaded_turn_ids"])
+    st.session_state.chat_history = get_session_memory_manager().new_transcript(st.session_state.user_id)
+    for turn_id in snapshot["turn_ids"]:
+        turn = turn_from_log(turn_id)
+        if turn is not None:
+            st.session_state.chat_history.append(turn)
+    return True
+
+# --- OPERATOR DASHBOARD ---
+# Rendered instead of the study, before any participant state is created
+if dashboard_requested(st.query_params, st.secrets.get("operator_token")):
+    render_operator_dashboard(STUDY_NAME, LLM_VARIANTS, {
+        "metrics": get_study_metrics,
+        "usage_ledger": get_usage_ledger,
+        "session_manager": get_session_memory_manager,
+        "drive_ops": get_drive_ops,
+        "allocator": get_assignment_allocator,
+        "llm_client": lambda: get_openai_client().stats(),
+        "generations": lambda: get_generation_ledger().stats(),
+        "state_backend": lambda: get_state_backend().stats() if get_state_backend() else None,
+        "storage_sync": lambda: spool_status(STORAGE_SPOOL_DIR) if STORAGE_SPOOL_DIR else None,
+        "speculation": lambda: get_speculation_ledger().stats() if SPECULATIVE_REVISIONS else None,
+    })
+    st.stop()
+
+# --- CALIBRATION MODE ---
+# Researchers compare the variants' answers to one prompt side by side; no participant state
+if calibration_requested(st.query_params, st.secrets.get("researcher_token")):
+    render_calibration(STUDY_NAME, LLM_VARIANTS, CALIBRATION_MODELS, call_llm)
+    st.stop()
+
+# --- SETUP SESSION STATE ---
+if "user_id" not in st.session_state:
+    if not (get_state_backend() and restore_session_snapshot(st.query_params.get("session"))):
+        st.session_state.user_id = str(uuid.uuid4())[:8]
+        st.session_state.resume_token = uuid.uuid4().hex
+    if get_state_backend():
+        st.query_params["session"] = st.session_state.resume_token
+    tracing.set_attributes(user_id=st.session_state.user_id, variant=st.session_state.get("variant"))
+    get_background_executor().submit(tracing.wrap(warm_up_clients))
+
+if "current_task_index" not in st.session_state:
+    st.session_state.current_task_index = 0
+
+if "chat_history" not in st.session_state:
+    st.session_state.chat_history = get_session_memory_manager().new_transcript(st.session_state.user_id)
+get_session_memory_manager().touch(st.session_state.chat_history)
+get_study_metrics().session_seen(st.session_state.user_id, st.session_state.get("variant"))
+
+# Turn ids already appended to the Drive archive, so saving again never duplicates a turn
+if "uploaded_turn_ids" not in st.session_state:
+    st.session_state.uploaded_turn_ids = set()
+
+if "show_survey" not in st.session_state:
+    st.session_state.show_survey = False
+
+if "show_landing_page" not in st.session_state:
+    st.session_state.show_landing_page = True
+
+if "distractor_complete" not in st.session_state:
+    st.session_state.distractor_complete = False
 
 # --- Task Definitions ---
 task_descriptions = [
@@ -210,46 +628,40 @@ def distractor_task():
 
     if st.button("Submit quiz responses"):
         st.session_state.distractor_complete = True
+        st.session_state.chat_history.mark_finished()
+        get_study_metrics().task_completed(st.session_state.get("variant"), st.session_state.current_task_index)
+        get_study_metrics().session_finished(st.session_state.user_id)
         st.session_state.prompt_submitted_for_task[st.session_state.current_task_index] = True
 
         try:
-            # Load existing chat logs from Google Drive
-            existing_chat_log_bytes = download_from_gdrive_to_memory(CHAT_LOG_FILE)
-            if existing_chat_log_bytes:
-                existing_chat_df = pd.read_excel(BytesIO(existing_chat_log_bytes))
-            else:
-                existing_chat_df = pd.DataFrame() # Start with an empty DataFrame if file doesn't exist
-
-            # Convert current session's chat history to a DataFrame
-            current_session_chat_df = pd.DataFrame(st.session_state.chat_history)
-
-            # Combine existing and current session chat history
-            # Use pd.concat and drop_duplicates to ensure no re-writing of old data
-            # Define subset for identifying duplicates. 'timestamp', 'user_id', 'task_index', 'prompt'
-            # should uniquely identify a chat turn for a user within a task.
-            combined_chat_df = pd.concat([existing_chat_df, current_session_chat_df], ignore_index=True)
-
-            # Drop duplicates based on a combination of columns. Keep the last one in case of updates.
-            combined_chat_df.drop_duplicates(
-                subset=['user_id', 'task_index', 'prompt', 'response'], # Consider what makes a chat entry unique
-                keep='last', # Keep the most recent entry if duplicates occur
-                inplace=True
-            )
-
-            # Sort by timestamp to maintain order, if desired for readability in Excel
-            combined_chat_df = combined_chat_df.sort_values(by='timestamp').reset_index(drop=True)
-
-            # Save the combined, de-duplicated DataFrame to a local Excel file
-            log_file_path = Path(CHAT_LOG_FILE)
-            with pd.ExcelWriter(log_file_path, engine='openpyxl') as writer:
-                combined_chat_df.to_excel(writer, index=False, header=True)
-
-            # Upload the de-duplicated file to Google Drive
-            upload_to_gdrive(str(log_file_path), CHAT_LOG_FILE)
+            # Only turns that are not in the archive yet, so a repeated save is a no-op
+            session_rows = [
+                turn.to_log_row() for turn in st.session_state.chat_history
+                if turn.turn_id not in st.session_state.uploaded_turn_ids
+            ]
+            if session_rows and get_spool_writer():
+                # The storage sync daemon appends the rows to the archive on Drive
+                get_spool_writer().submit_log_rows(CHAT_LOG_FILE, session_rows)
+                st.session_state.uploaded_turn_ids.update(row["turn_id"] for row in session_rows)
+            elif session_rows:
+                # Load the existing chat log archive from Google Drive (still compressed)
+                existing_archive_bytes = download_from_gdrive_to_memory(CHAT_LOG_FILE)
+
+                # Append the new turns as one zstd frame; old frames are copied as they are
+                with tracing.span("log_archive.append", rows=len(session_rows)):
+                    archive_bytes = append_rows(existing_archive_bytes, session_rows, dictionary=get_log_dictionary())
+
+                log_file_path = Path(CHAT_LOG_FILE)
+                log_file_path.write_bytes(archive_bytes)
+
+                # Upload the archive to Google Drive
+                upload_to_gdrive(str(log_file_path), CHAT_LOG_FILE)
+                st.session_state.uploaded_turn_ids.update(row["turn_id"] for row in session_rows)
 
         except Exception as e:
             st.error(f"Error saving or uploading chat logs: {e}")
 
+        save_session_snapshot()
         st.rerun()
 
     if st.session_state.get("distractor_complete"):
@@ -269,6 +681,9 @@ total_tasks = len(task_descriptions)
 # --- APP UI ---
 st.title("LLM Study Chatbot")
 
+if st.session_state.pop("snapshot_failed", False):
+    st.warning("Your progress could not be saved for resuming. Please keep this tab open until you finish.")
+
 st.markdown("""
 <style>
 /* Target the immediate children of the stButtonContent data-testid and force bold */
@@ -298,6 +713,9 @@ if st.session_state.show_landing_page:
 
     if st.button("Continue"):
         st.session_state.show_landing_page = False
+        # Resolve the variant while the participant reads task 1
+        start_variant_prefetch()
+        save_session_snapshot()
         st.rerun()
 
 else:
@@ -310,36 +728,34 @@ else:
     if task_func:
         task_func()
     else:
-        # Show chat history for this task (NO boxing here)
+        settle_pending_generation(current_task_index)
+
+        # Show chat history for this task, boxed like the fresh responses (offsets stored with the turn)
         current_task_chats = [
             chat for chat in st.session_state.chat_history
-            if chat["task_index"] == current_task_index
+            if chat.task_index == current_task_index
         ]
-        for chat in current_task_chats:
-            with st.chat_message("user"):
-                st.markdown(chat["prompt"])
-            with st.chat_message("assistant"):
-                st.markdown(chat["response"])
+        render_transcript(current_task_chats, TRANSCRIPT_WINDOW_TURNS, BOXED_VARIANTS)
 
         # Prompt input
         prompt = st.chat_input("Your message", key=f"chat_input_{current_task_index}")
         if prompt:
-            # Ensure variant assignment
-            if "variant" not in st.session_state:
-                assignments_df_from_gdrive = load_assignments_data_from_gdrive(ASSIGNMENTS_FILE)
-                user_assignment = assignments_df_from_gdrive[
-                    assignments_df_from_gdrive["user_id"] == st.session_state.user_id
-                ]
-                if not user_assignment.empty:
-                    st.session_state.variant = user_assignment["variant"].iloc[0]
+            # Ensure variant assignment (normally already resolved in the background)
+            ensure_variant()
+
+            # Start the answer before anything is rendered, so a rerun cannot drop the prompt,
+            # unless the prompt confirms a revision that was prepared in the background; that one
+            # stays in the session state, confirmed, until its turn is logged
+            speculation = st.session_state.get("speculation")
+            if speculation is not None:
+                last_turn = st.session_state.chat_history[-1] if len(st.session_state.chat_history) else None
+                if last_turn and speculation.applies_to(current_task_index, last_turn.turn_id) and is_confirmation(prompt):
+                    speculation.confirmed_prompt = prompt
                 else:
-                    variant_counts = assignments_df_from_gdrive["variant"].value_counts().reindex(LLM_VARIANTS, fill_value=0)
-                    min_count = variant_counts.min()
-                    least_assigned_variants = variant_counts[variant_counts == min_count].index.tolist()
-                    st.session_state.variant = random.choice(least_assigned_variants)
-                    new_assignment = pd.DataFrame({"user_id": [st.session_state.user_id], "variant": [st.session_state.variant]})
-                    updated_assignments_df = pd.concat([assignments_df_from_gdrive, new_assignment], ignore_index=True)
-                    save_assignments(updated_assignments_df, ASSIGNMENTS_FILE)
+                    discard_speculative_revision()
+                    speculation = None
+            if speculation is None:
+                start_generation(prompt, st.session_state.variant, task_history_for_llm(current_task_index), current_task_index)
 
             # Show user's prompt
             with st.chat_message("user"):
@@ -348,98 +764,20 @@ else:
             # Start streaming flag
             st.session_state.streaming_in_progress = True
 
-            # Call LLM
+            # Wait for the answer; its turn is logged as soon as it is there
             with st.spinner("Thinking..."):
-                current_task_chats_for_llm = [
-                    {"role": "user", "content": chat["prompt"]} if i % 2 == 0 else {"role": "assistant", "content": chat["response"]}
-                    for i, chat in enumerate(st.session_state.chat_history)
-                    if chat["task_index"] == current_task_index
-                ]
-                response = call_llm(prompt, st.session_state.variant, current_task_chats_for_llm)
+                if speculation is not None:
+                    turn = finish_speculation(speculation, st.empty())
+                else:
+                    turn = finish_generation(st.empty())
 
             # Mark streaming finished
             st.session_state.streaming_in_progress = False
 
-            # Render assistant reply (box only for variant 1 after full completion)
+            # Render assistant reply (box only for boxed variants after full completion, from the
+            # segmentation stored with the turn)
             with st.chat_message("assistant"):
-                if st.session_state.variant == "1":
-                    import re
-                    val_matches = list(re.finditer(r"\b(?:the\s+)?company'?s?\s+values\b", response, re.IGNORECASE))
-                    if val_matches:
-                        val = val_matches[-1]
-                        rec = re.search(r"(?:\*\*\s*)?recommendations?:", response[val.start():], re.IGNORECASE)
-                        if rec:
-                            rec_abs = val.start() + rec.start()
-                            p = val.start()
-                            candidates = [
-                                response.rfind(". ", 0, p) + 2,
-                                response.rfind("! ", 0, p) + 2,
-                                response.rfind("? ", 0, p) + 2,
-                                response.rfind("\n", 0, p) + 1,
-                                0
-                            ]
-                            start = max(c for c in candidates if c >= 0)
-
-                            # --- Corrected end-of-box calculation ---
-                            tail = response[rec_abs:]
-                            pos = 0
-                            end_in_tail = None
-                            while True:
-                                m = re.search(r"\r?\n\s*\r?\n(?=\s*\S)", tail[pos:], flags=re.MULTILINE)
-                                if not m:
-                                    break
-                                next_para_start = pos + m.end()
-                                next_line_end = tail.find("\n", next_para_start)
-                                if next_line_end == -1:
-                                    next_line_end = len(tail)
-                                next_line = tail[next_para_start:next_line_end]
-                                if re.match(r"\s*(?:[-*•–]|(?:\d+[.)]))\s+", next_line) or (next_line.strip()[:1].isalpha()):
-                                    pos = next_para_start
-                                    continue
-                                else:
-                                    end_in_tail = pos + m.start()
-                                    break
-                            end = rec_abs + (end_in_tail if end_in_tail is not None else len(tail))
-                            if end < rec_abs:  # defensive fallback
-                                end = len(response)
-                            # --- End fix ---
-
-                            before = response[:start].rstrip()
-                            boxed = response[start:end].strip()
-                            after = response[end:].lstrip()
-
-                            if before:
-                                st.markdown(before)
-                            st.markdown(
-                                f"""
-<div style="border: 2px solid #2ecc71; border-radius: 8px; padding: 10px; background-color: #f9fffa;">
-
-{boxed}
-
-</div>
-""",
-                                unsafe_allow_html=True
-                            )
-                            if after:
-                                st.markdown(after)
-                        else:
-                            st.markdown(response)
-                    else:
-                        st.markdown(response)
-                else:
-                    st.markdown(response)
-
-            # Log new turn
-            log_entry = {
-                "timestamp": datetime.now().isoformat(),
-                "user_id": st.session_state.user_id,
-                "variant": st.session_state.variant,
-                "task_index": st.session_state.current_task_index,
-                "prompt": prompt,
-                "response": response,
-            }
-            st.session_state.chat_history.append(log_entry)
-            st.session_state.prompt_submitted_for_task[current_task_index] = True
+                render_response(turn.response, turn.box)
 
     # Navigation buttons
     disable_next_button = True
@@ -449,12 +787,16 @@ else:
         disable_next_button = not st.session_state.prompt_submitted_for_task.get(current_task_index, False)
 
     if current_task_index < total_tasks - 1:
-        if st.button("Go to next task", disabled=disable_next_button):
+        if st.button("Go to next task", disabled=disable_next_button, key=f"next_task_{current_task_index}"):
+            get_study_metrics().task_completed(st.session_state.get("variant"), current_task_index)
+            discard_speculative_revision()
             st.session_state.current_task_index += 1
+            save_session_snapshot()
             st.rerun()
     else:
         if st.button("Take Survey", disabled=disable_next_button):
             st.session_state.show_survey = True
+            save_session_snapshot()
         if st.session_state.show_survey:
             survey_url = f"{SURVEY_BASE_URL}?App_Variant={st.session_state.variant}&User_ID={st.session_state.user_id}"
             st.markdown(f"[Go to Survey]({survey_url})", unsafe_allow_html=True)
@@ -0,0 +1,116 @@
+# --- Abandoned generations: what a second submit, "Go to next task" and a disconnect cost ---
+# Starts the app with `streamlit run` against openai_standin.py (streamed answers, one chunk per
+# word) and drives --sessions browser sessions per scenario over Streamlit's websocket protocol:
+#
+#   complete       one prompt, answered in full (reference)
+#   double_submit  a second prompt --after-ms into the first answer
+#   next_task      one answered prompt, then a second one and "Go to next task" --after-ms into it
+#   disconnect     one prompt, then the browser goes away --after-ms into the answer
+#
+# For every scenario it reports the answers started and cut short on the stand-in, the chunks
+# (≈ completion tokens) and generation seconds that cut-short answers did not spend, and the
+# turns that reached the app's turn log. Before generations could be cancelled every answer ran
+# to its end, and a second submit lost the first prompt's turn.
+#
+#   python benchmarks/bench_abandoned_generations.py [--sessions 10] [--latency-ms 3000] [--after-ms 800]
+
+import argparse
+import asyncio
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from bench_llm_client import standin_stats, start_standin
+from replay_sessions import BrowserSession, start_app
+from turn_log import TurnLogStore
+
+DEFAULT_APP = ROOT / "Feedback_Vb_Writing.py"
+SCENARIOS = ["complete", "double_submit", "next_task", "disconnect"]
+PROMPT = "Please write a short invitation mail for the summer party of our department, including partners and spouses, friendly tone."
+SECOND_PROMPT = PROMPT.replace("write", "rewrite", 1)
+# Words of the stand-in's answer to either prompt, "Stand-in answer to: <prompt>"
+ANSWER_WORDS = 3 + len(PROMPT[:200].split(" "))
+
+
+async def session(url, scenario, after_s, timeout_s):
+    browser = BrowserSession(url, timeout_s)
+    await browser.open()
+    try:
+        await browser.rerun()
+        await browser.click("Continue")
+        if scenario == "complete":
+            await browser.chat("chat_input_0", PROMPT)
+        elif scenario == "double_submit":
+            await browser.send([browser.chat_state("chat_input_0", PROMPT)])
+            await asyncio.sleep(after_s)
+            await browser.chat("chat_input_0", SECOND_PROMPT)
+        elif scenario == "next_task":
+            await browser.chat("chat_input_0", PROMPT)
+            await browser.send([browser.chat_state("chat_input_0", SECOND_PROMPT)])
+            await asyncio.sleep(after_s)
+            await browser.click("Go to next task")
+        elif scenario == "disconnect":
+            await browser.send([browser.chat_state("chat_input_0", PROMPT)])
+            await asyncio.sleep(after_s)
+    finally:
+        await browser.close()
+
+
+async def drive(url, scenario, n_sessions, after_s, timeout_s):
+    results = await asyncio.gather(*(session(url, scenario, after_s, timeout_s) for _ in range(n_sessions)), return_exceptions=True)
+    return [f"{type(e).__name__}: {e}" for e in results if isinstance(e, BaseException)]
+
+
+def run(app, scenario, n_sessions, latency_ms, after_ms, timeout_s):
+    workdir = tempfile.mkdtemp(prefix="llm_study_abandon_")
+    standin, llm_base_url = start_standin(latency_ms, 0)
+    process = None
+    try:
+        process, url = start_app(app, workdir, llm_base_url, 20)
+        errors = asyncio.run(drive(url.replace("http", "ws", 1), scenario, n_sessions, after_ms / 1000, timeout_s))
+        # Cancellation reaches the stand-in when the session's script notices the disconnect
+        time.sleep(2 + latency_ms / 1000)
+        stats = standin_stats(llm_base_url)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+        standin.terminate()
+        standin.wait()
+    turns = len(TurnLogStore(Path(workdir) / "turns"))
+    unspent = stats["streams"] * ANSWER_WORDS - stats["streamed_chunks"]
+    return {
+        "answers": stats["streams"],
+        "cut_short": stats["streams_cancelled"],
+        "unspent_chunks": unspent,
+        "unspent_s": unspent * latency_ms / 1000 / ANSWER_WORDS,
+        "turns": turns,
+        "errors": errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--app", default=str(DEFAULT_APP))
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument("--latency-ms", type=float, default=3000.0, help="stand-in time for a full answer")
+    parser.add_argument("--after-ms", type=float, default=800.0, help="when the participant abandons the answer")
+    parser.add_argument("--timeout-s", type=float, default=60.0)
+    args = parser.parse_args()
+
+    print(f"{Path(args.app).name}, {args.sessions} sessions per scenario, answers of {ANSWER_WORDS} chunks in {args.latency_ms:g} ms, abandoned after {args.after_ms:g} ms")
+    print(f"{'scenario':<14} {'answers':>8} {'cut short':>10} {'unspent chunks':>15} {'unspent s':>10} {'turns':>6}")
+    for scenario in args.scenarios:
+        result = run(args.app, scenario, args.sessions, args.latency_ms, args.after_ms, args.timeout_s)
+        print(f"{scenario:<14} {result['answers']:>8} {result['cut_short']:>10} {result['unspent_chunks']:>15} {result['unspent_s']:>10.1f} {result['turns']:>6}")
+        for error in sorted(set(result["errors"]))[:3]:
+            print(f"{'':>16}error: {error}")
+
+
+if __name__ == "__main__":
+    main()
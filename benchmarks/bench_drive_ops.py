@@ -0,0 +1,77 @@
+# --- Drive round-trips per save: sequential list+update vs. gdrive_ops.DriveOps ---
+# Runs against drive_standin.DriveStandIn with a fixed per-request latency. "legacy" is the
+# upload path the apps used before DriveOps: files().list by name, then a resumable update or
+# create, one file after the other. Also checks that every save round-trips the right bytes.
+#
+#   python benchmarks/bench_drive_ops.py [--latency-ms 80] [--saves 20]
+
+import argparse
+import sys
+import time
+from io import BytesIO
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from googleapiclient.http import MediaIoBaseUpload
+
+from drive_standin import DriveStandIn
+from gdrive_ops import DriveOps, guess_mimetype
+
+FOLDER_ID = "study-folder"
+FILES = ["Variant_Assignment_Va_Knowledge.csv", "Chat_Logs_Va_Knowledge.jsonl.zst"]
+
+
+def legacy_upload(service, file_name, content):
+    items = service.files().list(
+        q=f"name='{file_name}' and '{FOLDER_ID}' in parents", fields="files(id)", supportsAllDrives=True
+    ).execute().get("files", [])
+    media = MediaIoBaseUpload(BytesIO(content), mimetype=guess_mimetype(file_name), resumable=True)
+    if items:
+        request = service.files().update(fileId=items[0]["id"], media_body=media, supportsAllDrives=True)
+    else:
+        body = {"name": file_name, "parents": [FOLDER_ID], "mimeType": guess_mimetype(file_name)}
+        request = service.files().create(body=body, media_body=media, fields="id", supportsAllDrives=True)
+    response = None
+    while response is None:
+        _, response = request.next_chunk()
+
+
+def run(mode, latency_s, n_saves):
+    drive = DriveStandIn(latency_s=latency_s)
+    ops = DriveOps(drive.build_service, FOLDER_ID)
+    walls = []
+    trips = []
+    for i in range(n_saves):
+        payload = {name: f"{name} save {i}".encode() * 100 for name in FILES}
+        before = drive.round_trips
+        started = time.perf_counter()
+        if mode == "legacy":
+            for name, content in payload.items():
+                legacy_upload(drive.build_service(), name, content)
+        else:
+            ops.save_many(payload)
+        walls.append(time.perf_counter() - started)
+        trips.append(drive.round_trips - before)
+        for name, content in payload.items():
+            assert drive.content_by_name(name) == content, f"{mode}: wrong content for {name}"
+    return trips, walls
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency-ms", type=float, default=80.0)
+    parser.add_argument("--saves", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{len(FILES)} files per save, {args.latency_ms:.0f} ms per round-trip, {args.saves} saves")
+    print(f"{'mode':<10} {'trips first':>12} {'trips after':>12} {'ms first':>9} {'ms after':>9}")
+    for mode in ("legacy", "driveops"):
+        trips, walls = run(mode, args.latency_ms / 1000, args.saves)
+        steady_trips = sum(trips[1:]) / max(len(trips) - 1, 1)
+        steady_ms = sum(walls[1:]) / max(len(walls) - 1, 1) * 1000
+        print(f"{mode:<10} {trips[0]:>12} {steady_trips:>12.1f} {walls[0] * 1000:>9.0f} {steady_ms:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+# --- Micro-benchmarks of the apps' hot paths at study scale ---
+# Every case runs at 10, 10k and 500k log rows of synthetic text (synthetic_transcripts.py) and
+# reports the median of a few repeats, each case and size in a fresh interpreter so one case's
+# memory does not crowd the next. Cases marked "legacy" are the code the apps ran before the
+# current path replaced it, kept so the gap stays visible. Results are compared with
+# baselines.json next to this file; timings are scaled by a calibration loop measured on both
+# machines, and the run exits with status 1 if a case is slower than its baseline by more than
+# --threshold. Excel cases are capped at EXCEL_MAX_ROWS unless --no-cap is given (openpyxl needs
+# minutes for 500k rows).
+#
+#   python benchmarks/bench_hot_paths.py [--sizes 10,10000,500000] [--cases box,merge_append]
+#   python benchmarks/bench_hot_paths.py --update-baseline
+
+import argparse
+import json
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from io import BytesIO
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import pandas as pd
+
+from synthetic_transcripts import VARIANTS, iter_sessions
+from log_archive import append_rows, compress_rows, merge_log_rows, rows_to_excel_bytes
+from randomization import PermutedBlockAllocator
+from response_boxing import box_segments
+from session_spill import SessionMemoryManager
+from turn_records import Turn
+
+BASELINE_FILE = Path(__file__).resolve().parent / "baselines.json"
+DEFAULT_SIZES = [10, 10_000, 500_000]
+DEFAULT_THRESHOLD = 0.25
+EXCEL_MAX_ROWS = 50_000
+# Distinct prompt/response texts, reused round-robin by the rows (500k distinct responses would
+# not fit next to the DataFrame copies on a small machine)
+TEXT_POOL_SIZE = 4000
+# A session of the distractor save: about two turns per chat task
+SESSION_TURNS = 10
+MIN_REPEAT_SECONDS = 0.5
+MAX_REPEATS = 7
+# Stop repeating once a case has run this long (the 500k box case takes ~30 s per run)
+MAX_CASE_SECONDS = 20
+
+
+# --- Synthetic data ---
+def text_pool(seed=0):
+    pool = []
+    for user_id, variant, turns in iter_sessions(TEXT_POOL_SIZE, seed=seed, turns_per_task=(1, 1)):
+        pool.extend((variant, task_index, prompt, response) for task_index, _, prompt, response in turns)
+        if len(pool) >= TEXT_POOL_SIZE:
+            return pool[:TEXT_POOL_SIZE]
+    return pool
+
+
+# n log rows in SESSION_TURNS-turn sessions; rows are unique by turn id and user id
+def make_rows(n, pool, start_ts=1_700_000_000.0):
+    rows = []
+    for i in range(n):
+        variant, task_index, prompt, response = pool[i % len(pool)]
+        session = i // SESSION_TURNS
+        rows.append({
+            "turn_id": f"{session:08x}-{i:016x}",
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(start_ts + i * 7)) + f".{i % 1000000:06d}",
+            "user_id": f"{session:08x}",
+            "variant": VARIANTS[session % len(VARIANTS)],
+            "task_index": task_index,
+            "prompt": prompt,
+            "response": response,
+            "prompt_tokens": 20 + i % 50, "completion_tokens": 300 + i % 200, "cached_tokens": 0, "cost_usd": 0.0001,
+        })
+    return rows
+
+
+# --- Cases: setup(n, pool) returns the function to time ---
+def setup_history(n, pool):
+    manager = SessionMemoryManager(ceiling_bytes=2**62)
+    transcript = manager.new_transcript("bench")
+    for row in make_rows(n, pool):
+        transcript.append(Turn(row["user_id"], row["variant"], row["task_index"], row["prompt"], row["response"]))
+    current_task_index = 0
+
+    # The two comprehensions of the chat page: rendered history and the messages sent to the LLM
+    def run():
+        current_task_chats = [chat for chat in transcript if chat.task_index == current_task_index]
+        for chat in current_task_chats:
+            chat.prompt, chat.response
+        [
+            {"role": "user", "content": chat.prompt} if i % 2 == 0 else {"role": "assistant", "content": chat.response}
+            for i, chat in enumerate(transcript)
+            if chat.task_index == current_task_index
+        ]
+    return run
+
+
+def setup_box(n, pool):
+    responses = [row["response"] for row in make_rows(n, pool)]
+
+    def run():
+        for response in responses:
+            box_segments(response)
+    return run
+
+
+def _legacy_log_df(n, pool):
+    df = pd.DataFrame(make_rows(n, pool))
+    return df.drop(columns=["turn_id", "prompt_tokens", "completion_tokens", "cached_tokens", "cost_usd"])
+
+
+# The distractor save before turn ids: concat, drop_duplicates on the texts, sort by timestamp
+def setup_merge_legacy(n, pool):
+    existing = _legacy_log_df(n, pool)
+    session = existing.tail(SESSION_TURNS).copy()
+
+    def run():
+        combined = pd.concat([existing, session], ignore_index=True)
+        combined.drop_duplicates(subset=["user_id", "task_index", "prompt", "response"], keep="last", inplace=True)
+        combined.sort_values(by="timestamp").reset_index(drop=True)
+    return run
+
+
+# The current distractor save: one new zstd frame appended to the archive bytes
+def setup_merge_append(n, pool):
+    rows = make_rows(n + SESSION_TURNS, pool)
+    chunk = 1000 * SESSION_TURNS
+    archive = b"".join(compress_rows(rows[i:min(i + chunk, n)], level=3) for i in range(0, n, chunk))
+    session = rows[n:]
+    del rows
+
+    def run():
+        append_rows(archive, session)
+    return run
+
+
+# Offline analysis view: latest version per turn id, sorted by timestamp
+def setup_merge_rows(n, pool):
+    rows = make_rows(n, pool)
+
+    def run():
+        merge_log_rows(rows)
+    return run
+
+
+# choose_variant before the permuted-block schedule: value_counts over all assignments
+def setup_assign_legacy(n, pool):
+    df = pd.DataFrame({"user_id": [f"{i:08x}" for i in range(n)], "variant": [VARIANTS[i % 3] for i in range(n)]})
+    rng = random.Random(0)
+
+    def run():
+        user_id = f"new-{rng.getrandbits(32):08x}"
+        user_assignment = df[df["user_id"] == user_id]
+        if not user_assignment.empty:
+            return
+        counts = df["variant"].value_counts().reindex(VARIANTS, fill_value=0)
+        least = counts[counts == counts.min()].index.tolist()
+        new = pd.DataFrame({"user_id": [user_id], "variant": [rng.choice(least)]})
+        pd.concat([df, new], ignore_index=True)
+    return run
+
+
+def setup_assign_lease(n, pool):
+    directory = tempfile.mkdtemp(prefix="bench-assign-")
+    allocator = PermutedBlockAllocator(Path(directory) / "assignments.sqlite3", "bench", VARIANTS, seed="bench", block_size=6)
+    slots = [(f"{i:08x}", i) for i in range(n)]
+    allocator.restore([
+        {"user_id": user_id, "variant": allocator._variant(allocator._db, slot), "slot": slot, "assigned_at": "2025-01-01T00:00:00"}
+        for user_id, slot in slots
+    ])
+    rng = random.Random(0)
+
+    def run():
+        allocator.lease(f"new-{rng.getrandbits(32):08x}")
+    return run
+
+
+def setup_excel_write(n, pool):
+    rows = make_rows(n, pool)
+
+    def run():
+        rows_to_excel_bytes(rows)
+    return run
+
+
+def setup_excel_read(n, pool):
+    data = rows_to_excel_bytes(make_rows(n, pool))
+
+    def run():
+        pd.read_excel(BytesIO(data))
+    return run
+
+
+CASES = {
+    "history": (setup_history, None),
+    "box": (setup_box, None),
+    "merge_legacy": (setup_merge_legacy, None),
+    "merge_append": (setup_merge_append, None),
+    "merge_rows": (setup_merge_rows, None),
+    "assign_legacy": (setup_assign_legacy, None),
+    "assign_lease": (setup_assign_lease, None),
+    "excel_write": (setup_excel_write, EXCEL_MAX_ROWS),
+    "excel_read": (setup_excel_read, EXCEL_MAX_ROWS),
+}
+
+
+# --- Timing ---
+def time_case(run):
+    times = []
+    while len(times) < MAX_REPEATS and (sum(times) < MIN_REPEAT_SECONDS or len(times) < 3) and sum(times) < MAX_CASE_SECONDS:
+        started = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - started)
+    return statistics.median(times)
+
+
+# Fixed mixed workload (interpreter loop, regex, small pandas ops); baselines are scaled by the
+# ratio of its time on this machine to its time on the machine that wrote them
+def calibrate():
+    df = pd.DataFrame({"a": list(range(20_000)), "b": [str(i % 97) for i in range(20_000)]})
+    text = " ".join(f"word{i} Company values" for i in range(2000))
+
+    def run():
+        total = 0
+        for i in range(200_000):
+            total += i * i % 7
+        box_segments(text + "\n\n**Recommendations:**\n- one\n\nDone.")
+        df.groupby("b")["a"].sum()
+        df.sort_values("b")
+    return min(time_case(run) for _ in range(5))
+
+
+def run_one(key):
+    name, n = key.split("@")
+    run = CASES[name][0](int(n), text_pool())
+    print(json.dumps({"median_s": time_case(run)}))
+
+
+def measure(key):
+    out = subprocess.run([sys.executable, __file__, "--one", key], check=True, capture_output=True, text=True).stdout
+    return json.loads(out)["median_s"]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default=",".join(str(n) for n in DEFAULT_SIZES))
+    parser.add_argument("--cases", default=",".join(CASES))
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--no-cap", action="store_true", help="run the Excel cases at every size")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--baseline", default=str(BASELINE_FILE))
+    parser.add_argument("--one", help=argparse.SUPPRESS)  # case@rows, run in the child interpreter
+    args = parser.parse_args()
+    if args.one:
+        run_one(args.one)
+        return
+
+    sizes = [int(n) for n in args.sizes.split(",")]
+    baseline_path = Path(args.baseline)
+    baseline = json.loads(baseline_path.read_text()) if baseline_path.exists() else {"calibration_s": None, "results": {}}
+    calibration = calibrate()
+    scale = calibration / baseline["calibration_s"] if baseline["calibration_s"] else 1.0
+    print(f"calibration {calibration * 1000:.1f} ms, baseline scale {scale:.2f}, threshold +{args.threshold:.0%}")
+
+    results = {}
+    regressions = []
+    print(f"{'case':<14} {'rows':>8} {'median':>12} {'baseline':>12} {'ratio':>7}")
+    for name in args.cases.split(","):
+        max_rows = CASES[name][1]
+        for n in sizes:
+            if max_rows and n > max_rows and not args.no_cap:
+                print(f"{name:<14} {n:>8} {'skipped (cap)':>12}")
+                continue
+            key = f"{name}@{n}"
+            median = measure(key)
+            results[key] = median
+            reference = baseline["results"].get(key)
+            if reference:
+                ratio = median / (reference * scale)
+                if ratio > 1 + args.threshold:
+                    # Confirm with a second run before calling it a regression; a busy machine
+                    # slows single runs down by more than the threshold
+                    median = min(median, measure(key))
+                    results[key] = median
+                    ratio = median / (reference * scale)
+                flag = "  REGRESSION" if ratio > 1 + args.threshold else ""
+                if flag:
+                    regressions.append(key)
+                print(f"{name:<14} {n:>8} {_fmt(median):>12} {_fmt(reference * scale):>12} {ratio:>7.2f}{flag}")
+            else:
+                print(f"{name:<14} {n:>8} {_fmt(median):>12} {'-':>12} {'-':>7}")
+
+    if args.update_baseline:
+        baseline = {"calibration_s": calibration, "results": {**baseline["results"], **results}}
+        if scale != 1.0:  # keep all entries on the scale of the new calibration
+            baseline["results"] = {key: results.get(key, value * scale) for key, value in baseline["results"].items()}
+        baseline_path.write_text(json.dumps(baseline, indent=2, sort_keys=True) + "\n")
+        print(f"wrote {len(results)} results to {baseline_path}")
+    elif regressions:
+        print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+        sys.exit(1)
+
+
+def _fmt(seconds):
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:.1f} us"
+    if seconds < 1:
+        return f"{seconds * 1e3:.2f} ms"
+    return f"{seconds:.2f} s"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+# --- LLM connection reuse: per-thread blocking openai.OpenAI vs. llm_client.BackgroundLLMClient ---
+# Runs N concurrent simulated sessions against openai_standin.py (started as a subprocess, so
+# it does not compete with the clients for the GIL). Each session makes --turns calls with a
+# think time in between, like a participant reading an answer and typing the next prompt. The
+# stand-in charges --connect-ms on the first request of every new connection, standing in for
+# the TCP and TLS handshakes; connections opened times that delay is the setup overhead the
+# participants waited for. "sync" is the client the apps used before: one openai.OpenAI with the
+# library's default pool (keep-alive connections expire after 5 s idle). "async" is the shared
+# BackgroundLLMClient with the apps' defaults.
+#
+#   python benchmarks/bench_llm_client.py [--sessions 50 100 200] [--turns 3] [--think-s 8]
+
+import argparse
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+import openai
+
+from llm_client import BackgroundLLMClient
+
+MESSAGES = [{"role": "system", "content": "You are an AI assistant representing a company."}]
+
+
+def start_standin(latency_ms, connect_ms):
+    process = subprocess.Popen(
+        [sys.executable, str(ROOT / "openai_standin.py"), "--port", "0", "--latency-ms", str(latency_ms), "--connect-ms", str(connect_ms)],
+        stdout=subprocess.PIPE, text=True,
+    )
+    base_url = process.stdout.readline().strip().rsplit(" ", 1)[1]
+    return process, base_url
+
+
+def standin_stats(base_url):
+    with openai.OpenAI(api_key="bench", base_url=base_url.rsplit("/v1", 1)[0]) as client:
+        return client.get("/_standin/stats", cast_to=object)
+
+
+def make_client(mode, base_url):
+    if mode == "sync":
+        return openai.OpenAI(api_key="bench", base_url=base_url)
+    return BackgroundLLMClient(api_key="bench", base_url=base_url)
+
+
+def run(mode, n_sessions, turns, think_s, latency_ms, connect_ms, seed):
+    process, base_url = start_standin(latency_ms, connect_ms)
+    try:
+        client = make_client(mode, base_url)
+        latencies = []
+        errors = []
+        lock = threading.Lock()
+        rng = random.Random(seed)
+        # Sessions arrive spread over one think time, then alternate between calling and reading
+        plans = [(rng.uniform(0, think_s), [rng.uniform(0.5 * think_s, 1.5 * think_s) for _ in range(turns - 1)]) for _ in range(n_sessions)]
+
+        def session(index, start_delay, pauses):
+            time.sleep(start_delay)
+            for turn in range(turns):
+                started = time.perf_counter()
+                try:
+                    client.chat.completions.create(
+                        model="gpt-4.1-nano-2025-04-14",
+                        messages=[*MESSAGES, {"role": "user", "content": f"session {index} turn {turn}"}],
+                    )
+                    with lock:
+                        latencies.append(time.perf_counter() - started)
+                except Exception as e:
+                    with lock:
+                        errors.append(f"{type(e).__name__}: {e}")
+                if turn < turns - 1:
+                    time.sleep(pauses[turn])
+
+        threads = [threading.Thread(target=session, args=(i, *plan)) for i, plan in enumerate(plans)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - started
+        stats = standin_stats(base_url)
+        client.close()
+    finally:
+        process.terminate()
+        process.wait()
+    latencies.sort()
+    return {
+        "connections": stats["connections"],
+        "peak_open": stats["peak_open_connections"],
+        "setup_s": stats["connections"] * connect_ms / 1000,
+        "p50_ms": 1000 * statistics.median(latencies),
+        "p95_ms": 1000 * latencies[int(0.95 * (len(latencies) - 1))],
+        "overhead_ms": 1000 * statistics.fmean(latencies) - latency_ms,
+        "errors": errors,
+        "wall_s": wall,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, nargs="+", default=[50, 100, 200])
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--think-s", type=float, default=8.0, help="mean pause between a session's calls")
+    parser.add_argument("--latency-ms", type=float, default=300.0)
+    parser.add_argument("--connect-ms", type=float, default=60.0, help="stand-in cost of opening a connection")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{args.turns} turns per session, think time ~{args.think_s:g} s, call latency {args.latency_ms:g} ms, connection setup {args.connect_ms:g} ms")
+    print(f"{'sessions':>8} {'mode':>6} {'conns':>6} {'peak':>5} {'setup s':>8} {'p50 ms':>7} {'p95 ms':>7} {'overhead ms':>11} {'wall s':>7}")
+    for n_sessions in args.sessions:
+        for mode in ("sync", "async"):
+            result = run(mode, n_sessions, args.turns, args.think_s, args.latency_ms, args.connect_ms, args.seed)
+            print(
+                f"{n_sessions:>8} {mode:>6} {result['connections']:>6} {result['peak_open']:>5} {result['setup_s']:>8.1f} "
+                f"{result['p50_ms']:>7.0f} {result['p95_ms']:>7.0f} {result['overhead_ms']:>11.0f} {result['wall_s']:>7.1f}"
+            )
+            for error in sorted(set(result["errors"]))[:3]:
+                print(f"{'':>16}error: {error}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+# --- Scaling with replicas: throughput at 1, 2, 4 and 8 replicas on one shared state backend ---
+# Starts N replicas (replicas.py) of an app against openai_standin.py and the in-process Drive
+# stand-in, all sharing one state backend: an SQLite file (--backend sqlite) or kv_standin.py
+# (--backend kv). --clients closed-loop participants, pinned round-robin to the replicas as a
+# sticky load balancer would, each repeat for --duration-s: open a session, "Continue", send
+# --prompts prompts back to back, close. Reports completed prompts per second and prompt
+# latency, then checks on the backend that every session got its own slot and that every turn
+# reached the shared turn log.
+#
+# Replicas only scale where there are cores for them: on a machine with fewer cores than
+# replicas the Python work of the replicas shares the same cores and throughput stays flat.
+#
+#   python benchmarks/bench_replicas.py [--replicas 1 2 4 8] [--backend kv] [--clients 32]
+
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from bench_llm_client import start_standin
+from replay_sessions import SECRETS_TOML, BrowserSession, free_port, percentile
+from replicas import start_replicas, stop_replicas
+from state_backend import open_state_backend
+
+DEFAULT_APP = ROOT / "Feedback_Va_Knowledge.py"
+STUDY_NAMES = {"Feedback_Va_Knowledge.py": "Va_Knowledge", "Feedback_Vb_Writing.py": "Vb_Writing"}
+
+
+def start_backend(kind, workdir):
+    if kind == "sqlite":
+        return None, f"sqlite:///{workdir}/state.sqlite3"
+    port = free_port()
+    process = subprocess.Popen([sys.executable, str(ROOT / "kv_standin.py"), "--port", str(port)], stdout=subprocess.PIPE, text=True)
+    url = process.stdout.readline().strip().rsplit(" ", 1)[1]
+    return process, f"kv+{url}"
+
+
+async def client(url, prompts, deadline, timeout_s, latencies, counters):
+    loop = asyncio.get_running_loop()
+    while loop.time() < deadline:
+        session = BrowserSession(url, timeout_s)
+        await session.open()
+        try:
+            await session.rerun()
+            await session.click("Continue")
+            counters["sessions"] += 1
+            for turn in range(prompts):
+                started = loop.time()
+                await session.chat("chat_input_0", f"Please draft the invitation mail, version {turn}.")
+                latencies.append(loop.time() - started)
+        finally:
+            await session.close()
+
+
+async def drive(urls, n_clients, prompts, duration_s, timeout_s):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + duration_s
+    latencies = []
+    counters = {"sessions": 0}
+    started = loop.time()
+    results = await asyncio.gather(*(
+        client(urls[index % len(urls)], prompts, deadline, timeout_s, latencies, counters) for index in range(n_clients)
+    ), return_exceptions=True)
+    errors = [f"{type(e).__name__}: {e}" for e in results if isinstance(e, BaseException)]
+    return latencies, counters["sessions"], loop.time() - started, errors
+
+
+def run(app, n_replicas, backend_kind, n_clients, prompts, duration_s, llm_latency_ms, timeout_s):
+    workdir = tempfile.mkdtemp(prefix="llm_study_replicas_")
+    secrets = Path(workdir) / "secrets.toml"
+    secrets.write_text(SECRETS_TOML)
+    standin, llm_base_url = start_standin(llm_latency_ms, 0)
+    backend_process, state_backend = start_backend(backend_kind, workdir)
+    replicas = []
+    try:
+        replicas = start_replicas(
+            app, n_replicas, free_port(), state_backend, workdir,
+            extra_env={"OPENAI_BASE_URL": llm_base_url, "DRIVE_STANDIN_LATENCY_MS": "20"},
+            cwd=workdir, secrets_file=secrets,
+        )
+        urls = [url.replace("http", "ws", 1) for _, url in replicas]
+        latencies, sessions, wall, errors = asyncio.run(drive(urls, n_clients, prompts, duration_s, timeout_s))
+        backend = open_state_backend(state_backend)
+        study = STUDY_NAMES.get(Path(app).name, Path(app).stem)
+        confirmed = sum(arm["confirmed"] for arm in backend.allocator(study, ["1", "2", "3"], study, block_size=6).counts().values())
+        logged = len(backend.turn_log(study))
+    finally:
+        stop_replicas(replicas)
+        for process in (backend_process, standin):
+            if process is not None:
+                process.terminate()
+                process.wait()
+    return {
+        "prompts_per_s": len(latencies) / wall,
+        "p50_ms": 1000 * statistics.median(latencies) if latencies else float("nan"),
+        "p95_ms": 1000 * percentile(latencies, 0.95) if latencies else float("nan"),
+        "prompts": len(latencies),
+        "sessions": sessions,
+        "confirmed": confirmed,
+        "logged": logged,
+        "errors": errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--app", default=str(DEFAULT_APP))
+    parser.add_argument("--replicas", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--backend", choices=["sqlite", "kv"], default="kv")
+    parser.add_argument("--clients", type=int, default=32, help="concurrent closed-loop participants")
+    parser.add_argument("--prompts", type=int, default=3, help="prompts per session")
+    parser.add_argument("--duration-s", type=float, default=30.0)
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0)
+    parser.add_argument("--timeout-s", type=float, default=120.0)
+    args = parser.parse_args()
+
+    print(f"{Path(args.app).name}, {args.backend} backend, {args.clients} clients, {args.prompts} prompts per session, "
+          f"LLM stand-in {args.llm_latency_ms:g} ms, {os.cpu_count()} CPUs")
+    print(f"{'replicas':>8} {'prompts/s':>10} {'p50 ms':>7} {'p95 ms':>7} {'prompts':>8} {'sessions':>8} {'slots':>6} {'logged':>7}")
+    for n_replicas in args.replicas:
+        result = run(args.app, n_replicas, args.backend, args.clients, args.prompts, args.duration_s, args.llm_latency_ms, args.timeout_s)
+        print(
+            f"{n_replicas:>8} {result['prompts_per_s']:>10.1f} {result['p50_ms']:>7.0f} {result['p95_ms']:>7.0f} "
+            f"{result['prompts']:>8} {result['sessions']:>8} {result['confirmed']:>6} {result['logged']:>7}"
+        )
+        for error in sorted(set(result["errors"]))[:3]:
+            print(f"{'':>10}error: {error}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+# --- Memory footprint of chat_history per 1,000 sessions ---
+# Builds the chat_history of N simulated sessions once with the old dict entries ("dict") and
+# once with turn_records.Turn ("turn"), each in a fresh interpreter so the RSS numbers are not
+# polluted by the other run.
+#
+#   python benchmarks/bench_session_memory.py [--sessions 1000] [--seed 0]
+
+import argparse
+import gc
+import json
+import os
+import subprocess
+import sys
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from synthetic_transcripts import iter_sessions
+from turn_records import Turn
+
+
+def rss_bytes():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def build_dict_history(user_id, variant, turns):
+    return [
+        {
+            "timestamp": datetime.fromtimestamp(ts).isoformat(),
+            "user_id": user_id,
+            "variant": variant,
+            "task_index": task_index,
+            "prompt": prompt,
+            "response": response,
+        }
+        for task_index, ts, prompt, response in turns
+    ]
+
+
+def build_turn_history(user_id, variant, turns):
+    return [Turn(user_id, variant, task_index, prompt, response, ts=ts) for task_index, ts, prompt, response in turns]
+
+
+def measure(mode, n_sessions, seed):
+    build = build_dict_history if mode == "dict" else build_turn_history
+    gc.collect()
+    rss_before = rss_bytes()
+    tracemalloc.start()
+    sessions = []
+    n_turns = 0
+    text_chars = 0
+    for user_id, variant, turns in iter_sessions(n_sessions, seed=seed):
+        sessions.append(build(user_id, variant, turns))
+        n_turns += len(turns)
+        text_chars += sum(len(prompt) + len(response) for _, _, prompt, response in turns)
+    gc.collect()
+    traced, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "mode": mode,
+        "sessions": n_sessions,
+        "turns": n_turns,
+        "text_chars": text_chars,
+        "traced_bytes": traced,
+        "rss_delta_bytes": rss_bytes() - rss_before,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mode", choices=["dict", "turn"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(measure(args.mode, args.sessions, args.seed)))
+        return
+
+    results = {}
+    for mode in ("dict", "turn"):
+        out = subprocess.run(
+            [sys.executable, __file__, "--mode", mode, "--sessions", str(args.sessions), "--seed", str(args.seed)],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        results[mode] = json.loads(out)
+
+    scale = 1000 / args.sessions
+    print(f"{args.sessions} sessions, {results['dict']['turns']} turns, {results['dict']['text_chars'] / 1e6:.1f}M text chars")
+    print(f"{'mode':<6} {'traced MiB/1k sessions':>24} {'RSS MiB/1k sessions':>21} {'bytes/turn':>11}")
+    for mode, r in results.items():
+        print(
+            f"{mode:<6} {r['traced_bytes'] * scale / 2**20:>24.1f} {r['rss_delta_bytes'] * scale / 2**20:>21.1f}"
+            f" {r['traced_bytes'] / r['turns']:>11.0f}"
+        )
+    saved = 1 - results["turn"]["traced_bytes"] / results["dict"]["traced_bytes"]
+    print(f"Turn records use {saved:.0%} less traced memory than dict entries")
+
+
+if __name__ == "__main__":
+    main()
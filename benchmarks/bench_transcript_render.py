@@ -0,0 +1,136 @@
+# --- Rerun cost of redrawing a long task transcript ---
+# Runs a Streamlit script (AppTest, no server) that redraws the history of one variant-1 task of
+# --turns synthetic turns the way the apps do on every rerun, and reports the median time of the
+# redraw inside the script and of the whole rerun, the elements the rerun sends and the bytes of
+# its messages to the browser (the serialized ForwardMsgs a websocket would carry). Modes:
+#
+#   plain     history as plain markdown, without the box (the apps before the box was redrawn)
+#   rebox     box_segments() on every turn of every rerun
+#   stored    box offsets stored with the turn when the response arrived (transcript_view)
+#   windowed  stored, and only the latest --window turns in full, older ones as summaries
+#
+#   python benchmarks/bench_transcript_render.py [--turns 20] [--window 4] [--reruns 30] [--seed 0]
+
+import argparse
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import streamlit.testing.v1.local_script_runner as local_script_runner
+from streamlit.testing.v1 import AppTest
+
+from synthetic_transcripts import make_prompt, make_response
+
+MODES = ["plain", "rebox", "stored", "windowed"]
+
+# Elements and message bytes of the last finished run
+last_payload = {}
+_parse_tree_from_messages = local_script_runner.parse_tree_from_messages
+
+
+def _measure_and_parse(messages):
+    last_payload["elements"] = sum(1 for msg in messages if msg.WhichOneof("type") == "delta")
+    last_payload["bytes"] = sum(msg.ByteSize() for msg in messages)
+    return _parse_tree_from_messages(messages)
+
+
+local_script_runner.parse_tree_from_messages = _measure_and_parse
+
+
+# Runs as the AppTest script; the turns are built in the first run, as a session's history
+def transcript_script(root, mode, n_turns, window, seed):
+    import random
+    import sys
+    import time
+
+    sys.path.insert(0, root)
+    sys.path.insert(0, root + "/benchmarks")
+    import streamlit as st
+
+    from response_boxing import box_segments, response_box
+    from synthetic_transcripts import make_prompt, make_response
+    from transcript_view import BOX_HTML, render_transcript, render_turn
+    from turn_records import Turn
+
+    if "history" not in st.session_state:
+        rng = random.Random(seed)
+        st.session_state.history = []
+        for _ in range(n_turns):
+            response = make_response(rng, "1", 0)
+            box = response_box(response, "1", ["1"]) if mode in ("stored", "windowed") else None
+            st.session_state.history.append(Turn("u1", "1", 0, make_prompt(rng, 0), response, box=box))
+
+    started = time.perf_counter()
+    if mode == "windowed":
+        render_transcript(st.session_state.history, window, ["1"])
+    else:
+        for turn in st.session_state.history:
+            if mode == "stored":
+                render_turn(turn, ["1"])
+                continue
+            with st.chat_message("user"):
+                st.markdown(turn.prompt)
+            with st.chat_message("assistant"):
+                segments = box_segments(turn.response) if mode == "rebox" else None
+                if segments is None:
+                    st.markdown(turn.response)
+                else:
+                    before, boxed, after = segments
+                    if before:
+                        st.markdown(before)
+                    st.markdown(BOX_HTML.format(boxed=boxed), unsafe_allow_html=True)
+                    if after:
+                        st.markdown(after)
+    st.session_state.render_seconds = time.perf_counter() - started
+    st.chat_input("Your message", key="chat_input_0")
+
+
+# The modes' reruns are interleaved, so a noisy phase of the machine hits all of them alike
+def run(modes, n_turns, window, n_reruns, seed):
+    apps = {mode: AppTest.from_function(transcript_script, args=(str(ROOT), mode, n_turns, window, seed), default_timeout=60) for mode in modes}
+    render = {mode: [] for mode in modes}
+    rerun = {mode: [] for mode in modes}
+    payload = {}
+    for at in apps.values():
+        at.run()
+    for _ in range(n_reruns):
+        for mode, at in apps.items():
+            started = time.perf_counter()
+            at.run()
+            rerun[mode].append(time.perf_counter() - started)
+            render[mode].append(at.session_state["render_seconds"])
+            payload[mode] = dict(last_payload)
+    results = {}
+    for mode, at in apps.items():
+        if at.exception:
+            raise RuntimeError(at.exception[0].message)
+        boxes = sum("border: 2px solid" in element.value for element in at.markdown)
+        results[mode] = statistics.median(render[mode]), statistics.median(rerun[mode]), payload[mode]["elements"], payload[mode]["bytes"], boxes
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES)
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--window", type=int, default=4, help="turns drawn in full by the windowed mode")
+    parser.add_argument("--reruns", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    chars = sum(len(make_prompt(rng, 0)) + len(make_response(rng, "1", 0)) for _ in range(args.turns))
+    print(f"one task of {args.turns} variant-1 turns ({chars / 1000:.0f}k chars), median of {args.reruns} reruns")
+    print(f"{'mode':<9} {'redraw ms':>10} {'rerun ms':>9} {'elements':>9} {'KB sent':>8} {'boxes':>6}")
+    for mode, (render_s, rerun_s, elements, payload_bytes, boxes) in run(args.modes, args.turns, args.window, args.reruns, args.seed).items():
+        print(f"{mode:<9} {render_s * 1000:>10.2f} {rerun_s * 1000:>9.1f} {elements:>9} {payload_bytes / 1000:>8.1f} {boxes:>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# --- Turn log shared by several worker processes ---
+# Starts --processes workers that upsert --upserts turns each (with some re-saves and changed
+# versions) into one TurnLogStore directory at the same time, the way the app workers of a host
+# share TURN_LOG_DIR. Afterwards every index entry must point at its own row, every worker must see
+# the turns of all the others, and a fresh store must agree. Exits with status 1 if not.
+#
+#   python benchmarks/bench_turn_log_processes.py [--processes 4] [--upserts 2000]
+
+import argparse
+import multiprocessing
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from turn_log import TurnLogStore
+
+
+def worker(directory, worker_id, n_upserts, start, results):
+    store = TurnLogStore(directory)
+    start.wait()
+    started = time.perf_counter()
+    for i in range(n_upserts):
+        row = {"turn_id": f"w{worker_id}-{i}", "user_id": f"w{worker_id}", "prompt": f"prompt {i}", "response": "x" * (i % 300)}
+        store.upsert(row)
+        if i % 10 == 0:
+            store.upsert(row)  # re-save of the same version: no-op
+        if i % 25 == 0:
+            store.upsert({**row, "response": "changed"})
+    elapsed = time.perf_counter() - started
+    results.put((worker_id, elapsed, len(store)))
+    store.close()
+
+
+def check(directory, n_processes, n_upserts):
+    store = TurnLogStore(directory)
+    errors = 0
+    for turn_id in store.turn_ids():
+        try:
+            row = store.get(turn_id)
+        except ValueError:  # offset in the middle of another row
+            row = None
+        worker_id, i = turn_id[1:].split("-")
+        expected = "changed" if int(i) % 25 == 0 else "x" * (int(i) % 300)
+        if row is None or row["turn_id"] != turn_id or row["response"] != expected:
+            errors += 1
+    missing = n_processes * n_upserts - len(store)
+    store.close()
+    return errors, missing
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--upserts", type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        start = multiprocessing.Event()
+        results = multiprocessing.Queue()
+        workers = [multiprocessing.Process(target=worker, args=(directory, w, args.upserts, start, results)) for w in range(args.processes)]
+        for process in workers:
+            process.start()
+        start.set()
+        finished = sorted(results.get() for _ in workers)
+        for process in workers:
+            process.join()
+        errors, missing = check(directory, args.processes, args.upserts)
+
+    total = args.processes * args.upserts
+    for worker_id, elapsed, seen in finished:
+        print(f"worker {worker_id}: {args.upserts / elapsed:,.0f} upserts/s, sees {seen} turns at the end")
+    print(f"{total} turns: {errors} index entries pointing at the wrong row, {missing} missing")
+    if errors or missing:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
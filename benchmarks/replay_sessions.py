@@ -0,0 +1,343 @@
+# --- Trace-driven replay of recorded participant sessions ---
+# Re-drives the sessions of an existing chat log against a running app, with the participants'
+# own timing: sessions start with their original inter-arrival gaps, and every prompt is sent
+# at its original offset from the session's first turn (the log timestamp is taken after the
+# response, so the gap between two turns is think + typing + the response time of that era).
+# --speed compresses all of it; --max-gap-s caps single pauses.
+#
+# Every session is one websocket connection speaking Streamlit's browser protocol (BackMsg
+# rerun requests with widget states, ForwardMsg deltas back), so the server sees real browser
+# sessions. By default the app is started here with `streamlit run`, openai_standin.py as the
+# LLM (OPENAI_BASE_URL) and the in-process Drive stand-in (DRIVE_STANDIN_LATENCY_MS), with all
+# local files in a temporary directory; --url replays against an app that is already running.
+# The variant comes from the app's own allocator, as for a new participant; the recorded arm
+# only decides which prompts are sent.
+#
+# Reports p50/p95/max latency per step (page load, "Continue", prompt, "Go to next task") and how
+# far behind schedule the steps were sent, compared with replay_baseline.json. Baselines are
+# scaled by bench_hot_paths.calibrate, measured before and after the replay. Exits with status 1
+# if a step's p95 is slower than its baseline by more than --threshold.
+#
+#   python benchmarks/replay_sessions.py Chat_Logs_Va_Knowledge.jsonl.zst --speed 20
+#   python benchmarks/replay_sessions.py --synthetic 12 --speed 15 --update-baseline
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+import pandas as pd
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+from websockets.asyncio.client import connect
+
+from bench_hot_paths import calibrate
+from bench_llm_client import start_standin
+from log_archive import DEFAULT_DICTIONARY_FILE, load_dictionaries, merge_log_rows, read_log_rows
+from replicas import start_replica, wait_healthy
+from synthetic_transcripts import CHAT_TASKS, iter_sessions
+
+BASELINE_FILE = Path(__file__).resolve().parent / "replay_baseline.json"
+DEFAULT_APP = ROOT / "Feedback_Va_Knowledge.py"
+DEFAULT_THRESHOLD = 0.25
+STEPS = ["load", "continue", "prompt", "next_task"]
+SECRETS_TOML = 'openai_api_key = "replay"\n\n[gdrive]\nfolder_id = "standin-folder"\n'
+
+
+# Log timestamps as seconds since the epoch: the apps log ISO strings (Turn.timestamp), older
+# exports may hold epoch seconds
+def log_seconds(timestamps):
+    if pd.api.types.is_numeric_dtype(timestamps):
+        return timestamps.astype(float)
+    return (pd.to_datetime(timestamps, format="ISO8601") - pd.Timestamp(0)) / pd.Timedelta(seconds=1)
+
+
+# Sessions as (first turn timestamp, user_id, variant, [(task_index, seconds since the first
+# turn, prompt)]), in order of arrival
+def sessions_from_rows(rows):
+    df = merge_log_rows(rows)
+    if df.empty:
+        return []
+    df = df[df["task_index"].astype(int) < CHAT_TASKS].assign(seconds=lambda d: log_seconds(d["timestamp"]))
+    df = df.sort_values(["user_id", "seconds"], kind="stable")
+    sessions = []
+    for user_id, turns in df.groupby("user_id", sort=False):
+        start = float(turns["seconds"].iloc[0])
+        steps = [(int(t), float(ts) - start, str(p)) for t, ts, p in zip(turns["task_index"], turns["seconds"], turns["prompt"])]
+        sessions.append((start, str(user_id), str(turns["variant"].iloc[0]), steps))
+    return sorted(sessions)
+
+
+# Synthetic sessions arrive every 60 s, like a study link handed out to a class
+def synthetic_sessions(n_sessions, seed):
+    sessions = []
+    for i, (user_id, variant, turns) in enumerate(iter_sessions(n_sessions, seed=seed)):
+        start = turns[0][1]
+        sessions.append((i * 60.0, user_id, variant, [(task, ts - start, prompt) for task, ts, prompt, _ in turns]))
+    return sessions
+
+
+class BrowserSession:
+    def __init__(self, url, timeout_s):
+        self.url = url
+        self.timeout_s = timeout_s
+        self.widgets = {}  # button label or chat input key -> widget id
+        self.ws = None
+
+    async def open(self):
+        self.ws = await connect(f"{self.url}/_stcore/stream", max_size=None, open_timeout=self.timeout_s)
+
+    async def close(self):
+        await self.ws.close()
+
+    # One rerun with the given widget states; returns when the script run finished (following
+    # st.rerun), raising on an exception element
+    async def rerun(self, widget_states=()):
+        await self.send(widget_states)
+        await self.finished()
+
+    # Requests a rerun without waiting for it, like a browser that submits during a running script
+    async def send(self, widget_states=()):
+        message = BackMsg()
+        message.rerun_script.query_string = ""
+        message.rerun_script.widget_states.widgets.extend(widget_states)
+        await self.ws.send(message.SerializeToString())
+
+    async def finished(self):
+        while True:
+            forward = ForwardMsg()
+            forward.ParseFromString(await asyncio.wait_for(self.ws.recv(), self.timeout_s))
+            kind = forward.WhichOneof("type")
+            if kind == "delta" and forward.delta.WhichOneof("type") == "new_element":
+                element = forward.delta.new_element
+                element_type = element.WhichOneof("type")
+                if element_type == "button":
+                    self.widgets[element.button.label] = element.button.id
+                elif element_type == "chat_input":
+                    self.widgets[element.chat_input.id.rsplit("-", 1)[-1]] = element.chat_input.id
+                elif element_type == "exception":
+                    raise RuntimeError(element.exception.message)
+            elif kind == "script_finished" and forward.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                return
+
+    async def click(self, label):
+        return await self.rerun([WidgetState(id=self.widgets[label], trigger_value=True)])
+
+    def chat_state(self, key, text):
+        state = WidgetState(id=self.widgets[key])
+        state.chat_input_value.data = text
+        return state
+
+    async def chat(self, key, text):
+        return await self.rerun([self.chat_state(key, text)])
+
+
+async def replay_session(url, steps, start_at, speed, max_gap_s, timeout_s, timings):
+    loop = asyncio.get_running_loop()
+
+    async def step(name, action, due=None):
+        lag = 0.0
+        if due is not None:
+            lag = loop.time() - due
+            if lag < 0:
+                await asyncio.sleep(-lag)
+                lag = 0.0
+        started = loop.time()
+        await action
+        timings.append((name, loop.time() - started, lag))
+
+    await asyncio.sleep(max(0.0, start_at - loop.time()))
+    session = BrowserSession(url, timeout_s)
+    await session.open()
+    try:
+        await step("load", session.rerun())
+        await step("continue", session.click("Continue"))
+        session_start = loop.time()
+        task_index = 0
+        previous_offset = 0.0
+        shift = 0.0  # schedule time removed by --max-gap-s
+        for step_task, offset, prompt in steps:
+            gap = (offset - previous_offset) / speed
+            if max_gap_s is not None and gap > max_gap_s:
+                shift += gap - max_gap_s
+            previous_offset = offset
+            due = session_start + offset / speed - shift
+            while task_index < step_task:
+                await step("next_task", session.click("Go to next task"), due)
+                task_index += 1
+                due = None
+            await step("prompt", session.chat(f"chat_input_{task_index}", prompt), due)
+    finally:
+        await session.close()
+
+
+async def replay(url, sessions, speed, max_gap_s, timeout_s):
+    loop = asyncio.get_running_loop()
+    t0 = loop.time() + 1.0
+    first = sessions[0][0]
+    timings = [[] for _ in sessions]
+    results = await asyncio.gather(*(
+        replay_session(url, steps, t0 + (start - first) / speed, speed, max_gap_s, timeout_s, session_timings)
+        for (start, _, _, steps), session_timings in zip(sessions, timings)
+    ), return_exceptions=True)
+    errors = [f"{type(e).__name__}: {e}" for e in results if isinstance(e, BaseException)]
+    return [timing for session_timings in timings for timing in session_timings], errors
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def summarize(timings):
+    summary = {}
+    for step in STEPS:
+        latencies = [latency for name, latency, _ in timings if name == step]
+        lags = [lag for name, _, lag in timings if name == step]
+        if latencies:
+            summary[step] = {
+                "n": len(latencies),
+                "p50_ms": 1000 * statistics.median(latencies),
+                "p95_ms": 1000 * percentile(latencies, 0.95),
+                "max_ms": 1000 * max(latencies),
+                "lag_p95_ms": 1000 * percentile(lags, 0.95),
+            }
+    return summary
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# streamlit run with the stand-ins; returns (process, http url) once the app answers
+def start_app(app, workdir, llm_base_url, drive_latency_ms, extra_env=None):
+    port = free_port()
+    secrets = Path(workdir) / "secrets.toml"
+    secrets.write_text(SECRETS_TOML)
+    env = {
+        **os.environ,
+        "OPENAI_BASE_URL": llm_base_url,
+        "DRIVE_STANDIN_LATENCY_MS": str(drive_latency_ms),
+        "TURN_LOG_DIR": f"{workdir}/turns",
+        "SESSION_SPILL_DIR": f"{workdir}/spill",
+        "USAGE_SNAPSHOT_FILE": f"{workdir}/usage.json",
+        "ASSIGNMENT_DB_FILE": f"{workdir}/assignments.sqlite3",
+        "PROFILE_DIR": f"{workdir}/profiles",
+        **(extra_env or {}),
+    }
+    process = start_replica(Path(app).resolve(), port, env, Path(workdir) / "app.log", cwd=workdir, secrets_file=secrets)
+    url = f"http://127.0.0.1:{port}"
+    if wait_healthy(process, url):
+        return process, url
+    process.terminate()
+    sys.exit(f"The app did not start, see {workdir}/app.log")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded sessions against an app with their original timing")
+    parser.add_argument("logs", nargs="*", help="archives (.zst), JSONL or Excel chat logs")
+    parser.add_argument("--synthetic", type=int, help="replay N synthetic sessions instead of logs")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--app", default=str(DEFAULT_APP), help="app script to start with the stand-ins")
+    parser.add_argument("--url", help="replay against this running app instead (http://host:port)")
+    parser.add_argument("--dictionary", default=str(ROOT / DEFAULT_DICTIONARY_FILE))
+    parser.add_argument("--sessions", type=int, help="replay only the first N sessions")
+    parser.add_argument("--speed", type=float, default=1.0, help="time compression factor")
+    parser.add_argument("--max-gap-s", type=float, help="cap every pause (after compression)")
+    parser.add_argument("--llm-latency-ms", type=float, default=800.0)
+    parser.add_argument("--llm-connect-ms", type=float, default=60.0)
+    parser.add_argument("--drive-latency-ms", type=float, default=80.0)
+    parser.add_argument("--timeout-s", type=float, default=120.0, help="per step")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--baseline", default=str(BASELINE_FILE))
+    args = parser.parse_args()
+
+    if args.synthetic:
+        trace = f"synthetic:{args.synthetic}:{args.seed}"
+        sessions = synthetic_sessions(args.synthetic, args.seed)
+    elif args.logs:
+        trace = ",".join(Path(log).name for log in args.logs)
+        dictionaries = load_dictionaries(args.dictionary)
+        sessions = sessions_from_rows([row for log in args.logs for row in read_log_rows(log, dictionaries)])
+    else:
+        parser.error("give chat logs or --synthetic N")
+    sessions = sessions[:args.sessions] if args.sessions else sessions
+    if not sessions:
+        sys.exit("No chat task turns to replay.")
+
+    processes = []
+    if args.url:
+        url = args.url.rstrip("/")
+        setup = {"app": url, "trace": trace, "speed": args.speed}
+    else:
+        workdir = tempfile.mkdtemp(prefix="llm_study_replay_")
+        standin, llm_base_url = start_standin(args.llm_latency_ms, args.llm_connect_ms)
+        processes.append(standin)
+        app, url = start_app(args.app, workdir, llm_base_url, args.drive_latency_ms)
+        processes.append(app)
+        setup = {"app": Path(args.app).name, "trace": trace, "speed": args.speed, "llm_latency_ms": args.llm_latency_ms, "drive_latency_ms": args.drive_latency_ms}
+        print(f"Started {setup['app']} on {url} (files and app.log in {workdir})")
+        print(f"LLM stand-in {args.llm_latency_ms:g} ms (+{args.llm_connect_ms:g} ms per connection), Drive stand-in {args.drive_latency_ms:g} ms")
+
+    first = sessions[0][0]
+    span = max(start - first + steps[-1][1] for start, _, _, steps in sessions) / args.speed
+    print(f"Replaying {len(sessions)} sessions ({sum(len(s[3]) for s in sessions)} prompts) of {trace} at {args.speed:g}x, about {span:.0f} s")
+    calibration = calibrate()
+    try:
+        timings, errors = asyncio.run(replay(url.replace("http", "ws", 1), sessions, args.speed, args.max_gap_s, args.timeout_s))
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            process.wait()
+    calibration = (calibration + calibrate()) / 2
+    for error in sorted(set(errors))[:5]:
+        print(f"session failed: {error}")
+
+    summary = summarize(timings)
+    baseline_path = Path(args.baseline)
+    baselines = json.loads(baseline_path.read_text()) if baseline_path.exists() else {}
+    key = f"{setup['app']}|{trace}|{args.speed:g}x"
+    reference = baselines.get(key)
+    if reference and reference["setup"] != setup:
+        print("baseline was recorded with other stand-in latencies, not comparing")
+        reference = None
+    scale = calibration / reference["calibration_s"] if reference else 1.0
+    print(f"calibration {calibration * 1000:.1f} ms, baseline scale {scale:.2f}, threshold +{args.threshold:.0%}")
+
+    regressions = []
+    print(f"{'step':<10} {'n':>5} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} {'lag p95':>8} {'base p95':>9} {'ratio':>6}")
+    for step, stats in summary.items():
+        base = reference["steps"].get(step) if reference else None
+        ratio = stats["p95_ms"] / (base["p95_ms"] * scale) if base else None
+        flag = ""
+        if ratio is not None and ratio > 1 + args.threshold:
+            regressions.append(step)
+            flag = "  REGRESSION"
+        base_s = f"{base['p95_ms'] * scale:>9.0f}" if base else f"{'-':>9}"
+        ratio_s = f"{ratio:>6.2f}" if ratio is not None else f"{'-':>6}"
+        print(f"{step:<10} {stats['n']:>5} {stats['p50_ms']:>8.0f} {stats['p95_ms']:>8.0f} {stats['max_ms']:>8.0f} {stats['lag_p95_ms']:>8.0f} {base_s} {ratio_s}{flag}")
+
+    if args.update_baseline:
+        if errors:
+            sys.exit("not updating the baseline: some sessions failed")
+        baselines[key] = {"setup": setup, "calibration_s": calibration, "steps": summary}
+        baseline_path.write_text(json.dumps(baselines, indent=2, sort_keys=True) + "\n")
+        print(f"wrote baseline {key} to {baseline_path}")
+    if errors or regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# --- Synthetic but realistic study transcripts for the benchmarks ---
+# Prompts and responses follow the shape of real sessions: short participant requests, email
+# drafts of a few hundred words, and for variant 1 the "Company Values related to this topic" /
+# "Recommendations" blocks plus the closing question. Typographic quotes and dashes are mixed in
+# the way the model produces them, because they change how CPython stores the text.
+
+import random
+import time
+import uuid
+
+VARIANTS = ["1", "2", "3"]
+CHAT_TASKS = 5
+
+TASK_TOPICS = [
+    ("summer party", "partners and spouses"),
+    ("overtime this week", "the project deadline"),
+    ("coming to the office more often", "team commitment"),
+    ("speeding up procurement", "the failed machine"),
+    ("disposable cutlery and plates", "the team event"),
+]
+
+PROMPT_TEMPLATES = [
+    "Please write an email to my team about {topic}.",
+    "Can you help me write a mail about {topic}? It should mention {detail}.",
+    "Make it shorter and a bit more motivational.",
+    "Add a sentence about {detail} and make the tone more friendly.",
+    "yes",
+    "Yes, please integrate the recommendations.",
+    "Can you make it sound less formal?",
+    "Write a guide on {topic}, keep it practical.",
+]
+
+VALUES = [
+    "Collaboration and teamwork", "Workplace safety and respect", "Sustainability",
+    "Commitment to diversity and inclusion", "Transparency", "Responsibility and trust",
+    "Compliance with laws and regulations", "Ethical behavior and professional integrity",
+]
+
+WORDS = (
+    "team project deadline office schedule support together flexible please thank appreciate "
+    "event invitation colleagues department partner spouse success effort week plan process "
+    "approval supplier urgent production quality commitment feedback environment respect"
+).split()
+
+
+def _sentence(rng, n_words):
+    words = [rng.choice(WORDS) for _ in range(n_words)]
+    words[0] = words[0].capitalize()
+    sentence = " ".join(words) + "."
+    if rng.random() < 0.3:
+        sentence = sentence.replace(" ", " – ", 1)
+    if rng.random() < 0.4:
+        sentence = sentence.replace("team", "team’s", 1)
+    return sentence
+
+
+def make_prompt(rng, task_index):
+    topic, detail = TASK_TOPICS[task_index % len(TASK_TOPICS)]
+    return rng.choice(PROMPT_TEMPLATES).format(topic=topic, detail=detail)
+
+
+def make_response(rng, variant, task_index):
+    topic, _ = TASK_TOPICS[task_index % len(TASK_TOPICS)]
+    paragraphs = [f"Subject: {topic.capitalize()}", "Dear Team,"]
+    for _ in range(rng.randint(3, 6)):
+        paragraphs.append(" ".join(_sentence(rng, rng.randint(8, 18)) for _ in range(rng.randint(2, 4))))
+    paragraphs.append("Best regards,\n[Your Name]")
+    if variant == "1":
+        values = rng.sample(VALUES, 3)
+        paragraphs.append("**Company Values related to this topic:**\n" + "\n".join(
+            f"- **{value}:** {_sentence(rng, rng.randint(8, 14))}" for value in values))
+        paragraphs.append("**Recommendations:**\n" + "\n".join(
+            f"- {_sentence(rng, rng.randint(8, 16))}" for _ in range(rng.randint(2, 4))))
+        paragraphs.append("**Do you want me to integrate any of these recommendations in the draft?**")
+    return "\n\n".join(paragraphs)
+
+
+# Yields (user_id, variant, turns) with turns as (task_index, ts, prompt, response) tuples.
+# Every text is built fresh so no two turns share string objects, as with real API responses.
+def iter_sessions(n_sessions, seed=0, turns_per_task=(1, 4), start_ts=None):
+    rng = random.Random(seed)
+    ts = time.time() - 86400 if start_ts is None else start_ts
+    for _ in range(n_sessions):
+        user_id = str(uuid.UUID(int=rng.getrandbits(128)))[:8]
+        variant = rng.choice(VARIANTS)
+        turns = []
+        for task_index in range(CHAT_TASKS):
+            for _ in range(rng.randint(*turns_per_task)):
+                ts += rng.uniform(5, 120)
+                turns.append((task_index, ts, make_prompt(rng, task_index), make_response(rng, variant, task_index)))
+        yield user_id, variant, turns
+
@@ -0,0 +1,107 @@
+# --- Researcher calibration mode ---
+# Shown instead of the study when the app is opened with ?calibrate=<st.secrets["researcher_token"]>.
+# One prompt (and optionally a prior chat history) is sent to every selected variant and model at
+# once, through the app's own call_llm, so the system prompts can be compared side by side. The
+# calls run on a thread pool sized to the number of combinations, so the whole fan-out takes about
+# as long as the slowest call. Nothing is logged, assigned or counted as a participant session.
+
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import streamlit as st
+
+from query_tokens import query_token_matches
+
+MAX_PARALLEL_CALLS = 16
+
+
+def calibration_requested(query_params, secret_token):
+    return query_token_matches(query_params, "calibrate", secret_token)
+
+
+# History as pasted by the researcher: a JSON list of {"role": "user"|"assistant", "content": ...}
+def parse_history(text):
+    if not text.strip():
+        return []
+    history = json.loads(text)
+    if not isinstance(history, list) or not all(
+        isinstance(entry, dict) and entry.get("role") in ("user", "assistant") and isinstance(entry.get("content"), str)
+        for entry in history
+    ):
+        raise ValueError('expected a list of {"role": "user" or "assistant", "content": "..."}')
+    return [{"role": entry["role"], "content": entry["content"]} for entry in history]
+
+
+def _timed_call(call_llm, prompt, variant, history, model):
+    started = time.perf_counter()
+    try:
+        content, usage = call_llm(prompt, variant, history, model=model, operation="calibration")
+        error = None
+    except Exception as e:
+        content, usage, error = None, None, f"{type(e).__name__}: {e}"
+    return {"variant": variant, "model": model, "content": content, "usage": usage, "error": error, "latency_s": time.perf_counter() - started}
+
+
+# Every (variant, model) combination concurrently; results in the order of the combinations
+def fan_out(call_llm, prompt, history, variants, models):
+    jobs = [(variant, model) for model in models for variant in variants]
+    if not jobs:
+        return [], 0.0
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=min(len(jobs), MAX_PARALLEL_CALLS), thread_name_prefix="calibration") as pool:
+        futures = [pool.submit(_timed_call, call_llm, prompt, variant, history, model) for variant, model in jobs]
+        results = [future.result() for future in futures]
+    return results, time.perf_counter() - started
+
+
+def _usage_caption(result):
+    usage = result["usage"]
+    parts = [f"{result['latency_s']:.2f} s"]
+    if usage is not None and usage.prompt_tokens is not None:
+        parts.append(f"{usage.prompt_tokens} in / {usage.completion_tokens} out tokens")
+        if usage.cost_usd is not None:
+            parts.append(f"${usage.cost_usd:.5f}")
+    return " · ".join(parts)
+
+
+def render_calibration(study_name, variants, models, call_llm):
+    st.title(f"Calibration: {study_name}")
+    st.caption("Researcher view. Responses are not logged and no participant session is created.")
+
+    with st.form("calibration"):
+        prompt = st.text_area("Prompt", height=150)
+        history_text = st.text_area("Prior chat history (optional JSON list of role/content messages)", height=100)
+        selected_variants = st.multiselect("Variants", variants, default=variants)
+        selected_models = st.multiselect("Models", models, default=models[:1])
+        submitted = st.form_submit_button("Send to all")
+
+    if submitted:
+        try:
+            history = parse_history(history_text)
+        except ValueError as e:
+            st.error(f"Invalid history: {e}")
+            history = None
+        if history is not None and not prompt.strip():
+            st.warning("Enter a prompt first.")
+        elif history is not None:
+            with st.spinner(f"Calling {len(selected_variants) * len(selected_models)} combinations..."):
+                results, wall_s = fan_out(call_llm, prompt, history, selected_variants, selected_models)
+            st.session_state.calibration_results = {"prompt": prompt, "results": results, "wall_s": wall_s}
+
+    run = st.session_state.get("calibration_results")
+    if not run or not run["results"]:
+        return
+    slowest = max(result["latency_s"] for result in run["results"])
+    st.caption(f"Fan-out took {run['wall_s']:.2f} s; slowest single call {slowest:.2f} s.")
+    for model in dict.fromkeys(result["model"] for result in run["results"]):
+        st.subheader(model)
+        model_results = [result for result in run["results"] if result["model"] == model]
+        for column, result in zip(st.columns(len(model_results)), model_results):
+            with column:
+                st.markdown(f"**Variant {result['variant']}**")
+                st.caption(_usage_caption(result))
+                if result["error"]:
+                    st.error(result["error"])
+                else:
+                    st.markdown(result["content"])
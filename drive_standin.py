@@ -0,0 +1,378 @@
+# --- Stand-ins for Google Drive v3 ---
+# DriveStandIn implements, in process, the subset of googleapiclient's Drive service used by the
+# apps and gdrive_ops: files().list (by name and parent, with md5Checksum), create, update,
+# get_media and batch requests. Every request that would be an HTTP round-trip sleeps for the
+# configured latency (seconds, or a fault_injection.LatencyModel) and is counted, so code paths
+# can be compared by round-trips and wall time without Google credentials. A
+# fault_injection.FaultPlan makes a share of the round-trips fail like Drive does: 503
+# backendError or 429 rateLimitExceeded.
+#
+# DriveHTTPStandIn serves the same files over Drive's REST protocol, for the real
+# googleapiclient service built by build_http_service(): files.list, get with alt=media,
+# multipart and media uploads, resumable upload sessions (with 308 for partial chunks) and
+# multipart/mixed batch requests. GET /_standin/stats returns the files held, the round-trips
+# and the injected faults.
+#
+#   python drive_standin.py [--port 8766] [--latency lognormal:80,0.5] [--error-rate 0.01]
+#   DRIVE_API_URL=http://127.0.0.1:8766 streamlit run Feedback_Va_Knowledge.py
+
+import argparse
+import hashlib
+import json
+import re
+import threading
+import time
+import urllib.parse
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httplib2
+from googleapiclient import discovery_cache
+from googleapiclient.discovery import build_from_document
+from googleapiclient.errors import HttpError
+
+from fault_injection import add_arguments, from_arguments
+
+_QUERY = re.compile(r"name='(?P<name>[^']*)' and '(?P<parent>[^']*)' in parents")
+_FILE_PATH = re.compile(r"^/drive/v3/files/(?P<id>[^/?]+)$")
+_UPLOAD_PATH = re.compile(r"^(?:/upload|/resumable/upload)/drive/v3/files(?:/(?P<id>[^/?]+))?$")
+_SESSION_PATH = re.compile(r"^/upload/sessions/(?P<id>[0-9a-f]+)$")
+REASONS = {200: "OK", 308: "Resume Incomplete", 400: "Bad Request", 404: "Not Found", 429: "Too Many Requests", 503: "Service Unavailable"}
+
+
+def _drive_error(status, reason, message):
+    content = json.dumps({"error": {"code": status, "message": message, "errors": [{"domain": "global", "reason": reason, "message": message}]}})
+    return HttpError(httplib2.Response({"status": status, "reason": REASONS.get(status, "Error")}), content.encode())
+
+
+class DriveStandIn:
+    def __init__(self, latency_s=0.0, faults=None):
+        self.latency_s = latency_s
+        self.faults = faults
+        self.round_trips = 0
+        self.files_by_id = {}
+        self._lock = threading.Lock()
+
+    # A new "service" shares the stored files; like the real client it should not be shared
+    # between threads, but nothing here depends on that
+    def build_service(self):
+        return _Service(self)
+
+    def _round_trip(self):
+        with self._lock:
+            self.round_trips += 1
+        if self.latency_s:
+            time.sleep(self.latency_s() if callable(self.latency_s) else self.latency_s)
+        fault = self.faults.draw() if self.faults else None
+        if fault == "rate_limit":
+            raise _drive_error(429, "rateLimitExceeded", "Rate Limit Exceeded (stand-in)")
+        if fault == "error":
+            raise _drive_error(503, "backendError", "Backend Error (stand-in)")
+
+    def _find(self, name, parent):
+        with self._lock:
+            return [
+                {"id": file_id, "name": f["name"], "md5Checksum": hashlib.md5(f["content"]).hexdigest()}
+                for file_id, f in self.files_by_id.items()
+                if f["name"] == name and parent in f["parents"]
+            ]
+
+    def _store(self, file_id, name, parents, mimetype, content):
+        with self._lock:
+            self.files_by_id[file_id] = {"name": name, "parents": list(parents), "mimeType": mimetype, "content": content}
+
+    def _content(self, file_id):
+        with self._lock:
+            f = self.files_by_id.get(file_id)
+        if f is None:
+            raise _drive_error(404, "notFound", f"File not found: {file_id}.")
+        return f["content"]
+
+    def _create(self, body, content):
+        file_id = uuid.uuid4().hex
+        self._store(file_id, body["name"], body.get("parents", []), body.get("mimeType"), content)
+        return {"id": file_id, "name": body["name"], "mimeType": body.get("mimeType")}
+
+    def _update(self, file_id, content):
+        self._content(file_id)  # 404 if it does not exist
+        with self._lock:
+            self.files_by_id[file_id]["content"] = content
+        return {"id": file_id}
+
+    def content_by_name(self, name):
+        with self._lock:
+            for f in self.files_by_id.values():
+                if f["name"] == name:
+                    return f["content"]
+        return None
+
+
+class _Request:
+    def __init__(self, drive, handler):
+        self._drive = drive
+        self._handler = handler
+
+    def execute(self, num_retries=0):
+        self._drive._round_trip()
+        return self._handler()
+
+    # Resumable uploads: one round-trip to open the session, one per chunk (single chunk here)
+    def next_chunk(self, num_retries=0):
+        self._drive._round_trip()
+        return None, self.execute()
+
+
+class _Batch:
+    def __init__(self, drive, callback):
+        self._drive = drive
+        self._callback = callback
+        self._requests = []
+
+    def add(self, request, callback=None, request_id=None):
+        self._requests.append((request, callback or self._callback, request_id or str(len(self._requests))))
+
+    def execute(self):
+        self._drive._round_trip()
+        for request, callback, request_id in self._requests:
+            try:
+                response, exception = request._handler(), None
+            except HttpError as e:
+                response, exception = None, e
+            callback(request_id, response, exception)
+
+
+class _Files:
+    def __init__(self, drive):
+        self._drive = drive
+
+    def list(self, q, fields=None, supportsAllDrives=False, **kwargs):
+        match = _QUERY.search(q)
+        return _Request(self._drive, lambda: {"files": self._drive._find(match["name"], match["parent"])})
+
+    def create(self, body, media_body=None, fields=None, supportsAllDrives=False):
+        return _Request(self._drive, lambda: self._drive._create(body, _media_bytes(media_body)))
+
+    def update(self, fileId, media_body=None, supportsAllDrives=False, **kwargs):
+        return _Request(self._drive, lambda: self._drive._update(fileId, _media_bytes(media_body)))
+
+    def get_media(self, fileId, supportsAllDrives=False, **kwargs):
+        return _Request(self._drive, lambda: self._drive._content(fileId))
+
+
+class _Service:
+    def __init__(self, drive):
+        self._drive = drive
+
+    def files(self):
+        return _Files(self._drive)
+
+    def new_batch_http_request(self, callback=None):
+        return _Batch(self._drive, callback)
+
+
+def _media_bytes(media_body):
+    if media_body is None:
+        return b""
+    return media_body.getbytes(0, media_body.size())
+
+
+# --- Drive's REST protocol over HTTP ---
+# googleapiclient's own Drive service, with every URL (API, uploads, batch) pointed at base_url
+def build_http_service(base_url, timeout_s=60):
+    document = json.loads(discovery_cache.get_static_doc("drive", "v3"))
+    document["rootUrl"] = base_url.rstrip("/") + "/"
+    return build_from_document(document, http=httplib2.Http(timeout=timeout_s))
+
+
+# Parts of a multipart body as (headers, payload); googleapiclient writes "\n" line endings,
+# other clients "\r\n"
+def _multipart_parts(content_type, body):
+    boundary = _header_param(content_type, "boundary").encode()
+    parts = []
+    for segment in body.split(b"--" + boundary)[1:]:
+        if segment.startswith(b"--"):
+            break
+        newline = b"\r\n" if segment.startswith(b"\r\n") else b"\n"
+        segment = segment[len(newline):-len(newline)]
+        head, _, payload = segment.partition(newline * 2)
+        parts.append((_parse_headers(head.decode("utf-8")), payload))
+    return parts
+
+
+def _header_param(value, name):
+    for param in value.split(";")[1:]:
+        key, _, param_value = param.strip().partition("=")
+        if key.lower() == name:
+            return param_value.strip('"')
+    return None
+
+
+def _parse_headers(text):
+    headers = {}
+    for line in text.splitlines():
+        name, separator, value = line.partition(":")
+        if separator:
+            headers[name.strip().lower()] = value.strip()
+    return headers
+
+
+class DriveHTTPStandIn:
+    def __init__(self, drive=None, host="127.0.0.1", port=0):
+        self.drive = drive or DriveStandIn()
+        self._sessions = {}  # resumable upload sessions by id
+        self._lock = threading.Lock()
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _handle(self):
+                body = self.rfile.read(int(self.headers.get("content-length", 0)))
+                headers = {name.lower(): value for name, value in self.headers.items()}
+                status, response_headers, data = standin.handle(self.command, self.path, headers, body)
+                self.send_response(status, REASONS.get(status))
+                for name, value in response_headers.items():
+                    self.send_header(name, value)
+                self.send_header("content-length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = do_PATCH = do_PUT = _handle
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    # One HTTP round-trip: latency and injected faults, then the request itself
+    def handle(self, method, path_and_query, headers, body):
+        url = urllib.parse.urlsplit(path_and_query)
+        if url.path == "/_standin/stats":
+            with self.drive._lock:
+                stats = {"files": len(self.drive.files_by_id), "round_trips": self.drive.round_trips}
+            return _json_response(200, {**stats, **(self.drive.faults.stats if self.drive.faults else {})})
+        try:
+            self.drive._round_trip()
+            if url.path == "/batch/drive/v3" and method == "POST":
+                return self._batch(headers, body)
+            return self._dispatch(method, url, headers, body)
+        except HttpError as e:
+            return e.resp.status, {"content-type": "application/json; charset=UTF-8"}, e.content
+
+    def _dispatch(self, method, url, headers, body):
+        query = {name: values[-1] for name, values in urllib.parse.parse_qs(url.query).items()}
+        if method == "GET" and url.path == "/drive/v3/files":
+            match = _QUERY.search(query.get("q", ""))
+            if match is None:
+                raise _drive_error(400, "invalidQuery", "Only name='...' and '...' in parents queries are supported")
+            return _json_response(200, {"files": self.drive._find(match["name"], match["parent"])})
+        if method == "GET" and (match := _FILE_PATH.match(url.path)):
+            if query.get("alt") != "media":
+                raise _drive_error(400, "badRequest", "Only alt=media downloads are supported")
+            return 200, {"content-type": "application/octet-stream"}, self.drive._content(match["id"])
+        if method in ("POST", "PATCH") and (match := _UPLOAD_PATH.match(url.path)):
+            file_id = match["id"]
+            if (method == "PATCH") != (file_id is not None):
+                raise _drive_error(400, "badRequest", "Create with POST, update with PATCH and a file id")
+            upload_type = query.get("uploadType")
+            if upload_type == "resumable":
+                return self._open_session(file_id, body, headers)
+            if upload_type == "multipart":
+                (_, metadata), (_, content) = _multipart_parts(headers["content-type"], body)
+                return self._save(file_id, json.loads(metadata or b"{}"), content)
+            if upload_type == "media":
+                return self._save(file_id, {}, body)
+            raise _drive_error(400, "badRequest", f"Unsupported uploadType {upload_type!r}")
+        if method == "PUT" and (match := _SESSION_PATH.match(url.path)):
+            return self._upload_chunk(match["id"], headers, body)
+        raise _drive_error(404, "notFound", f"{method} {url.path} is not supported by the stand-in")
+
+    def _save(self, file_id, metadata, content):
+        if file_id is None:
+            return _json_response(200, self.drive._create(metadata, content))
+        return _json_response(200, self.drive._update(file_id, content))
+
+    def _open_session(self, file_id, body, headers):
+        if file_id is not None:
+            self.drive._content(file_id)  # 404 before any bytes are sent
+        session_id = uuid.uuid4().hex
+        with self._lock:
+            self._sessions[session_id] = {"file_id": file_id, "metadata": json.loads(body or b"{}"), "content": bytearray()}
+        host = headers.get("host", "127.0.0.1")
+        return 200, {"location": f"http://{host}/upload/sessions/{session_id}"}, b""
+
+    # Content-Range "bytes first-last/total"; 308 with the range received until the last chunk
+    def _upload_chunk(self, session_id, headers, body):
+        with self._lock:
+            session = self._sessions.get(session_id)
+        if session is None:
+            raise _drive_error(404, "notFound", "Upload session not found")
+        content_range = headers.get("content-range", "")
+        total = content_range.rsplit("/", 1)[1] if "/" in content_range else str(len(body))
+        session["content"] += body
+        if total == "*" or len(session["content"]) < int(total):
+            return 308, {"range": f"bytes=0-{len(session['content']) - 1}"}, b""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+        return self._save(session["file_id"], session["metadata"], bytes(session["content"]))
+
+    # multipart/mixed of application/http requests, answered in one multipart/mixed response
+    def _batch(self, headers, body):
+        boundary = f"batch_{uuid.uuid4().hex}"
+        parts = []
+        for part_headers, payload in _multipart_parts(headers["content-type"], body):
+            request_head, _, request_body = payload.replace(b"\r\n", b"\n").partition(b"\n\n")
+            request_line, _, header_text = request_head.decode("utf-8").partition("\n")
+            method, path_and_query, _ = request_line.split(" ", 2)
+            inner_headers = _parse_headers(header_text)
+            try:
+                status, response_headers, data = self._dispatch(method, urllib.parse.urlsplit(path_and_query), inner_headers, request_body)
+            except HttpError as e:
+                status, response_headers, data = e.resp.status, {"content-type": "application/json; charset=UTF-8"}, e.content
+            content_id = part_headers.get("content-id", "<>")
+            response_head = "".join(f"{name}: {value}\r\n" for name, value in response_headers.items())
+            parts.append(
+                f"--{boundary}\r\nContent-Type: application/http\r\nContent-ID: <response-{content_id[1:-1]}>\r\n\r\n"
+                f"HTTP/1.1 {status} {REASONS.get(status, 'Error')}\r\n{response_head}\r\n".encode() + data + b"\r\n"
+            )
+        return 200, {"content-type": f"multipart/mixed; boundary={boundary}"}, b"".join(parts) + f"--{boundary}--\r\n".encode()
+
+    # Serves on a background thread; port 0 picks a free port
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="drive-standin", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def _json_response(status, payload):
+    return status, {"content-type": "application/json; charset=UTF-8"}, json.dumps(payload).encode()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the Google Drive v3 API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    add_arguments(parser, default_latency=0)
+    args = parser.parse_args()
+    latency, faults = from_arguments(args)
+    standin = DriveHTTPStandIn(DriveStandIn(latency, faults), args.host, args.port).start()
+    print(f"Drive stand-in on {standin.base_url}", flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        standin.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+# --- Latency distributions and injected faults for the local stand-ins ---
+# The Drive and OpenAI stand-ins share these, so a performance feature can be tried
+# against slow tails, server errors and rate limiting without the real services:
+#
+#   LatencyModel.parse("300")               300 ms on every request
+#   LatencyModel.parse("uniform:100-500")   uniform between 100 and 500 ms
+#   LatencyModel.parse("normal:300,50")     mean 300 ms, standard deviation 50 ms (cut at 0)
+#   LatencyModel.parse("lognormal:300,0.6") median 300 ms, sigma 0.6 (long right tail)
+#
+# A FaultPlan fails a share of the requests with a server error or a rate-limit response; the
+# stand-in decides what these look like on its protocol (HTTP 503, 429 with Retry-After, ...).
+# Both take a seed, so a run can be repeated with the same latencies and faults.
+
+import math
+import random
+import threading
+
+LATENCY_KINDS = ["fixed", "uniform", "normal", "lognormal"]
+
+
+class LatencyModel:
+    def __init__(self, kind="fixed", a_ms=0.0, b_ms=0.0, seed=None):
+        if kind not in LATENCY_KINDS:
+            raise ValueError(f"unknown latency distribution {kind!r}, expected one of {LATENCY_KINDS}")
+        self.kind = kind
+        self.a_ms = float(a_ms)
+        self.b_ms = float(b_ms)
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    # "<ms>" or "<kind>:<a>,<b>" (uniform also as "<low>-<high>"), all in milliseconds except
+    # the lognormal sigma
+    @classmethod
+    def parse(cls, spec, seed=None):
+        spec = str(spec).strip()
+        if ":" not in spec:
+            return cls("fixed", float(spec), seed=seed)
+        kind, _, params = spec.partition(":")
+        a, _, b = params.replace("-", ",", 1 if kind == "uniform" else 0).partition(",")
+        return cls(kind.strip(), float(a), float(b or 0), seed=seed)
+
+    # Seconds to wait for one request; callable, so it can stand wherever a latency is expected
+    def __call__(self):
+        with self._lock:
+            if self.kind == "fixed":
+                ms = self.a_ms
+            elif self.kind == "uniform":
+                ms = self._rng.uniform(self.a_ms, self.b_ms)
+            elif self.kind == "normal":
+                ms = self._rng.gauss(self.a_ms, self.b_ms)
+            else:
+                ms = self.a_ms * math.exp(self._rng.gauss(0.0, self.b_ms)) if self.a_ms > 0 else 0.0
+        return max(0.0, ms) / 1000
+
+    def __repr__(self):
+        return f"LatencyModel({self.kind!r}, {self.a_ms:g}, {self.b_ms:g})"
+
+
+class FaultPlan:
+    def __init__(self, error_rate=0.0, rate_limit_rate=0.0, retry_after_s=1.0, seed=None):
+        if error_rate < 0 or rate_limit_rate < 0 or error_rate + rate_limit_rate > 1:
+            raise ValueError("error and rate-limit rates must be between 0 and 1 together")
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after_s = retry_after_s
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "errors_injected": 0, "rate_limits_injected": 0}
+
+    # None for a normal response, "error" or "rate_limit" for an injected fault
+    def draw(self):
+        with self._lock:
+            self.stats["requests"] += 1
+            if not (self.error_rate or self.rate_limit_rate):
+                return None
+            roll = self._rng.random()
+            if roll < self.error_rate:
+                self.stats["errors_injected"] += 1
+                return "error"
+            if roll < self.error_rate + self.rate_limit_rate:
+                self.stats["rate_limits_injected"] += 1
+                return "rate_limit"
+            return None
+
+    def __repr__(self):
+        return f"FaultPlan(error_rate={self.error_rate:g}, rate_limit_rate={self.rate_limit_rate:g}, retry_after_s={self.retry_after_s:g})"
+
+
+# --- Command line ---
+# The same options on every stand-in; prefix tells the services apart on a shared command line
+def add_arguments(parser, default_latency, prefix=""):
+    parser.add_argument(f"--{prefix}latency", default=str(default_latency), help="ms, or uniform:LOW-HIGH, normal:MEAN,SD, lognormal:MEDIAN,SIGMA")
+    parser.add_argument(f"--{prefix}error-rate", type=float, default=0.0, help="share of requests answered with a server error")
+    parser.add_argument(f"--{prefix}rate-limit-rate", type=float, default=0.0, help="share of requests answered with a rate-limit response")
+    parser.add_argument(f"--{prefix}retry-after-s", type=float, default=1.0, help="Retry-After of the rate-limit responses")
+    if "--seed" not in parser._option_string_actions:
+        parser.add_argument("--seed", type=int, help="repeat the latencies and faults of an earlier run")
+
+
+def from_arguments(args, prefix=""):
+    option = lambda name: getattr(args, (prefix + name).replace("-", "_"))
+    seed = args.seed
+    latency = LatencyModel.parse(option("latency"), seed=seed)
+    faults = FaultPlan(option("error-rate"), option("rate-limit-rate"), option("retry-after-s"), seed=None if seed is None else seed + 1)
+    return latency, faults
@@ -0,0 +1,207 @@
+# --- Google Drive operations layer ---
+# All Drive traffic of the apps goes through one DriveOps per process:
+#   * file ids are looked up once per name and cached, and lookups for several names are sent
+#     as one Drive batch request instead of one files().list call each,
+#   * uploads of independent files run concurrently, each on its own service object (Drive
+#     service objects are not thread-safe),
+#   * small files use a single multipart upload instead of a resumable session.
+# Every HTTP round-trip is counted so the cost of a save can be read from stats(), and every
+# operation is a span of the current trace (tracing.py), uploads on the pool threads included.
+
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from io import BytesIO
+
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaIoBaseUpload
+
+import tracing
+
+XLSX_MIMETYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+ZSTD_MIMETYPE = "application/zstd"
+# Above this size uploads switch to resumable sessions (one extra round-trip, but restartable)
+RESUMABLE_THRESHOLD_BYTES = 5 * 2**20
+
+
+def guess_mimetype(file_name):
+    if file_name.endswith(".xlsx"):
+        return XLSX_MIMETYPE
+    if file_name.endswith(".zst"):
+        return ZSTD_MIMETYPE
+    if file_name.endswith(".json"):
+        return "application/json"
+    return "text/csv"
+
+
+class DriveOps:
+    def __init__(self, build_service, folder_id, max_workers=4):
+        self.folder_id = folder_id
+        self._build_service = build_service
+        self._services = queue.LifoQueue()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="drive-ops")
+        self._file_ids = {}
+        self._lock = threading.Lock()
+        self._round_trips = 0
+        self._saves = 0
+        self._save_round_trips = 0
+        self._last_save_round_trips = 0
+
+    @contextmanager
+    def service(self):
+        try:
+            service = self._services.get_nowait()
+        except queue.Empty:
+            service = self._build_service()
+        try:
+            yield service
+        finally:
+            self._services.put(service)
+
+    # trips: optional one-element list collecting the round-trips of a single save
+    def _count(self, trips=None):
+        with self._lock:
+            self._round_trips += 1
+            if trips is not None:
+                trips[0] += 1
+
+    def _query(self, file_name):
+        return f"name='{file_name}' and '{self.folder_id}' in parents and trashed=false"
+
+    # --- Metadata ---
+    # Returns {name: file_id or None}; unknown names are resolved with a single batch request
+    def lookup_ids(self, file_names, trips=None):
+        with self._lock:
+            missing = [name for name in file_names if name not in self._file_ids]
+        if missing:
+            with tracing.span("drive.lookup", files=len(missing)):
+                found = self._list(missing, "id", trips)
+            with self._lock:
+                # Only existing files are cached; a missing one may be created by another process
+                self._file_ids.update({name: file["id"] for name, file in found.items() if file})
+            return {name: self._file_ids.get(name) for name in file_names}
+        with self._lock:
+            return {name: self._file_ids[name] for name in file_names}
+
+    # Returns {name: md5 of the file's content on Drive, or None if there is no such file}, fresh
+    # from Drive with a single batch request; lets a writer notice that someone else changed a file
+    def checksums(self, file_names, trips=None):
+        with tracing.span("drive.checksums", files=len(file_names)):
+            found = self._list(file_names, "id,md5Checksum", trips)
+        return {name: file.get("md5Checksum") if file else None for name, file in found.items()}
+
+    # {name: first matching file resource with the given fields, or None}, one round-trip
+    def _list(self, file_names, fields, trips=None):
+        found = {}
+
+        def on_response(request_id, response, exception):
+            if exception is not None:
+                raise exception
+            items = response.get("files", [])
+            found[request_id] = items[0] if items else None
+
+        with self.service() as service:
+            if len(file_names) == 1:
+                on_response(file_names[0], self._list_request(service, file_names[0], fields).execute(), None)
+            else:
+                batch = service.new_batch_http_request(callback=on_response)
+                for name in file_names:
+                    batch.add(self._list_request(service, name, fields), request_id=name)
+                batch.execute()
+        self._count(trips)
+        return found
+
+    def _list_request(self, service, file_name, fields="id"):
+        return service.files().list(q=self._query(file_name), fields=f"files({fields})", supportsAllDrives=True)
+
+    def forget(self, file_name):
+        with self._lock:
+            self._file_ids.pop(file_name, None)
+
+    # --- Uploads ---
+    # files: {name_on_drive: bytes}. Independent files are uploaded concurrently.
+    def save_many(self, files):
+        trips = [0]
+        with tracing.span("drive.save", files=len(files), bytes=sum(len(content) for content in files.values())) as span:
+            ids = self.lookup_ids(list(files), trips)
+            futures = [
+                self._executor.submit(tracing.wrap(self._upload), name, content, ids.get(name), trips)
+                for name, content in files.items()
+            ]
+            for future in futures:
+                future.result()
+            if span is not None:
+                span.attrs["round_trips"] = trips[0]
+        with self._lock:
+            self._saves += 1
+            self._last_save_round_trips = trips[0]
+            self._save_round_trips += trips[0]
+        return trips[0]
+
+    def save(self, file_name, content):
+        return self.save_many({file_name: content})
+
+    def _upload(self, file_name, content, file_id, trips):
+        with tracing.span("drive.upload", file=file_name, bytes=len(content)):
+            self._upload_file(file_name, content, file_id, trips)
+
+    def _upload_file(self, file_name, content, file_id, trips):
+        mimetype = guess_mimetype(file_name)
+        resumable = len(content) > RESUMABLE_THRESHOLD_BYTES
+        media = MediaIoBaseUpload(BytesIO(content), mimetype=mimetype, resumable=resumable)
+        with self.service() as service:
+            if file_id is not None:
+                try:
+                    self._execute(service.files().update(fileId=file_id, media_body=media, supportsAllDrives=True), resumable, trips)
+                    return
+                except HttpError as e:
+                    if e.resp.status != 404:
+                        raise
+                    self.forget(file_name)  # deleted on Drive since we cached the id
+                    media = MediaIoBaseUpload(BytesIO(content), mimetype=mimetype, resumable=resumable)
+            file_metadata = {"name": file_name, "parents": [self.folder_id], "mimeType": mimetype}
+            created = self._execute(
+                service.files().create(body=file_metadata, media_body=media, fields="id", supportsAllDrives=True),
+                resumable, trips,
+            )
+        with self._lock:
+            self._file_ids[file_name] = created["id"]
+
+    def _execute(self, request, resumable, trips):
+        if not resumable:
+            self._count(trips)
+            return request.execute()
+        response = None
+        self._count(trips)  # session initiation
+        while response is None:
+            _, response = request.next_chunk()
+            self._count(trips)
+        return response
+
+    # --- Downloads ---
+    def download(self, file_name):
+        for attempt in range(2):
+            file_id = self.lookup_ids([file_name])[file_name]
+            if file_id is None:
+                return None
+            with self.service() as service:
+                try:
+                    self._count()
+                    with tracing.span("drive.download", file=file_name):
+                        return service.files().get_media(fileId=file_id, supportsAllDrives=True).execute()
+                except HttpError as e:
+                    if e.resp.status != 404 or attempt:
+                        raise
+            self.forget(file_name)  # deleted on Drive since we cached the id; look it up again
+
+    def stats(self):
+        with self._lock:
+            return {
+                "round_trips": self._round_trips,
+                "saves": self._saves,
+                "last_save_round_trips": self._last_save_round_trips,
+                "round_trips_per_save": self._save_round_trips / self._saves if self._saves else 0.0,
+                "cached_file_ids": len(self._file_ids),
+            }
+
@@ -0,0 +1,120 @@
+# --- Single-flight prompt submission and cancellation of abandoned generations ---
+# Streamlit interrupts a script run at its next element call when the participant submits again
+# or clicks a button, but a blocking LLM call runs to its end first, and the answer is then
+# thrown away with the run. Here a prompt's answer is a Generation: a streamed completion on the
+# LLM client's event loop (llm_client.submit_chat_stream), owned by the session, at most one per
+# session. The script waits for it in short steps and touches a status element between them,
+# so a rerun or stop request interrupts the wait and not the generation:
+#
+# - a second submit while one is in flight is queued: the next run adopts the running
+#   generation, logs its turn, then answers the new prompt with that turn in the history;
+# - "Go to next task" cancels it, and so does a disconnect; cancelling closes the stream, so the
+#   model stops generating.
+#
+# With fast reruns (Streamlit's default) every new request stops the running script and starts a
+# new run at once, so a stopped wait does not mean the participant left: the generation is only
+# cancelled if the session is no longer active shortly after.
+#
+# The ledger counts both and estimates what a cancellation saved from the mean completion size
+# and duration of the generations that finished.
+
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from streamlit.runtime import Runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from streamlit.runtime.scriptrunner_utils.exceptions import StopException
+
+POLL_SECONDS = 0.25
+DISCONNECT_CHECK_DELAY_SECONDS = 0.5
+
+
+class Generation:
+    def __init__(self, future, progress, task_index, prompt):
+        self.future = future
+        self.progress = progress  # {"chunks": n}, updated by the event loop
+        self.task_index = task_index
+        self.prompt = prompt
+        self.started = time.perf_counter()
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+
+class GenerationLedger:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {
+            "started": 0, "completed": 0, "failed": 0, "queued_submits": 0,
+            "cancelled_navigation": 0, "cancelled_disconnect": 0, "cancelled_chunks_received": 0,
+            "est_saved_completion_tokens": 0, "est_saved_seconds": 0.0,
+            "completion_tokens": 0, "generation_seconds": 0.0,
+        }
+
+    def _add(self, **amounts):
+        with self._lock:
+            for name, amount in amounts.items():
+                self._counts[name] += amount
+
+    def started(self):
+        self._add(started=1)
+
+    def queued(self):
+        self._add(queued_submits=1)
+
+    # Blocks until the generation finished and returns its response. Between short waits the
+    # status element is updated, which is where Streamlit raises a pending rerun or stop; the
+    # generation keeps running for the next run to adopt.
+    def wait(self, generation, status, label="Thinking..."):
+        while True:
+            try:
+                response = generation.future.result(timeout=POLL_SECONDS)
+            except FutureTimeoutError:
+                try:
+                    status.caption(f"{label} {generation.elapsed:.0f} s")
+                except StopException:
+                    self._cancel_if_disconnected(generation, get_script_run_ctx().session_id)
+                    raise
+                continue
+            except Exception:
+                self._add(failed=1)
+                raise
+            usage = getattr(response, "usage", None)
+            self._add(completed=1, completion_tokens=getattr(usage, "completion_tokens", None) or 0, generation_seconds=generation.elapsed)
+            return response
+
+    # Streamlit moves a disconnected session out of the active ones just after stopping its script
+    def _cancel_if_disconnected(self, generation, session_id):
+        def check():
+            if Runtime.exists() and not Runtime.instance().is_active_session(session_id):
+                self.cancel(generation, "disconnect")
+
+        timer = threading.Timer(DISCONNECT_CHECK_DELAY_SECONDS, check)
+        timer.daemon = True
+        timer.start()
+
+    # reason: "navigation" or "disconnect"
+    def cancel(self, generation, reason):
+        if not generation.future.cancel():
+            return False  # already finished; nothing left to save
+        with self._lock:
+            completed = self._counts["completed"]
+            mean_tokens = self._counts["completion_tokens"] / completed if completed else 0.0
+            mean_seconds = self._counts["generation_seconds"] / completed if completed else 0.0
+        chunks = generation.progress["chunks"]
+        self._add(**{
+            f"cancelled_{reason}": 1,
+            "cancelled_chunks_received": chunks,
+            "est_saved_completion_tokens": round(max(0.0, mean_tokens - chunks)),
+            "est_saved_seconds": max(0.0, mean_seconds - generation.elapsed),
+        })
+        return True
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._counts)
+        counts["mean_completion_tokens"] = counts["completion_tokens"] / counts["completed"] if counts["completed"] else 0.0
+        counts["mean_generation_seconds"] = counts["generation_seconds"] / counts["completed"] if counts["completed"] else 0.0
+        return counts
@@ -0,0 +1,154 @@
+# --- Local stand-in for the network key-value service of state_backend.py ---
+# Serves the small JSON protocol of state_backend.KVClient (get, put, cas, incr, delete, scan)
+# from memory, over HTTP/1.1 keep-alive. It is enough to run several replicas against
+# STATE_BACKEND=kv+http://... on one machine; a production deployment points the replicas at a
+# real service behind the same protocol. --snapshot writes the data to a JSON file on Ctrl-C and
+# loads it on start. GET /_standin/stats returns the keys held and the requests served.
+#
+#   python kv_standin.py [--port 7379] [--latency-ms 0] [--snapshot kv.json]
+#   STATE_BACKEND=kv+http://127.0.0.1:7379 python replicas.py Feedback_Va_Knowledge.py --replicas 4 --spool-dir /tmp/spool
+
+import argparse
+import bisect
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+
+class KVStore:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = {}  # key -> (value, version)
+        self._keys = []  # sorted, for prefix scans
+        self.requests = 0
+
+    def _write(self, key, value):
+        _, version = self._data.get(key, (None, 0))
+        if key not in self._data:
+            bisect.insort(self._keys, key)
+        self._data[key] = (value, version + 1)
+        return version + 1
+
+    def apply(self, op, body):
+        with self._lock:
+            self.requests += 1
+            key = body.get("key")
+            if op == "get":
+                value, version = self._data.get(key, (None, 0))
+                return {"value": value, "version": version}
+            if op == "put":
+                return {"version": self._write(key, body["value"])}
+            if op == "cas":
+                if self._data.get(key, (None, 0))[1] != body["version"]:
+                    return {"ok": False, "version": self._data.get(key, (None, 0))[1]}
+                return {"ok": True, "version": self._write(key, body["value"])}
+            if op == "incr":
+                value = (self._data.get(key, (0, 0))[0] or 0) + body.get("by", 1)
+                self._write(key, value)
+                return {"value": value}
+            if op == "delete":
+                if self._data.pop(key, None) is not None:
+                    self._keys.pop(bisect.bisect_left(self._keys, key))
+                return {}
+            if op == "scan":
+                prefix = body["prefix"]
+                start = bisect.bisect_left(self._keys, prefix)
+                items = []
+                for key in self._keys[start:]:
+                    if not key.startswith(prefix):
+                        break
+                    value, version = self._data[key]
+                    items.append([key, None if body.get("keys_only") else value, version])
+                return {"items": items}
+        raise KeyError(op)
+
+    def dump(self, path):
+        with self._lock:
+            Path(path).write_text(json.dumps({key: list(entry) for key, entry in self._data.items()}))
+
+    def load(self, path):
+        if Path(path).exists():
+            with self._lock:
+                self._data = {key: tuple(entry) for key, entry in json.loads(Path(path).read_text()).items()}
+                self._keys = sorted(self._data)
+
+
+class KVStandIn:
+    def __init__(self, host="127.0.0.1", port=0, latency_s=0.0):
+        self.store = KVStore()
+        self.latency_s = latency_s
+        store = self.store
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _send(self, status, payload):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if self.path == "/_standin/stats":
+                    self._send(200, {"keys": len(store._data), "requests": store.requests})
+                else:
+                    self._send(404, {"error": f"unknown path {self.path}"})
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if latency_s:
+                    time.sleep(latency_s)
+                try:
+                    self._send(200, store.apply(self.path.strip("/"), body))
+                except KeyError as e:
+                    self._send(400, {"error": f"bad request: {e}"})
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    # Serves on a background thread; port 0 picks a free port
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="kv-standin", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the state backend key-value service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7379)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="delay added to every request")
+    parser.add_argument("--snapshot", help="JSON file loaded on start and written on exit")
+    args = parser.parse_args()
+    standin = KVStandIn(args.host, args.port, args.latency_ms / 1000)
+    if args.snapshot:
+        standin.store.load(args.snapshot)
+    standin.start()
+    print(f"KV stand-in on {standin.base_url}", flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        standin.stop()
+        if args.snapshot:
+            standin.store.dump(args.snapshot)
+
+
+if __name__ == "__main__":
+    main()
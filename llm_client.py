@@ -0,0 +1,137 @@
+# --- Shared async OpenAI client on a background event loop ---
+# Streamlit runs every session on its own thread. Instead of each thread blocking inside its own
+# HTTP request, all LLM calls of the process go through one openai.AsyncOpenAI client that lives
+# on a dedicated event loop thread; session threads submit a coroutine and wait for its result.
+# The client has one connection pool with explicit limits, so connections (and their TLS
+# handshakes) are reused across sessions and kept alive between turns, and it speaks HTTP/2 when
+# the h2 package is installed, multiplexing concurrent calls over few connections.
+#
+# BackgroundLLMClient exposes the blocking chat.completions.create / models.retrieve calls of
+# openai.OpenAI, so call sites do not change, and submit_chat_stream for generations that the
+# caller may abandon (see generation_control.py). Every request is an "llm.request" span of the
+# submitting session's trace (tracing.py), from submit to its last byte or cancellation.
+
+import asyncio
+import importlib.util
+import threading
+from types import SimpleNamespace
+
+import openai
+
+import tracing
+
+try:
+    import httpx
+except ImportError:  # openai 3 is built on httpx2
+    import httpx2 as httpx
+
+DEFAULT_MAX_CONNECTIONS = 100
+DEFAULT_MAX_KEEPALIVE = 100
+DEFAULT_KEEPALIVE_EXPIRY_S = 60.0
+DEFAULT_TIMEOUT_S = 120.0
+
+
+def http2_available():
+    return importlib.util.find_spec("h2") is not None
+
+
+class BackgroundLLMClient:
+    def __init__(self, api_key, base_url=None, max_connections=DEFAULT_MAX_CONNECTIONS,
+                 max_keepalive=DEFAULT_MAX_KEEPALIVE, keepalive_expiry_s=DEFAULT_KEEPALIVE_EXPIRY_S,
+                 http2=None, timeout_s=DEFAULT_TIMEOUT_S, max_retries=2):
+        self.http2 = http2_available() if http2 is None else http2
+        self.limits = {"max_connections": max_connections, "max_keepalive": max_keepalive, "keepalive_expiry_s": keepalive_expiry_s}
+        self._lock = threading.Lock()
+        self._counts = {"submitted": 0, "failed": 0, "cancelled": 0, "in_flight": 0, "peak_in_flight": 0}
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="llm-event-loop", daemon=True)
+        self._thread.start()
+
+        async def build():
+            http_client = openai.DefaultAsyncHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=max_connections,
+                    max_keepalive_connections=max_keepalive,
+                    keepalive_expiry=keepalive_expiry_s,
+                ),
+                http2=self.http2,
+                timeout=httpx.Timeout(timeout_s, connect=10.0),
+            )
+            return openai.AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=http_client, max_retries=max_retries)
+
+        self._client = asyncio.run_coroutine_threadsafe(build(), self._loop).result()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create_chat_completion))
+        self.models = SimpleNamespace(retrieve=self._retrieve_model)
+
+    # Schedules a coroutine on the loop; cancelling the returned future cancels the coroutine
+    def _submit(self, coroutine, operation, model=None):
+        span = tracing.begin("llm.request", operation=operation, model=model)
+        with self._lock:
+            self._counts["submitted"] += 1
+            self._counts["in_flight"] += 1
+            self._counts["peak_in_flight"] = max(self._counts["peak_in_flight"], self._counts["in_flight"])
+        future = asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+        future.add_done_callback(lambda done: self._finished(done, span))
+        return future
+
+    def _finished(self, future, span):
+        with self._lock:
+            self._counts["in_flight"] -= 1
+            if future.cancelled():
+                self._counts["cancelled"] += 1
+            elif future.exception() is not None:
+                self._counts["failed"] += 1
+        if span is not None:
+            if future.cancelled():
+                span.end(outcome="cancelled")
+            elif future.exception() is not None:
+                span.end(outcome="failed", error=repr(future.exception()))
+            else:
+                usage = getattr(future.result(), "usage", None)
+                span.end(outcome="ok", completion_tokens=getattr(usage, "completion_tokens", None))
+
+    # Runs a coroutine on the loop and blocks the calling (session) thread until it is done
+    def _run(self, coroutine, operation, model=None):
+        future = self._submit(coroutine, operation, model)
+        try:
+            return future.result()
+        except BaseException:
+            future.cancel()
+            raise
+
+    def _create_chat_completion(self, **kwargs):
+        return self._run(self._client.chat.completions.create(**kwargs), "chat", kwargs.get("model"))
+
+    def _retrieve_model(self, model):
+        return self._run(self._client.models.retrieve(model), "models.retrieve", model)
+
+    # Starts a streamed chat completion and returns at once. The future's result is shaped like a
+    # non-streamed response (choices[0].message.content, usage); cancelling the future closes the
+    # stream, so the server stops generating. progress["chunks"] counts the content chunks so far.
+    def submit_chat_stream(self, progress, **kwargs):
+        async def collect():
+            stream = await self._client.chat.completions.create(stream=True, stream_options={"include_usage": True}, **kwargs)
+            parts = []
+            usage = None
+            try:
+                async for chunk in stream:
+                    if chunk.usage is not None:
+                        usage = chunk.usage
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        parts.append(chunk.choices[0].delta.content)
+                        progress["chunks"] += 1
+            finally:
+                await stream.close()
+            message = SimpleNamespace(role="assistant", content="".join(parts))
+            return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage)
+
+        return self._submit(collect(), "chat.stream", kwargs.get("model"))
+
+    def stats(self):
+        with self._lock:
+            return {**self._counts, "http2": self.http2, **self.limits}
+
+    def close(self):
+        asyncio.run_coroutine_threadsafe(self._client.close(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
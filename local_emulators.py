@@ -0,0 +1,100 @@
+# --- Local emulators for the services the apps call ---
+# Runs an app offline: starts the Drive v3 stand-in (drive_standin.py, REST over HTTP for the real
+# googleapiclient) and the OpenAI chat-completions stand-in (openai_standin.py, streaming
+# included), each with its own latency distribution, error rate and rate-limit responses (see
+# fault_injection.py), writes a secrets file with placeholder credentials and starts the app
+# against them. Without --app it prints the environment to start apps by hand.
+#
+#   python local_emulators.py --app Feedback_Va_Knowledge.py
+#   python local_emulators.py --app Feedback_Vb_Writing.py --llm-latency lognormal:1500,0.5 \
+#       --llm-rate-limit-rate 0.05 --drive-latency lognormal:120,0.4 --drive-error-rate 0.02
+
+import argparse
+import json
+import os
+import signal
+import tempfile
+import threading
+import urllib.request
+from pathlib import Path
+
+from drive_standin import DriveHTTPStandIn, DriveStandIn
+from fault_injection import add_arguments, from_arguments
+from openai_standin import OpenAIStandIn
+from replicas import start_replica, wait_healthy
+
+SECRETS_TOML = 'openai_api_key = "emulator"\n\n[gdrive]\nfolder_id = "emulator-folder"\n'
+
+
+class LocalEmulators:
+    def __init__(self, llm_latency, llm_faults, drive_latency, drive_faults, connect_s=0.06, host="127.0.0.1"):
+        self.llm = OpenAIStandIn(host, 0, llm_latency, connect_s, llm_faults)
+        self.drive = DriveHTTPStandIn(DriveStandIn(drive_latency, drive_faults), host, 0)
+
+    def start(self):
+        self.llm.start()
+        self.drive.start()
+        return self
+
+    def stop(self):
+        self.llm.stop()
+        self.drive.stop()
+
+    # Environment that points an app at the emulators
+    def env(self):
+        return {"OPENAI_BASE_URL": self.llm.base_url, "DRIVE_API_URL": self.drive.base_url}
+
+    def stats(self):
+        stats = {}
+        for name, url in (("llm", self.llm.base_url.rsplit("/v1", 1)[0]), ("drive", self.drive.base_url)):
+            with urllib.request.urlopen(f"{url}/_standin/stats", timeout=5) as response:
+                stats[name] = json.load(response)
+        return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a study app against local Drive and OpenAI emulators")
+    parser.add_argument("--app", help="streamlit app to start against the emulators")
+    parser.add_argument("--port", type=int, default=8501, help="port of the app")
+    parser.add_argument("--run-dir", default=str(Path(tempfile.gettempdir()) / "llm_study_emulators"))
+    parser.add_argument("--connect-ms", type=float, default=60.0, help="extra LLM delay on the first request of a connection")
+    add_arguments(parser, default_latency=800, prefix="llm-")
+    add_arguments(parser, default_latency=80, prefix="drive-")
+    args = parser.parse_args()
+
+    llm_latency, llm_faults = from_arguments(args, "llm-")
+    drive_latency, drive_faults = from_arguments(args, "drive-")
+    emulators = LocalEmulators(llm_latency, llm_faults, drive_latency, drive_faults, args.connect_ms / 1000).start()
+    run_dir = Path(args.run_dir)
+    run_dir.mkdir(parents=True, exist_ok=True)
+    secrets = run_dir / "secrets.toml"
+    secrets.write_text(SECRETS_TOML)
+    print(f"OpenAI emulator on {emulators.llm.base_url}: {llm_latency}, {llm_faults}")
+    print(f"Drive emulator on {emulators.drive.base_url}: {drive_latency}, {drive_faults}")
+
+    process = None
+    try:
+        if args.app:
+            env = {**os.environ, **emulators.env()}
+            process = start_replica(Path(args.app).resolve(), args.port, env, run_dir / "app.log", cwd=run_dir, secrets_file=secrets)
+            url = f"http://127.0.0.1:{args.port}"
+            if not wait_healthy(process, url):
+                raise SystemExit(f"The app did not start, see {run_dir / 'app.log'}")
+            print(f"{Path(args.app).name} on {url} (log: {run_dir / 'app.log'})", flush=True)
+        else:
+            print(" ".join(f"{name}={value}" for name, value in emulators.env().items())
+                  + f" streamlit run <app> --secrets.files {secrets}", flush=True)
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl-C reaches the app as well; shut down once
+        if process is not None:
+            process.terminate()
+            process.wait()
+        print(json.dumps(emulators.stats()))
+        emulators.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+# --- Compressed chat log archives ---
+# A log archive is a sequence of zstd frames, each holding the JSON lines of one saved batch
+# (normally one session). Frames are compressed with a dictionary trained on our own log rows,
+# which is what makes small frames compress well: the variant-1 "Company Values related to this
+# topic" / "Recommendations" boilerplate, the email skeletons and the row layout are already in
+# the dictionary. Appending a session means appending a frame, so old data is never recompressed,
+# and readers stream through all frames without materialising the whole file.
+#
+# Every frame names the dictionary it was written with (its dict_id), so an archive can mix
+# dictionaries. Each trained dictionary is kept as log_dictionary.<dict_id>.zdict next to the
+# current one (log_dictionary.zdict, used for new frames), and readers pick the one each frame
+# needs. Retraining therefore never makes older frames unreadable.
+#
+#   python log_archive.py train Chat_Logs_*.xlsx --out log_dictionary.zdict [--replace]
+#   python log_archive.py report Chat_Logs_Va_Knowledge.xlsx [--dictionary log_dictionary.zdict]
+#   python log_archive.py convert Chat_Logs_Va_Knowledge.xlsx Chat_Logs_Va_Knowledge.jsonl.zst
+#   python log_archive.py to-excel Chat_Logs_Va_Knowledge.jsonl.zst Chat_Logs_Va_Knowledge.xlsx
+
+import argparse
+import json
+import random
+import time
+from io import BytesIO
+from pathlib import Path
+
+import zstandard as zstd
+
+from turn_log import latest_by_turn_id
+
+ARCHIVE_MIMETYPE = "application/zstd"
+DEFAULT_DICTIONARY_FILE = "log_dictionary.zdict"
+DEFAULT_LEVEL = 19
+DEFAULT_DICT_SIZE = 64 * 1024
+
+
+ZSTD_MAGIC = 0xFD2FB528
+SKIPPABLE_MAGIC_MASK, SKIPPABLE_MAGIC = 0xFFFFFFF0, 0x184D2A50
+
+
+# The dictionary new frames are written with
+def load_dictionary(path=DEFAULT_DICTIONARY_FILE):
+    path = Path(path)
+    if not path.exists():
+        return None
+    return zstd.ZstdCompressionDict(path.read_bytes())
+
+
+# Where a dictionary is kept by id, e.g. log_dictionary.3735928559.zdict
+def dictionary_file(path, dict_id):
+    path = Path(path)
+    return path.with_name(f"{path.stem}.{dict_id}{path.suffix}")
+
+
+# Every dictionary frames may have been written with, by dict_id: the current one and the kept ones
+def load_dictionaries(path=DEFAULT_DICTIONARY_FILE):
+    path = Path(path)
+    dictionaries = {}
+    for candidate in [*sorted(path.parent.glob(f"{path.stem}.*{path.suffix}")), path]:
+        if candidate.exists():
+            dictionary = zstd.ZstdCompressionDict(candidate.read_bytes())
+            dictionaries[dictionary.dict_id()] = dictionary
+    return dictionaries
+
+
+def encode_rows(rows):
+    return b"".join(
+        json.dumps(row, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8") + b"\n"
+        for row in rows
+    )
+
+
+# One zstd frame for a batch of log rows; concatenate frames to append to an archive
+def compress_rows(rows, dictionary=None, level=DEFAULT_LEVEL):
+    compressor = zstd.ZstdCompressor(level=level, dict_data=dictionary, write_checksum=True)
+    return compressor.compress(encode_rows(rows))
+
+
+def append_rows(archive_bytes, rows, dictionary=None, level=DEFAULT_LEVEL):
+    return (archive_bytes or b"") + compress_rows(rows, dictionary=dictionary, level=level)
+
+
+def _read_exact(source, size):
+    data = source.read(size)
+    if len(data) != size:
+        raise zstd.ZstdError("archive ends inside a zstd frame")
+    return data
+
+
+# The frames of an archive one by one, found from the frame and block headers, so each can be
+# decompressed with its own dictionary
+def iter_frames(source):
+    while True:
+        magic = source.read(4)
+        if not magic:
+            return
+        if len(magic) != 4:
+            raise zstd.ZstdError("archive ends inside a zstd frame")
+        value = int.from_bytes(magic, "little")
+        if value & SKIPPABLE_MAGIC_MASK == SKIPPABLE_MAGIC:
+            _read_exact(source, int.from_bytes(_read_exact(source, 4), "little"))
+            continue
+        if value != ZSTD_MAGIC:
+            raise zstd.ZstdError("not a zstd frame")
+        descriptor = _read_exact(source, 1)[0]
+        single_segment = descriptor >> 5 & 1
+        header_size = (0 if single_segment else 1) + (0, 1, 2, 4)[descriptor & 3] + (single_segment, 2, 4, 8)[descriptor >> 6]
+        parts = [magic, bytes([descriptor]), _read_exact(source, header_size)]
+        last_block = False
+        while not last_block:
+            block_header = _read_exact(source, 3)
+            block = int.from_bytes(block_header, "little")
+            last_block = bool(block & 1)
+            parts += [block_header, _read_exact(source, 1 if (block >> 1 & 3) == 1 else block >> 3)]  # RLE blocks hold one byte
+        if descriptor >> 2 & 1:
+            parts.append(_read_exact(source, 4))  # content checksum
+        yield b"".join(parts)
+
+
+# Streams rows out of an archive (file object or bytes), across all frames. dictionaries maps
+# dict_id to dictionary (load_dictionaries); a single dictionary is accepted as well.
+def iter_archive_rows(source, dictionaries=None):
+    if isinstance(source, (bytes, bytearray)):
+        source = BytesIO(source)
+    if isinstance(dictionaries, zstd.ZstdCompressionDict):
+        dictionaries = {dictionaries.dict_id(): dictionaries}
+    dictionaries = dictionaries or {}
+    decompressors = {}
+    for frame in iter_frames(source):
+        dict_id = zstd.get_frame_parameters(frame).dict_id
+        if dict_id not in decompressors:
+            if dict_id and dict_id not in dictionaries:
+                raise zstd.ZstdError(f"frame written with dictionary {dict_id}, which is not loaded ({dictionary_file(DEFAULT_DICTIONARY_FILE, dict_id)})")
+            decompressors[dict_id] = zstd.ZstdDecompressor(dict_data=dictionaries.get(dict_id))
+        for line in decompressors[dict_id].decompressobj().decompress(frame).decode("utf-8").splitlines():
+            if line.strip():
+                yield json.loads(line)
+
+
+# Trained on complete log rows (keys, timestamps, ids, responses) with the participant prompts
+# blanked out, so the dictionary file never contains participant text
+def train_dictionary(rows, dict_size=DEFAULT_DICT_SIZE):
+    samples = [encode_rows([{**row, "prompt": ""}]) for row in rows]
+    return zstd.train_dictionary(dict_size, samples)
+
+
+# --- Reading log files in any of the formats we have on Drive ---
+def read_log_rows(path, dictionaries=None):
+    path = Path(path)
+    if path.suffix == ".zst":
+        with open(path, "rb") as f:
+            return list(iter_archive_rows(f, dictionaries))
+    if path.suffix == ".jsonl":
+        with open(path, encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+    import pandas as pd
+    return pd.read_excel(path).to_dict("records")
+
+
+# Merged view for analysis and export: the latest version of every turn id (a turn saved twice
+# appears twice in the archive), sorted by timestamp
+def merge_log_rows(rows):
+    import pandas as pd
+    latest = latest_by_turn_id(rows)
+    df = pd.DataFrame([{**row, "turn_id": turn_id} for turn_id, row in latest.items()])
+    if df.empty:
+        return df
+    return df.sort_values(by="timestamp", kind="stable").reset_index(drop=True)
+
+
+def rows_to_excel_bytes(rows):
+    import pandas as pd
+    buffer = BytesIO()
+    with pd.ExcelWriter(buffer, engine="openpyxl") as writer:
+        pd.DataFrame(rows).to_excel(writer, index=False, header=True)
+    return buffer.getvalue()
+
+
+def _group_by_session(rows):
+    sessions = {}
+    for row in rows:
+        sessions.setdefault(row["user_id"], []).append(row)
+    return list(sessions.values())
+
+
+def _throughput(fn, payload_bytes, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return payload_bytes / best / 2**20
+
+
+# Compression ratio and throughput of the candidate formats on a log sample. The dictionary is
+# trained on the responses of half of the sessions and measured on the other half, unless an
+# existing dictionary is given.
+def report(rows, dictionary=None, level=DEFAULT_LEVEL, seed=0):
+    sessions = _group_by_session(rows)
+    random.Random(seed).shuffle(sessions)
+    if dictionary is None:
+        train_half = sessions[: len(sessions) // 2] or sessions
+        dictionary = train_dictionary([row for session in train_half for row in session])
+        sessions = sessions[len(sessions) // 2:] or sessions
+    eval_rows = [row for session in sessions for row in session]
+    raw = encode_rows(eval_rows)
+    xlsx = rows_to_excel_bytes(eval_rows)
+
+    results = [("xlsx (current Drive format)", len(xlsx), None, None)]
+    whole = zstd.ZstdCompressor(level=level).compress(raw)
+    results.append((
+        f"zstd-{level}, whole file", len(whole),
+        _throughput(lambda: zstd.ZstdCompressor(level=level).compress(raw), len(raw)),
+        _throughput(lambda: zstd.ZstdDecompressor().decompress(whole), len(raw)),
+    ))
+    for label, dict_data in ((f"zstd-{level}, frame per session", None), (f"zstd-{level} + dictionary, frame per session", dictionary)):
+        archive = b"".join(compress_rows(session, dict_data, level) for session in sessions)
+        results.append((
+            label, len(archive),
+            _throughput(lambda: [compress_rows(session, dict_data, level) for session in sessions], len(raw)),
+            _throughput(lambda: list(iter_archive_rows(archive, dict_data)), len(raw)),
+        ))
+
+    print(f"{len(eval_rows)} rows in {len(sessions)} sessions, {len(raw) / 1024:.0f} KiB as JSON lines, dictionary {len(dictionary.as_bytes()) / 1024:.0f} KiB")
+    print(f"{'format':<44} {'KiB':>9} {'ratio':>7} {'enc MiB/s':>10} {'dec MiB/s':>10}")
+    for label, size, enc, dec in results:
+        enc_s = f"{enc:>10.1f}" if enc is not None else f"{'-':>10}"
+        dec_s = f"{dec:>10.1f}" if dec is not None else f"{'-':>10}"
+        print(f"{label:<44} {size / 1024:>9.1f} {len(raw) / size:>7.1f} {enc_s} {dec_s}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compressed chat log archives")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    train = sub.add_parser("train", help="train a dictionary on existing logs")
+    train.add_argument("logs", nargs="+")
+    train.add_argument("--out", default=DEFAULT_DICTIONARY_FILE)
+    train.add_argument("--size", type=int, default=DEFAULT_DICT_SIZE)
+    train.add_argument("--replace", action="store_true", help="make the new dictionary current if --out exists (the old one is kept by id)")
+
+    rep = sub.add_parser("report", help="compression ratio and throughput on a log sample")
+    rep.add_argument("log")
+    rep.add_argument("--dictionary")
+    rep.add_argument("--level", type=int, default=DEFAULT_LEVEL)
+
+    convert = sub.add_parser("convert", help="convert an Excel/JSONL log into an archive")
+    convert.add_argument("log")
+    convert.add_argument("out")
+    convert.add_argument("--dictionary", default=DEFAULT_DICTIONARY_FILE)
+
+    to_excel = sub.add_parser("to-excel", help="export an archive to Excel")
+    to_excel.add_argument("archive")
+    to_excel.add_argument("out")
+    to_excel.add_argument("--dictionary", default=DEFAULT_DICTIONARY_FILE)
+
+    args = parser.parse_args()
+    if args.command == "train":
+        out = Path(args.out)
+        current = load_dictionary(out)
+        if current is not None and not args.replace:
+            raise SystemExit(f"{out} exists and new frames are written with it; pass --replace to make a new dictionary current")
+        rows = [row for log in args.logs for row in read_log_rows(log, load_dictionaries())]
+        dictionary = train_dictionary(rows, dict_size=args.size)
+        # Every dictionary stays readable by id; the current file only says which one new frames use
+        for kept in (current, dictionary):
+            if kept is not None and not dictionary_file(out, kept.dict_id()).exists():
+                dictionary_file(out, kept.dict_id()).write_bytes(kept.as_bytes())
+        out.write_bytes(dictionary.as_bytes())
+        print(f"Trained dictionary {dictionary.dict_id()} on {len(rows)} log rows -> {out} ({dictionary_file(out, dictionary.dict_id()).name})")
+    elif args.command == "report":
+        dictionary = load_dictionary(args.dictionary) if args.dictionary else None
+        report(read_log_rows(args.log, load_dictionaries()), dictionary=dictionary, level=args.level)
+    elif args.command == "convert":
+        dictionary = load_dictionary(args.dictionary)
+        rows = read_log_rows(args.log)
+        archive = b"".join(compress_rows(session, dictionary) for session in _group_by_session(rows))
+        Path(args.out).write_bytes(archive)
+        print(f"{len(rows)} rows -> {args.out} ({len(archive) / 1024:.1f} KiB)")
+    elif args.command == "to-excel":
+        merged = merge_log_rows(read_log_rows(args.archive, load_dictionaries(args.dictionary)))
+        Path(args.out).write_bytes(rows_to_excel_bytes(merged))
+        print(f"{len(merged)} rows -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,424 @@
+# --- Compaction and integrity checks of the study logs ---
+# Over a study wave the chat logs on Drive are rewritten again and again (Chat_Logs_*.xlsx, the
+# zstd archives, the turn log of a replica) and nothing checks that every assigned participant's
+# turns survived. This job folds all of them into one dataset per study: Parquet files partitioned
+# by study and date (<out>/study=<study>/date=<YYYY-MM-DD>/turns.parquet), one row per turn id,
+# latest version only, sorted by user_id and timestamp. pd.read_parquet(<out>) reads it all.
+#
+# Runs are incremental. A manifest next to the partitions remembers how far every source was read
+# (byte offset of the append-only archives and JSON-lines files, content hash of Excel files) and
+# what every session looked like, so a run only reads the new frames and lines, rewrites the
+# partitions they fall into and re-checks the sessions they belong to. Every row carries a digest
+# of its content; a session's checksum is taken over its turn ids and digests.
+#
+# Each run writes an integrity report (_report.json) checked against the assignment records:
+# assigned participants without turns, chat tasks without turns, logged variants that differ from
+# the assignment, turns of unassigned participants, the same turn saved with different content,
+# and the same prompt/response logged under several turn ids. "verify" re-reads every partition
+# and compares row digests, session checksums and turn counts with the manifest.
+#
+#   python log_compaction.py compact Chat_Logs_Va_Knowledge.jsonl.zst Chat_Logs_Va_Knowledge.xlsx \
+#       --study Va_Knowledge --assignments Variant_Assignment_Va_Knowledge.csv --out study_data
+#   python log_compaction.py verify --study Va_Knowledge --assignments Variant_Assignment_Va_Knowledge.csv --out study_data
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from log_archive import DEFAULT_DICTIONARY_FILE, iter_archive_rows, load_dictionaries, read_log_rows
+from turn_log import encode_row, row_turn_id
+from turn_records import LOG_COLUMNS
+
+MANIFEST_FILE = "_manifest.json"
+REPORT_FILE = "_report.json"
+PARTITION_FILE = "turns.parquet"
+# Chat tasks of the apps (the distractor task after them has no chat)
+DEFAULT_CHAT_TASKS = 5
+# Bytes before the last read offset that must be unchanged for a source to be read incrementally
+TAIL_CHECK_BYTES = 4096
+
+SCHEMA = pa.schema([
+    ("turn_id", pa.string()),
+    ("timestamp", pa.timestamp("us")),
+    ("user_id", pa.string()),
+    ("variant", pa.string()),
+    ("task_index", pa.int32()),
+    ("prompt", pa.string()),
+    ("response", pa.string()),
+    ("prompt_tokens", pa.int64()),
+    ("completion_tokens", pa.int64()),
+    ("cached_tokens", pa.int64()),
+    ("cost_usd", pa.float64()),
+    ("box", pa.string()),
+    ("model_prompt", pa.string()),
+    ("digest", pa.string()),
+])
+assert SCHEMA.names == [*LOG_COLUMNS, "digest"]
+
+
+# --- Rows ---
+def _missing(value):
+    return value is None or value != value or value == ""
+
+
+def _timestamp(value):
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    elif hasattr(value, "to_pydatetime"):
+        value = value.to_pydatetime()
+    return value.replace(tzinfo=None)
+
+
+def _optional(cast, value):
+    return None if _missing(value) else cast(value)
+
+
+# Fixed types for every column, whichever file the row came from (Excel turns ids into numbers and
+# empty cells into NaN), and the digest of exactly these values
+def normalize_row(row):
+    normalized = {
+        "turn_id": str(row_turn_id(row)),
+        "timestamp": _timestamp(row["timestamp"]),
+        "user_id": str(row["user_id"]),
+        "variant": str(row["variant"]),
+        "task_index": int(row["task_index"]),
+        "prompt": "" if _missing(row.get("prompt")) else str(row["prompt"]),
+        "response": "" if _missing(row.get("response")) else str(row["response"]),
+        "prompt_tokens": _optional(int, row.get("prompt_tokens")),
+        "completion_tokens": _optional(int, row.get("completion_tokens")),
+        "cached_tokens": _optional(int, row.get("cached_tokens")),
+        "cost_usd": _optional(float, row.get("cost_usd")),
+        "box": None if not isinstance(row.get("box"), str) else row["box"],
+        "model_prompt": None if not isinstance(row.get("model_prompt"), str) else row["model_prompt"],
+    }
+    normalized["digest"] = row_digest(normalized)
+    return normalized
+
+
+# model_prompt only counts when set, so rows compacted before the column keep their digests
+def row_digest(row):
+    values = {name: row.get(name) for name in LOG_COLUMNS if name != "model_prompt" or row.get("model_prompt") is not None}
+    return hashlib.blake2b(encode_row(values), digest_size=12).hexdigest()
+
+
+def session_checksum(rows):
+    digest = hashlib.blake2b(digest_size=16)
+    for turn_id, row_hash in sorted((row["turn_id"], row["digest"]) for row in rows):
+        digest.update(f"{turn_id}\t{row_hash}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _sort_key(row):
+    return row["user_id"], row["timestamp"], row["turn_id"]
+
+
+# --- Sources ---
+def _tail_digest(path, offset):
+    with open(path, "rb") as f:
+        f.seek(max(0, offset - TAIL_CHECK_BYTES))
+        return hashlib.sha256(f.read(min(offset, TAIL_CHECK_BYTES))).hexdigest()
+
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(2**20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Rows added to a source since the position in state, and the new state. Archives and JSON-lines
+# files only grow, so reading continues at the old offset unless the bytes before it changed (the
+# file was replaced); Excel files are read again whenever their content changed.
+def read_new_rows(path, state, dictionaries=None):
+    path = Path(path)
+    state = state or {}
+    if path.suffix not in (".zst", ".jsonl"):
+        digest = _file_digest(path)
+        if state.get("sha256") == digest:
+            return [], state
+        return read_log_rows(path, dictionaries), {"sha256": digest, "bytes": path.stat().st_size}
+
+    size = path.stat().st_size
+    offset = state.get("offset", 0)
+    if offset > size or state.get("tail_digest") != _tail_digest(path, offset):
+        offset = 0
+    with open(path, "rb") as f:
+        f.seek(offset)
+        if path.suffix == ".zst":
+            rows = list(iter_archive_rows(f, dictionaries))
+            end = size
+        else:
+            data = f.read()
+            data = data[: data.rfind(b"\n") + 1]  # a line still being written is read next time
+            rows = [json.loads(line) for line in data.splitlines() if line.strip()]
+            end = offset + len(data)
+    return rows, {"offset": end, "tail_digest": _tail_digest(path, end), "bytes": end - offset}
+
+
+def read_assignments(path):
+    if path is None or not Path(path).exists():
+        return {}
+    df = pd.read_csv(path, dtype=str, keep_default_na=False)
+    return {row["user_id"]: row for row in df.to_dict("records")}
+
+
+# --- Compaction ---
+class StudyCompactor:
+    def __init__(self, out_dir, study, dictionaries=None, chat_tasks=DEFAULT_CHAT_TASKS):
+        self.study = study
+        self.directory = Path(out_dir) / f"study={study}"
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.dictionaries = dictionaries
+        self.chat_tasks = chat_tasks
+        self.manifest = self._load_manifest()
+
+    def _load_manifest(self):
+        path = self.directory / MANIFEST_FILE
+        if path.exists():
+            return json.loads(path.read_text())
+        return {"study": self.study, "sources": {}, "partitions": {}, "sessions": {}}
+
+    def _write_json(self, name, content):
+        tmp_path = self.directory / f".{name}.tmp"
+        tmp_path.write_text(json.dumps(content, indent=1, default=str))
+        os.replace(tmp_path, self.directory / name)
+
+    def partition_path(self, date):
+        return self.directory / f"date={date}" / PARTITION_FILE
+
+    def read_partition(self, date, user_ids=None):
+        path = self.partition_path(date)
+        if not path.exists():
+            return []
+        filters = [("user_id", "in", sorted(user_ids))] if user_ids is not None else None
+        return pq.read_table(path, schema=SCHEMA, filters=filters).to_pylist()
+
+    def _write_partition(self, date, rows):
+        path = self.partition_path(date)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.parent / f".{PARTITION_FILE}.tmp"
+        pq.write_table(pa.Table.from_pylist(sorted(rows, key=_sort_key), schema=SCHEMA), tmp_path, compression="zstd")
+        os.replace(tmp_path, path)
+        self.manifest["partitions"][date] = {"rows": len(rows), "bytes": path.stat().st_size}
+
+    # Reads what is new in the sources, merges it into the partitions and re-checks the sessions
+    # it touched. The manifest is written last, so an interrupted run repeats the same merge.
+    def compact(self, sources, assignments_path=None):
+        started = time.perf_counter()
+        stats = {"source_rows": 0, "source_bytes": 0, "new_turns": 0, "updated_turns": 0, "resaved_turns": 0, "partitions_written": 0}
+        new_rows = []
+        source_states = {}
+        for source in sources:
+            key = str(Path(source).resolve())
+            rows, source_states[key] = read_new_rows(source, self.manifest["sources"].get(key), self.dictionaries)
+            stats["source_bytes"] += source_states[key].get("bytes", 0) if rows else 0
+            new_rows.extend(normalize_row(row) for row in rows)
+        stats["source_rows"] = len(new_rows)
+
+        by_date = {}
+        for row in new_rows:
+            by_date.setdefault(row["timestamp"].date().isoformat(), []).append(row)
+        touched = {row["user_id"] for row in new_rows}
+        conflicts = {}
+        session_rows = {}
+        for date, rows in sorted(by_date.items()):
+            merged = {row["turn_id"]: row for row in self.read_partition(date)}
+            changed = False
+            for row in rows:
+                current = merged.get(row["turn_id"])
+                if current is None:
+                    stats["new_turns"] += 1
+                elif current["digest"] == row["digest"]:
+                    stats["resaved_turns"] += 1
+                    continue
+                else:
+                    stats["updated_turns"] += 1
+                    conflicts.setdefault(row["user_id"], set()).add(row["turn_id"])
+                merged[row["turn_id"]] = row  # last write wins, as in the turn log
+                changed = True
+            if changed:
+                self._write_partition(date, list(merged.values()))
+                stats["partitions_written"] += 1
+            for row in merged.values():
+                if row["user_id"] in touched:
+                    session_rows.setdefault(row["user_id"], []).append(row)
+
+        # Turns of the touched sessions in partitions this run did not rewrite
+        for user_id in touched:
+            for date in self.manifest["sessions"].get(user_id, {}).get("dates", []):
+                if date not in by_date:
+                    session_rows.setdefault(user_id, []).extend(self.read_partition(date, [user_id]))
+        for user_id, rows in session_rows.items():
+            previous = self.manifest["sessions"].get(user_id, {})
+            self.manifest["sessions"][user_id] = self._session_entry(rows, previous, conflicts.get(user_id, set()))
+
+        self.manifest["sources"].update(source_states)
+        self.manifest["updated"] = datetime.now().isoformat(timespec="seconds")
+        self._write_json(MANIFEST_FILE, self.manifest)
+        stats["sessions_checked"] = len(session_rows)
+        stats["seconds"] = round(time.perf_counter() - started, 3)
+        return self.report(read_assignments(assignments_path), stats)
+
+    def _session_entry(self, rows, previous, conflicts):
+        tasks = {}
+        by_content = {}
+        for row in rows:
+            tasks[str(row["task_index"])] = tasks.get(str(row["task_index"]), 0) + 1
+            by_content.setdefault((row["task_index"], row["prompt"], row["response"]), []).append(row["turn_id"])
+        return {
+            "turns": len(rows),
+            "checksum": session_checksum(rows),
+            "variants": sorted({row["variant"] for row in rows}),
+            "tasks": dict(sorted(tasks.items(), key=lambda item: int(item[0]))),
+            "dates": sorted({row["timestamp"].date().isoformat() for row in rows}),
+            "first": min(row["timestamp"] for row in rows).isoformat(),
+            "last": max(row["timestamp"] for row in rows).isoformat(),
+            "duplicates": sorted(sorted(turn_ids) for turn_ids in by_content.values() if len(turn_ids) > 1),
+            "conflicting_versions": sorted(set(previous.get("conflicting_versions", [])) | conflicts),
+        }
+
+    # --- Integrity report ---
+    # Issues of the whole study from the manifest and the assignment records; reading no partition
+    def report(self, assignments, stats=None, extra_issues=()):
+        sessions = self.manifest["sessions"]
+        issues = []
+        for user_id, assignment in sorted(assignments.items()):
+            session = sessions.get(user_id)
+            if session is None:
+                issues.append({"kind": "no_turns", "user_id": user_id, "variant": assignment.get("variant"), "assigned_at": assignment.get("assigned_at")})
+                continue
+            if session["variants"] != [assignment.get("variant")]:
+                issues.append({"kind": "variant_mismatch", "user_id": user_id, "assigned": assignment.get("variant"), "logged": session["variants"]})
+        for user_id, session in sorted(sessions.items()):
+            if assignments and user_id not in assignments:
+                issues.append({"kind": "unassigned", "user_id": user_id, "turns": session["turns"]})
+            missing = [task for task in range(self.chat_tasks) if str(task) not in session["tasks"]]
+            if missing:
+                issues.append({"kind": "missing_tasks", "user_id": user_id, "tasks": missing, "turns": session["turns"]})
+            for turn_ids in session["duplicates"]:
+                issues.append({"kind": "duplicate_turn", "user_id": user_id, "turn_ids": turn_ids})
+            if session["conflicting_versions"]:
+                issues.append({"kind": "conflicting_versions", "user_id": user_id, "turn_ids": session["conflicting_versions"]})
+        issues.extend(extra_issues)
+
+        counts = {}
+        for issue in issues:
+            counts[issue["kind"]] = counts.get(issue["kind"], 0) + 1
+        report = {
+            "study": self.study,
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "run": stats or {},
+            "sessions": len(sessions),
+            "turns": sum(session["turns"] for session in sessions.values()),
+            "assigned": len(assignments),
+            "partitions": len(self.manifest["partitions"]),
+            "issue_counts": counts,
+            "issues": issues,
+        }
+        self._write_json(REPORT_FILE, report)
+        return report
+
+    # Re-reads every partition: row digests against the row content, session checksums and turn
+    # counts against the manifest, turns listed in the manifest but found in no partition
+    def verify(self, assignments_path=None):
+        started = time.perf_counter()
+        issues = []
+        session_rows = {}
+        rows_read = 0
+        for date in sorted(self.manifest["partitions"]):
+            if not self.partition_path(date).exists():
+                issues.append({"kind": "missing_partition", "date": date})
+                continue
+            seen = set()
+            for row in self.read_partition(date):
+                rows_read += 1
+                if row_digest(row) != row["digest"]:
+                    issues.append({"kind": "digest_mismatch", "user_id": row["user_id"], "turn_id": row["turn_id"], "date": date})
+                if row["turn_id"] in seen:
+                    issues.append({"kind": "duplicate_row", "user_id": row["user_id"], "turn_id": row["turn_id"], "date": date})
+                seen.add(row["turn_id"])
+                session_rows.setdefault(row["user_id"], []).append(row)
+        for user_id, session in sorted(self.manifest["sessions"].items()):
+            rows = session_rows.get(user_id, [])
+            if len(rows) != session["turns"]:
+                issues.append({"kind": "count_mismatch", "user_id": user_id, "manifest": session["turns"], "found": len(rows)})
+            elif session_checksum(rows) != session["checksum"]:
+                issues.append({"kind": "checksum_mismatch", "user_id": user_id})
+        for user_id in sorted(set(session_rows) - set(self.manifest["sessions"])):
+            issues.append({"kind": "not_in_manifest", "user_id": user_id, "turns": len(session_rows[user_id])})
+        stats = {"rows_read": rows_read, "seconds": round(time.perf_counter() - started, 3)}
+        return self.report(read_assignments(assignments_path), stats, issues)
+
+
+def fetch_from_drive(file_names, secrets_path, directory):
+    from storage_sync import drive_ops_from_secrets
+
+    drive_ops = drive_ops_from_secrets(secrets_path)
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for name in file_names:
+        content = drive_ops.download(name)
+        if content is None:
+            print(f"{name} is not on Drive", file=sys.stderr)
+            continue
+        (directory / name).write_bytes(content)
+        paths.append(directory / name)
+    return paths
+
+
+def print_report(report):
+    run = ", ".join(f"{key} {value}" for key, value in report["run"].items())
+    print(f"{report['study']}: {report['sessions']} sessions, {report['turns']} turns, {report['assigned']} assigned, {report['partitions']} partitions ({run})")
+    for kind, count in sorted(report["issue_counts"].items()):
+        print(f"  {kind:<22} {count}")
+    if not report["issues"]:
+        print("  no issues")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compact the study logs into Parquet and check them against the assignments")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name, help_text in (("compact", "merge new log rows into the dataset and report"), ("verify", "re-read the whole dataset and report")):
+        command = sub.add_parser(name, help=help_text)
+        command.add_argument("--study", required=True)
+        command.add_argument("--out", required=True, help="dataset directory")
+        command.add_argument("--assignments", help="Variant_Assignment_<study>.csv")
+        command.add_argument("--chat-tasks", type=int, default=DEFAULT_CHAT_TASKS, help="tasks every finished session has turns for")
+        command.add_argument("--fail-on-issues", action="store_true", help="exit with status 1 if the report lists issues")
+    compact = sub.choices["compact"]
+    compact.add_argument("logs", nargs="+", help="log archives (.jsonl.zst), JSON lines (turn log turns.jsonl) or Excel logs")
+    compact.add_argument("--dictionary", default=DEFAULT_DICTIONARY_FILE)
+    compact.add_argument("--secrets", help="download the logs and the assignments from Drive first; the names are Drive file names")
+    args = parser.parse_args()
+
+    compactor = StudyCompactor(args.out, args.study, chat_tasks=args.chat_tasks)
+    if args.command == "compact":
+        logs, assignments = args.logs, args.assignments
+        if args.secrets:
+            download_dir = compactor.directory / "_sources"
+            logs = fetch_from_drive(args.logs, args.secrets, download_dir)
+            if assignments:
+                assignments = next(iter(fetch_from_drive([assignments], args.secrets, download_dir)), None)
+        compactor.dictionaries = load_dictionaries(args.dictionary)
+        report = compactor.compact(logs, assignments)
+    else:
+        report = compactor.verify(args.assignments)
+    print_report(report)
+    print(f"Report: {compactor.directory / REPORT_FILE}")
+    if args.fail_on_issues and report["issues"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+# --- Local stand-in for the OpenAI HTTP API ---
+# A small HTTP/1.1 server (keep-alive, no TLS) implementing POST /v1/chat/completions and
+# GET /v1/models/<id> with OpenAI-shaped responses. Every request waits a latency drawn from the
+# configured distribution, and every new connection waits a setup delay before its first
+# response, standing in for the TCP and TLS handshakes to the real API. Requests with
+# "stream": true get server-sent events, one chunk per word, with the latency spread over the
+# chunks; a client that closes the stream early stops the generation (counted as a cancelled
+# stream). Injected faults answer with a 503 server error or a 429 rate limit with Retry-After,
+# shaped like the API's, so the openai client's retries can be watched at work (see
+# fault_injection.py). GET /_standin/stats returns the connections, requests, streamed chunks
+# and faults seen, so client configurations can be compared without an API key.
+#
+#   python openai_standin.py [--port 8765] [--latency-ms 300] [--connect-ms 60]
+#   python openai_standin.py --latency lognormal:800,0.5 --rate-limit-rate 0.05 --retry-after-s 2
+#   OPENAI_BASE_URL=http://127.0.0.1:8765/v1 streamlit run Feedback_Va_Knowledge.py
+
+import argparse
+import asyncio
+import json
+import threading
+import time
+import uuid
+
+from fault_injection import add_arguments, from_arguments
+
+REASONS = {200: "OK", 404: "Not Found", 429: "Too Many Requests", 503: "Service Unavailable"}
+
+
+class OpenAIStandIn:
+    # latency_s: seconds, or a fault_injection.LatencyModel; faults: a fault_injection.FaultPlan
+    def __init__(self, host="127.0.0.1", port=0, latency_s=0.3, connect_s=0.06, faults=None):
+        self.host = host
+        self.port = port
+        self.latency_s = latency_s
+        self.connect_s = connect_s
+        self.faults = faults
+        self.stats = {
+            "connections": 0, "open_connections": 0, "peak_open_connections": 0, "requests": 0,
+            "streams": 0, "streamed_chunks": 0, "streams_cancelled": 0,
+        }
+        self._loop = None
+        self._server = None
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}/v1"
+
+    def _latency(self):
+        return self.latency_s() if callable(self.latency_s) else self.latency_s
+
+    def _fault_reply(self, fault):
+        if fault == "rate_limit":
+            retry_after = self.faults.retry_after_s
+            return 429, {"error": {
+                "message": f"Rate limit reached for requests (stand-in). Please try again in {retry_after:g}s.",
+                "type": "requests", "param": None, "code": "rate_limit_exceeded",
+            }}, {"retry-after": f"{retry_after:g}", "x-ratelimit-reset-requests": f"{retry_after:g}s"}
+        return 503, {"error": {"message": "The server is overloaded (stand-in).", "type": "server_error", "param": None, "code": None}}, {}
+
+    def _reply(self, path, body):
+        if path == "/_standin/stats":
+            return 200, {**self.stats, **(self.faults.stats if self.faults else {})}
+        if path.startswith("/v1/models/"):
+            return 200, {"id": path.rsplit("/", 1)[1], "object": "model", "created": 0, "owned_by": "standin"}
+        if path == "/v1/chat/completions":
+            request = json.loads(body or b"{}")
+            prompt = request.get("messages", [{}])[-1].get("content", "")
+            prompt_tokens = sum(len(str(m.get("content", "")).split()) for m in request.get("messages", []))
+            content = f"Stand-in answer to: {prompt[:200]}"
+            return 200, {
+                "id": f"chatcmpl-{uuid.uuid4().hex[:12]}", "object": "chat.completion", "created": int(time.time()),
+                "model": request.get("model", "standin"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(content.split()), "total_tokens": prompt_tokens + len(content.split())},
+            }
+        return 404, {"error": {"message": f"unknown path {path}"}}
+
+    async def _handle(self, reader, writer):
+        self.stats["connections"] += 1
+        self.stats["open_connections"] += 1
+        self.stats["peak_open_connections"] = max(self.stats["peak_open_connections"], self.stats["open_connections"])
+        first = True
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                close = headers.get("connection", "").lower() == "close"
+                extra_headers = {}
+                if path.startswith("/_standin/"):
+                    status, payload = self._reply(path.split("?", 1)[0], body)
+                else:
+                    self.stats["requests"] += 1
+                    setup_s = self.connect_s if first else 0.0
+                    first = False
+                    fault = self.faults.draw() if self.faults else None
+                    if fault is not None:
+                        # A rate limit is refused at once, a server error after the usual wait
+                        await asyncio.sleep(setup_s + (self._latency() if fault == "error" else 0.0))
+                        status, payload, extra_headers = self._fault_reply(fault)
+                    elif path == "/v1/chat/completions" and json.loads(body or b"{}").get("stream"):
+                        await asyncio.sleep(setup_s)
+                        if not await self._stream(writer, self._reply(path, body)[1]):
+                            break
+                        continue
+                    else:
+                        await asyncio.sleep(self._latency() + setup_s)
+                        status, payload = self._reply(path.split("?", 1)[0], body)
+                data = json.dumps(payload).encode()
+                writer.write(
+                    f"HTTP/1.1 {status} {REASONS.get(status, 'Error')}\r\ncontent-type: application/json\r\n"
+                    f"content-length: {len(data)}\r\nconnection: {'close' if close else 'keep-alive'}\r\n".encode()
+                    + "".join(f"{name}: {value}\r\n" for name, value in extra_headers.items()).encode() + b"\r\n" + data
+                )
+                await writer.drain()
+                if close:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            self.stats["open_connections"] -= 1
+            writer.close()
+
+    # Sends a completion as server-sent events (chunked encoding); False if the client went away
+    async def _stream(self, writer, completion):
+        self.stats["streams"] += 1
+        words = completion["choices"][0]["message"]["content"].split(" ")
+        base = {"id": completion["id"], "object": "chat.completion.chunk", "created": completion["created"], "model": completion["model"]}
+        events = [
+            {**base, "choices": [{"index": 0, "delta": {"role": "assistant", "content": word if i == 0 else " " + word}, "finish_reason": None}]}
+            for i, word in enumerate(words)
+        ]
+        events.append({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+        events.append({**base, "choices": [], "usage": completion["usage"]})
+        latency_s = self._latency()
+        writer.write(b"HTTP/1.1 200 OK\r\ncontent-type: text/event-stream\r\ntransfer-encoding: chunked\r\nconnection: keep-alive\r\n\r\n")
+        try:
+            for i, event in enumerate(events):
+                await asyncio.sleep(latency_s / len(words) if i < len(words) else 0.0)
+                data = f"data: {json.dumps(event)}\n\n".encode()
+                writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                await writer.drain()
+                if i < len(words):
+                    self.stats["streamed_chunks"] += 1
+            data = b"data: [DONE]\n\n"
+            writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n0\r\n\r\n")
+            await writer.drain()
+            return True
+        except ConnectionError:
+            self.stats["streams_cancelled"] += 1
+            return False
+
+    # Serves on a background thread; port 0 picks a free port
+    def start(self):
+        ready = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            self._server = self._loop.run_until_complete(asyncio.start_server(self._handle, self.host, self.port, backlog=1024))
+            self.port = self._server.sockets[0].getsockname()[1]
+            ready.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name="openai-standin", daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self
+
+    def stop(self):
+        self._loop.call_soon_threadsafe(self._server.close)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the OpenAI chat completions API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, help="fixed latency, same as --latency MS")
+    parser.add_argument("--connect-ms", type=float, default=60.0, help="extra delay on the first request of a connection")
+    add_arguments(parser, default_latency=300)
+    args = parser.parse_args()
+    if args.latency_ms is not None:
+        args.latency = str(args.latency_ms)
+    latency, faults = from_arguments(args)
+    standin = OpenAIStandIn(args.host, args.port, latency, args.connect_ms / 1000, faults).start()
+    print(f"OpenAI stand-in on {standin.base_url}", flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        standin.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+# --- Operator dashboard ---
+# Shown instead of the study when the app is opened with ?operator=<st.secrets["operator_token"]>.
+# Everything on it comes from in-process aggregates (study_metrics.StudyMetrics, the usage
+# ledger, the session memory manager, DriveOps) and one grouped query on the local assignment
+# database, so a refresh never touches the chat log on Drive.
+
+from datetime import datetime
+
+import pandas as pd
+import streamlit as st
+
+from query_tokens import query_token_matches
+
+REFRESH_SECONDS = 5
+
+
+def dashboard_requested(query_params, secret_token):
+    return query_token_matches(query_params, "operator", secret_token)
+
+
+# sources: callables returning metrics, usage_ledger, session_manager, drive_ops, allocator and
+# optionally llm_client, generations, state_backend, storage_sync and speculation. A source that
+# raises shows its error inline in its own section; the rest of the page still renders.
+def render_operator_dashboard(study_name, variants, sources):
+    st.title(f"Operator dashboard: {study_name}")
+
+    @st.fragment(run_every=REFRESH_SECONDS)
+    def live_panel():
+        metrics = sources["metrics"]()
+        st.caption(f"Updated {datetime.now():%H:%M:%S}, every {REFRESH_SECONDS} s. Process up since {datetime.fromtimestamp(metrics.started_at):%Y-%m-%d %H:%M}.")
+
+        # --- Participants ---
+        st.subheader("Participants")
+        live = metrics.live_participants()
+        try:
+            allocation = sources["allocator"]().counts()
+        except Exception as e:
+            st.warning(f"Assignment database unavailable: {e}")
+            allocation = {}
+        turns = metrics.turns_by_variant()
+        tasks = metrics.tasks_completed()
+        rows = []
+        for variant in [*variants, *sorted(set(live) - set(variants))]:
+            rows.append({
+                "variant": variant,
+                "live": live.get(variant, 0),
+                "confirmed": allocation.get(variant, {}).get("confirmed", 0),
+                "leased": allocation.get(variant, {}).get("leased", 0),
+                "turns": turns.get(variant, 0),
+                "tasks completed": sum(n for (v, _), n in tasks.items() if v == variant),
+            })
+        st.dataframe(pd.DataFrame(rows), hide_index=True, width="stretch")
+
+        if tasks:
+            completed = pd.DataFrame(
+                [{"variant": v, "task": task_index + 1, "completed": n} for (v, task_index), n in tasks.items()]
+            ).pivot_table(index="task", columns="variant", values="completed", fill_value=0)
+            st.caption("Completed tasks per variant")
+            st.dataframe(completed, width="stretch")
+
+        # --- Throughput ---
+        st.subheader("Turns per minute")
+        series = metrics.turns_per_minute(minutes=30)
+        last_minutes = [n for _, n in series[-5:]]
+        st.metric("Last 5 minutes (mean)", f"{sum(last_minutes) / len(last_minutes):.1f}")
+        st.bar_chart(pd.DataFrame(
+            {"turns": [n for _, n in series]},
+            index=[datetime.fromtimestamp(ts).strftime("%H:%M") for ts, _ in series],
+        ))
+
+        # --- Latency and errors ---
+        st.subheader("Calls")
+        operations = metrics.operations()
+        if operations:
+            st.dataframe(pd.DataFrame(operations), hide_index=True, width="stretch", column_config={
+                "error_rate": st.column_config.NumberColumn(format="percent"),
+                "p50_ms": st.column_config.NumberColumn(format="%.0f"),
+                "p95_ms": st.column_config.NumberColumn(format="%.0f"),
+                "p99_ms": st.column_config.NumberColumn(format="%.0f"),
+            })
+        else:
+            st.write("No LLM or Drive calls yet.")
+
+        # --- Process ---
+        st.subheader("Process")
+        columns = st.columns(2)
+        for column, name, title in ((columns[0], "session_manager", "Session memory"), (columns[1], "drive_ops", "Drive")):
+            with column:
+                st.caption(title)
+                try:
+                    st.json(sources[name]().stats())
+                except Exception as e:
+                    st.warning(f"Unavailable: {e}")
+        for name, title in (("llm_client", "LLM connection pool"), ("generations", "Prompt generations"), ("state_backend", "Shared state backend"), ("storage_sync", "Storage sync daemon"), ("speculation", "Speculative revisions")):
+            try:
+                status = sources.get(name, lambda: None)()
+            except Exception as e:
+                st.caption(title)
+                st.warning(f"Unavailable: {e}")
+                continue
+            if status is not None:
+                st.caption(title)
+                st.json(status)
+
+        st.subheader("Token usage per arm")
+        try:
+            usage = [{"variant": variant, **totals} for (study, variant), totals in sources["usage_ledger"]().by_arm().items() if study == study_name]
+        except Exception as e:
+            st.warning(f"Unavailable: {e}")
+            usage = None
+        if usage:
+            st.dataframe(pd.DataFrame(usage), hide_index=True, width="stretch")
+        elif usage is not None:
+            st.write("No usage recorded yet.")
+
+    live_panel()
@@ -0,0 +1,188 @@
+# --- Opt-in sampling profiler for reruns and LLM/Drive calls ---
+# A background thread samples the stack of the profiled thread every few milliseconds and
+# counts identical stacks. Each profile writes two files into the profile directory:
+#   <time>-<label>.collapsed  one "frame;frame;frame count" line per stack (flamegraph.pl,
+#                             speedscope and inferno read this format)
+#   <time>-<label>.txt        wall time and the top-N functions and lines by sample count
+# A rerun profile ends when the script's module frame leaves the stack, so reruns that end in
+# st.rerun(), st.stop() or an exception are captured as well. Nothing runs unless enabled.
+#
+#   python profiling.py summary /tmp/llm_study_profiles/Va_Knowledge/*.collapsed
+
+import argparse
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import nullcontext
+from datetime import datetime
+from pathlib import Path
+
+from query_tokens import query_token_matches
+
+# Pure-Python code only yields the GIL every sys.getswitchinterval() (5 ms), so sampling faster
+# mostly adds overhead
+DEFAULT_INTERVAL_S = 0.005
+DEFAULT_TOP_N = 25
+# Hard stop for a single profile, e.g. a session that is waiting on a hung request
+MAX_PROFILE_SECONDS = 300
+
+NO_PROFILE = nullcontext()
+
+
+# Enabled for every rerun with PROFILE_RERUNS=1, or per session with ?profile=<token> where
+# the token matches st.secrets["profiling_token"]
+def profiling_requested(query_params, secret_token):
+    if os.environ.get("PROFILE_RERUNS") == "1":
+        return True
+    return query_token_matches(query_params, "profile", secret_token)
+
+
+# Current line rather than the first line of the function: most of a Streamlit script runs in
+# its <module> frame, so the line is the only thing that tells its parts apart
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({Path(code.co_filename).name}:{frame.f_lineno})".replace(";", ":")
+
+
+def _function_name(frame_name):
+    return frame_name.rsplit(":", 1)[0] + ")"
+
+
+# Frames from root_frame down to the sampled frame, outermost first; None once root_frame is gone
+def _stack_below(frame, root_frame):
+    stack = []
+    while frame is not None:
+        stack.append(_frame_name(frame))
+        if frame is root_frame:
+            stack.reverse()
+            return tuple(stack)
+        frame = frame.f_back
+    return None
+
+
+class _Sampler:
+    def __init__(self, profiler, label, thread_id, root_frame):
+        self.profiler = profiler
+        self.label = label
+        self.thread_id = thread_id
+        self.root_frame = root_frame
+        self.stacks = Counter()
+        self.started = time.perf_counter()
+        self.wall_s = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"profiler-{label}", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        interval = self.profiler.interval_s
+        deadline = self.started + MAX_PROFILE_SECONDS
+        while not self._stop.wait(interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = _stack_below(frame, self.root_frame) if frame is not None else None
+            if stack is None or time.perf_counter() > deadline:
+                break
+            self.stacks[stack] += 1
+        self.wall_s = time.perf_counter() - self.started
+        self.root_frame = None
+        self.profiler._write(self)
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+class _CallProfile:
+    def __init__(self, profiler, label):
+        self.profiler = profiler
+        self.label = label
+        self._sampler = None
+
+    def __enter__(self):
+        self._sampler = _Sampler(self.profiler, self.label, threading.get_ident(), sys._getframe(1))
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._sampler.stop()
+        return False
+
+
+class Profiler:
+    def __init__(self, out_dir, interval_s=DEFAULT_INTERVAL_S, top_n=DEFAULT_TOP_N):
+        self.out_dir = Path(out_dir)
+        self.interval_s = interval_s
+        self.top_n = top_n
+        self._lock = threading.Lock()
+        self._counter = 0
+
+    # Call at the top of the script; profiles this rerun until the calling module frame returns
+    def start_rerun(self, label="rerun"):
+        _Sampler(self, label, threading.get_ident(), sys._getframe(1))
+
+    # Context manager profiling one block, e.g. a single LLM or Drive call
+    def call(self, label):
+        return _CallProfile(self, label)
+
+    def _write(self, sampler):
+        with self._lock:
+            self._counter += 1
+            counter = self._counter
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        stem = f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{counter:04d}-{sampler.label}"
+        collapsed = self.out_dir / f"{stem}.collapsed"
+        collapsed.write_text(
+            "".join(f"{';'.join(stack)} {count}\n" for stack, count in sampler.stacks.most_common()),
+            encoding="utf-8",
+        )
+        header = f"{sampler.label}: {sampler.wall_s * 1000:.1f} ms wall, {sum(sampler.stacks.values())} samples every {self.interval_s * 1000:g} ms"
+        (self.out_dir / f"{stem}.txt").write_text(header + "\n\n" + top_functions(sampler.stacks, self.top_n), encoding="utf-8")
+
+
+# Top-N functions by self samples (innermost frame) and by total samples (anywhere on the
+# stack), and the top-N lines by self samples
+def top_functions(stacks, top_n=DEFAULT_TOP_N):
+    total = sum(stacks.values()) or 1
+    own = Counter()
+    inclusive = Counter()
+    own_lines = Counter()
+    for stack, count in stacks.items():
+        own[_function_name(stack[-1])] += count
+        own_lines[stack[-1]] += count
+        for name in {_function_name(frame_name) for frame_name in stack}:
+            inclusive[name] += count
+    lines = []
+    for title, counts in (("self", own), ("total", inclusive), ("self, per line", own_lines)):
+        lines.append(f"{'samples':>8} {'%':>6}  top {top_n} by {title}")
+        for name, count in counts.most_common(top_n):
+            lines.append(f"{count:>8} {100 * count / total:>5.1f}%  {name}")
+        lines.append("")
+    return "\n".join(lines)
+
+
+def read_collapsed(path):
+    stacks = Counter()
+    for line in Path(path).read_text(encoding="utf-8").splitlines():
+        stack, _, count = line.rpartition(" ")
+        if stack:
+            stacks[tuple(stack.split(";"))] += int(count)
+    return stacks
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summaries of collapsed-stack profiles")
+    sub = parser.add_subparsers(dest="command", required=True)
+    summary = sub.add_parser("summary", help="top functions over one or more .collapsed files")
+    summary.add_argument("files", nargs="+")
+    summary.add_argument("--top", type=int, default=DEFAULT_TOP_N)
+    args = parser.parse_args()
+
+    stacks = Counter()
+    for path in args.files:
+        stacks.update(read_collapsed(path))
+    print(f"{len(args.files)} profiles, {sum(stacks.values())} samples\n")
+    print(top_functions(stacks, args.top))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,14 @@
+# --- Secret-token query parameters ---
+# The operator dashboard (?operator=), calibration mode (?calibrate=) and per-session profiling
+# (?profile=) are opened by a query parameter that must match a token from st.secrets. An unset
+# token keeps the view closed.
+#
+#   query_token_matches(st.query_params, "operator", st.secrets.get("operator_token"))
+
+import hmac
+
+
+# Constant-time comparison, so response timing does not leak the token
+def query_token_matches(query_params, name, secret_token):
+    token = query_params.get(name)
+    return bool(secret_token) and token is not None and hmac.compare_digest(str(token), str(secret_token))
@@ -0,0 +1,302 @@
+# --- Permuted-block randomization with lease-based allocation ---
+# Each study arm has a seeded schedule of blocks; every block holds each variant the same number
+# of times in a random order. Arriving participants lease the next free slot of the schedule, so
+# allocation is a couple of indexed SQLite statements inside one write transaction, independent
+# of enrollment and safe for concurrent arrivals (also across processes on the same host). A
+# lease becomes permanent when the participant sends the first prompt; leases that expire before
+# that are handed out again, lowest slot first, so the blocks stay balanced.
+#
+#   python randomization.py audit assignments.sqlite3 --study Va_Knowledge --seed Va_Knowledge --out audit.csv
+#   python randomization.py audit kv+http://10.0.0.5:7379 --study Va_Knowledge --seed Va_Knowledge --out audit.csv
+
+import argparse
+import csv
+import random
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS schedule (
+    study TEXT NOT NULL, slot INTEGER NOT NULL, block INTEGER NOT NULL, variant TEXT NOT NULL,
+    PRIMARY KEY (study, slot)
+);
+CREATE TABLE IF NOT EXISTS leases (
+    study TEXT NOT NULL, slot INTEGER NOT NULL, user_id TEXT NOT NULL, leased_at REAL NOT NULL,
+    expires_at REAL NOT NULL, confirmed_at REAL,
+    PRIMARY KEY (study, slot), UNIQUE (study, user_id)
+);
+CREATE INDEX IF NOT EXISTS leases_expiry ON leases (study, confirmed_at, expires_at);
+"""
+
+DEFAULT_LEASE_SECONDS = 1800
+SCHEDULE_CHUNK_BLOCKS = 100
+
+
+def block_permutation(study, seed, block, variants, block_size):
+    per_block = block_size // len(variants)
+    block_variants = [variant for variant in variants for _ in range(per_block)]
+    random.Random(f"{seed}:{study}:{block}").shuffle(block_variants)
+    return block_variants
+
+
+class PermutedBlockAllocator:
+    def __init__(self, db_path, study, variants, seed, block_size=None, lease_seconds=DEFAULT_LEASE_SECONDS):
+        self.study = study
+        self.variants = [str(variant) for variant in variants]
+        self.seed = str(seed)
+        self.block_size = block_size or 2 * len(self.variants)
+        if self.block_size % len(self.variants):
+            raise ValueError(f"block_size {self.block_size} is not a multiple of {len(self.variants)} variants")
+        self.lease_seconds = lease_seconds
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(db_path), timeout=30, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+        self._check_config()
+
+    # A schedule must never change under a running study
+    def _check_config(self):
+        config = f"variants={','.join(self.variants)};block_size={self.block_size};seed={self.seed}"
+        key = f"schedule_config:{self.study}"
+        with self._transaction() as db:
+            row = db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                db.execute("INSERT INTO meta (key, value) VALUES (?, ?)", (key, config))
+            elif row[0] != config:
+                raise ValueError(f"Schedule for {self.study} was created with {row[0]}, not {config}")
+
+    class _Transaction:
+        def __init__(self, allocator):
+            self._allocator = allocator
+
+        def __enter__(self):
+            self._allocator._lock.acquire()
+            self._allocator._db.execute("BEGIN IMMEDIATE")
+            return self._allocator._db
+
+        def __exit__(self, exc_type, exc, tb):
+            try:
+                self._allocator._db.execute("ROLLBACK" if exc_type else "COMMIT")
+            finally:
+                self._allocator._lock.release()
+
+    def _transaction(self):
+        return self._Transaction(self)
+
+    # Appends the next SCHEDULE_CHUNK_BLOCKS blocks; the schedule is a pure function of the seed,
+    # so extending it never changes slots that were already handed out
+    def _extend_schedule(self, db):
+        last = db.execute("SELECT MAX(slot) FROM schedule WHERE study = ?", (self.study,)).fetchone()[0]
+        first_block = 0 if last is None else (last + 1) // self.block_size
+        rows = [
+            (self.study, block * self.block_size + i, block, variant)
+            for block in range(first_block, first_block + SCHEDULE_CHUNK_BLOCKS)
+            for i, variant in enumerate(block_permutation(self.study, self.seed, block, self.variants, self.block_size))
+        ]
+        db.executemany("INSERT INTO schedule (study, slot, block, variant) VALUES (?, ?, ?, ?)", rows)
+
+    def _variant(self, db, slot):
+        query = "SELECT variant FROM schedule WHERE study = ? AND slot = ?"
+        row = db.execute(query, (self.study, slot)).fetchone()
+        while row is None:
+            self._extend_schedule(db)
+            row = db.execute(query, (self.study, slot)).fetchone()
+        return row[0]
+
+    # Returns (slot, variant). Idempotent per user_id while the lease lives.
+    def lease(self, user_id, now=None):
+        now = time.time() if now is None else now
+        with self._transaction() as db:
+            return self._lease(db, user_id, now)
+
+    def _lease(self, db, user_id, now):
+        row = db.execute("SELECT slot FROM leases WHERE study = ? AND user_id = ?", (self.study, user_id)).fetchone()
+        if row is not None:
+            return row[0], self._variant(db, row[0])
+        # "+slot" keeps SQLite on the expiry index; ordering by the bare primary key column makes it
+        # walk every lease of the study instead
+        expired = db.execute(
+            "SELECT slot FROM leases WHERE study = ? AND confirmed_at IS NULL AND expires_at < ? ORDER BY +slot LIMIT 1",
+            (self.study, now),
+        ).fetchone()
+        if expired is not None:
+            slot = expired[0]
+            db.execute(
+                "UPDATE leases SET user_id = ?, leased_at = ?, expires_at = ? WHERE study = ? AND slot = ?",
+                (user_id, now, now + self.lease_seconds, self.study, slot),
+            )
+        else:
+            key = f"next_slot:{self.study}"
+            row = db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+            slot = int(row[0]) if row else 0
+            db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(slot + 1)))
+            db.execute(
+                "INSERT INTO leases (study, slot, user_id, leased_at, expires_at) VALUES (?, ?, ?, ?, ?)",
+                (self.study, slot, user_id, now, now + self.lease_seconds),
+            )
+        return slot, self._variant(db, slot)
+
+    # Makes the user's lease permanent; leases a new slot first if the old one was recycled.
+    # Returns (slot, variant, newly_confirmed).
+    def confirm(self, user_id, now=None):
+        now = time.time() if now is None else now
+        with self._transaction() as db:
+            slot, variant = self._lease(db, user_id, now)
+            updated = db.execute(
+                "UPDATE leases SET confirmed_at = ? WHERE study = ? AND slot = ? AND user_id = ? AND confirmed_at IS NULL",
+                (now, self.study, slot, user_id),
+            ).rowcount
+        return slot, variant, bool(updated)
+
+    def is_empty(self):
+        with self._transaction() as db:
+            return db.execute("SELECT COUNT(*) FROM leases WHERE study = ?", (self.study,)).fetchone()[0] == 0
+
+    # Rebuilds the confirmed allocations from exported assignment rows (user_id, variant, slot),
+    # e.g. after the local database was lost. Rows without a slot predate the schedule and are skipped.
+    def restore(self, rows):
+        restored = 0
+        with self._transaction() as db:
+            next_slot = 0
+            for row in rows:
+                slot = row.get("slot")
+                if slot is None or slot != slot or slot == "":
+                    continue
+                slot = int(slot)
+                if self._variant(db, slot) != str(row["variant"]):
+                    raise ValueError(f"Slot {slot} is scheduled as {self._variant(db, slot)}, export says {row['variant']}")
+                confirmed_at = _epoch(row.get("assigned_at")) or time.time()
+                db.execute(
+                    "INSERT OR REPLACE INTO leases (study, slot, user_id, leased_at, expires_at, confirmed_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    (self.study, slot, str(row["user_id"]), confirmed_at, confirmed_at, confirmed_at),
+                )
+                next_slot = max(next_slot, slot + 1)
+                restored += 1
+            key = f"next_slot:{self.study}"
+            row = db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+            next_slot = max(next_slot, int(row[0]) if row else 0)
+            db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(next_slot)))
+            # Holes below next_slot were leases that never got confirmed: offer them again
+            taken = {slot for (slot,) in db.execute("SELECT slot FROM leases WHERE study = ?", (self.study,))}
+            db.executemany(
+                "INSERT INTO leases (study, slot, user_id, leased_at, expires_at) VALUES (?, ?, ?, 0, 0)",
+                [(self.study, slot, f"__free_{slot}") for slot in range(next_slot) if slot not in taken],
+            )
+        return restored
+
+    # Confirmed allocations, in the layout of the assignments file on Drive
+    def assignments(self):
+        with self._transaction() as db:
+            rows = db.execute(
+                "SELECT l.user_id, s.variant, l.slot, l.confirmed_at FROM leases l JOIN schedule s "
+                "ON s.study = l.study AND s.slot = l.slot WHERE l.study = ? AND l.confirmed_at IS NOT NULL ORDER BY l.slot",
+                (self.study,),
+            ).fetchall()
+        return [
+            {"user_id": user_id, "variant": variant, "slot": slot, "assigned_at": datetime.fromtimestamp(confirmed_at).isoformat()}
+            for user_id, variant, slot, confirmed_at in rows
+        ]
+
+    # {variant: {"confirmed": n, "leased": n}} from one grouped query, for the operator dashboard
+    def counts(self, now=None):
+        now = time.time() if now is None else now
+        counts = {variant: {"confirmed": 0, "leased": 0} for variant in self.variants}
+        with self._transaction() as db:
+            rows = db.execute(
+                "SELECT s.variant, l.confirmed_at IS NOT NULL, COUNT(*) FROM leases l JOIN schedule s "
+                "ON s.study = l.study AND s.slot = l.slot WHERE l.study = ? AND (l.confirmed_at IS NOT NULL OR l.expires_at >= ?) "
+                "GROUP BY 1, 2",
+                (self.study, now),
+            ).fetchall()
+        for variant, confirmed, n in rows:
+            counts.setdefault(variant, {"confirmed": 0, "leased": 0})["confirmed" if confirmed else "leased"] += n
+        return counts
+
+    # Schedule versus actual allocation, one row per slot handed out so far
+    def audit(self, now=None):
+        now = time.time() if now is None else now
+        with self._transaction() as db:
+            rows = db.execute(
+                "SELECT s.slot, s.block, s.variant, l.user_id, l.confirmed_at, l.expires_at FROM schedule s "
+                "LEFT JOIN leases l ON l.study = s.study AND l.slot = s.slot WHERE s.study = ? AND s.slot < "
+                "(SELECT CAST(value AS INTEGER) FROM meta WHERE key = ?) ORDER BY s.slot",
+                (self.study, f"next_slot:{self.study}"),
+            ).fetchall()
+        return [
+            audit_row(self.study, slot, block, variant, user_id, confirmed_at, expires_at, now)
+            for slot, block, variant, user_id, confirmed_at, expires_at in rows
+        ]
+
+    def audit_summary(self):
+        return summarize_audit(self.audit(), self.variants)
+
+
+# One audit row; the lease columns are None for a slot without a lease record
+def audit_row(study, slot, block, variant, user_id, confirmed_at, expires_at, now):
+    if confirmed_at is not None:
+        status = "confirmed"
+    elif expires_at is not None and expires_at >= now:
+        status = "leased"
+    else:
+        status = "free"
+    return {
+        "study": study, "slot": slot, "block": block, "scheduled_variant": variant,
+        "status": status, "user_id": user_id if status != "free" else None,
+    }
+
+
+# Per block: scheduled count of each variant and how many of those slots are confirmed
+def summarize_audit(audit, variants):
+    summary = {}
+    for row in audit:
+        block = summary.setdefault(row["block"], {variant: [0, 0] for variant in variants})
+        block[row["scheduled_variant"]][0] += 1
+        block[row["scheduled_variant"]][1] += row["status"] == "confirmed"
+    return summary
+
+
+def _epoch(value):
+    if value is None or value != value or value == "":
+        return None
+    try:
+        return datetime.fromisoformat(str(value)).timestamp()
+    except ValueError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Permuted-block randomization schedule")
+    sub = parser.add_subparsers(dest="command", required=True)
+    audit = sub.add_parser("audit", help="export schedule versus actual allocation as CSV")
+    audit.add_argument("db", help="assignment database, or a STATE_BACKEND URL (sqlite:///path, kv+http://host:port)")
+    audit.add_argument("--study", required=True)
+    audit.add_argument("--variants", default="1,2,3")
+    audit.add_argument("--seed", required=True)
+    audit.add_argument("--block-size", type=int)
+    audit.add_argument("--out", default="-")
+    args = parser.parse_args()
+
+    if "://" in args.db:
+        from state_backend import open_state_backend  # imports this module
+
+        allocator = open_state_backend(args.db).allocator(args.study, args.variants.split(","), args.seed, args.block_size)
+    else:
+        allocator = PermutedBlockAllocator(args.db, args.study, args.variants.split(","), args.seed, args.block_size)
+    rows = allocator.audit()
+    out = sys.stdout if args.out == "-" else open(args.out, "w", newline="")
+    writer = csv.DictWriter(out, fieldnames=["study", "slot", "block", "scheduled_variant", "status", "user_id"])
+    writer.writeheader()
+    writer.writerows(rows)
+    if out is not sys.stdout:
+        out.close()
+    for block, counts in allocator.audit_summary().items():
+        line = ", ".join(f"{variant}: {confirmed}/{scheduled}" for variant, (scheduled, confirmed) in counts.items())
+        print(f"block {block}: {line}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+# --- Multi-replica launcher ---
+# Starts N `streamlit run` replicas of a study app on consecutive ports, all sharing one state
+# backend (STATE_BACKEND, see state_backend.py), and restarts a replica that exits. Every replica
+# gets its own usage snapshot, spill and profile paths under --run-dir. Put a load balancer with
+# sticky sessions in front, so a participant's websocket reconnects reach the replica holding
+# the session; if that replica is gone, the ?session= resume token restores the session from the
+# backend on another one. --print-nginx prints a matching upstream block:
+#
+#   upstream llm_study {
+#       hash $remote_addr consistent;   # sticky per participant
+#       server 127.0.0.1:8501; server 127.0.0.1:8502; ...
+#   }
+#   location / { proxy_pass http://llm_study; proxy_http_version 1.1;
+#                proxy_set_header Upgrade $http_upgrade; proxy_set_header Connection "upgrade";
+#                proxy_read_timeout 1h; }
+#
+# Run the storage sync daemon (storage_sync.py) next to the replicas and pass its --spool-dir (or
+# STORAGE_SPOOL_DIR), so chat log and assignment writes to Drive come from one process per host.
+# It is required with more than one replica: replicas writing to Drive directly overwrite each
+# other's rows.
+#
+#   python replicas.py Feedback_Va_Knowledge.py --replicas 4 --state-backend sqlite:///srv/state.sqlite3 --spool-dir /srv/spool
+#   python replicas.py Feedback_Vb_Writing.py --replicas 8 --state-backend kv+http://10.0.0.5:7379 --spool-dir /srv/spool --print-nginx
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent
+
+
+def replica_env(state_backend, run_dir, index, extra_env=None):
+    replica_dir = Path(run_dir) / f"replica-{index}"
+    return {
+        **os.environ,
+        "STATE_BACKEND": state_backend,
+        "SESSION_SPILL_DIR": str(replica_dir / "spill"),
+        "USAGE_SNAPSHOT_FILE": str(replica_dir / "usage.json"),
+        "PROFILE_DIR": str(replica_dir / "profiles"),
+        **(extra_env or {}),
+    }
+
+
+def start_replica(app, port, env, log_path, cwd=None, secrets_file=None):
+    command = [
+        sys.executable, "-m", "streamlit", "run", str(app), "--server.headless", "true",
+        "--server.port", str(port), "--browser.gatherUsageStats", "false",
+    ]
+    if secrets_file:
+        command += ["--secrets.files", str(secrets_file)]
+    Path(log_path).parent.mkdir(parents=True, exist_ok=True)
+    return subprocess.Popen(command, env=env, cwd=cwd, stdout=subprocess.DEVNULL, stderr=open(log_path, "a"))
+
+
+# True once the replica answers its health check, False if it exited or timed out
+def wait_healthy(process, url, timeout_s=60):
+    deadline = time.time() + timeout_s
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(f"{url}/_stcore/health", timeout=1)
+            return True
+        except OSError:
+            if process.poll() is not None:
+                return False
+            time.sleep(0.3)
+    return False
+
+
+# Returns [(process, url)] once every replica is healthy; raises if one does not come up
+def start_replicas(app, n_replicas, base_port, state_backend, run_dir, extra_env=None, cwd=None, secrets_file=None):
+    replicas = []
+    for index in range(n_replicas):
+        port = base_port + index
+        env = replica_env(state_backend, run_dir, index, extra_env)
+        process = start_replica(app, port, env, Path(run_dir) / f"replica-{index}" / "app.log", cwd, secrets_file)
+        replicas.append((process, f"http://127.0.0.1:{port}"))
+    for index, (process, url) in enumerate(replicas):
+        if not wait_healthy(process, url):
+            stop_replicas(replicas)
+            raise RuntimeError(f"Replica {index} did not start, see {run_dir}/replica-{index}/app.log")
+    return replicas
+
+
+def stop_replicas(replicas):
+    for process, _ in replicas:
+        process.terminate()
+    for process, _ in replicas:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def nginx_upstream(ports, name="llm_study"):
+    servers = "\n".join(f"    server 127.0.0.1:{port};" for port in ports)
+    return f"upstream {name} {{\n    hash $remote_addr consistent;\n{servers}\n}}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run several replicas of a study app on one shared state backend")
+    parser.add_argument("app", help="Streamlit app, e.g. Feedback_Va_Knowledge.py")
+    parser.add_argument("--replicas", type=int, default=2)
+    parser.add_argument("--base-port", type=int, default=8501)
+    parser.add_argument("--state-backend", default=os.environ.get("STATE_BACKEND"), help="sqlite:///path or kv+http://host:port (default: STATE_BACKEND)")
+    parser.add_argument("--run-dir", default=str(Path(tempfile.gettempdir()) / "llm_study_replicas"))
+    parser.add_argument("--spool-dir", default=os.environ.get("STORAGE_SPOOL_DIR"), help="STORAGE_SPOOL_DIR of the storage sync daemon on this host (default: STORAGE_SPOOL_DIR)")
+    parser.add_argument("--print-nginx", action="store_true")
+    args = parser.parse_args()
+    if not args.state_backend:
+        parser.error("replicas need a shared --state-backend (or STATE_BACKEND)")
+    if args.replicas > 1 and not args.spool_dir:
+        parser.error("more than one replica needs the storage sync daemon's --spool-dir (or STORAGE_SPOOL_DIR)")
+
+    extra_env = {"STORAGE_SPOOL_DIR": args.spool_dir} if args.spool_dir else {}
+    ports = [args.base_port + index for index in range(args.replicas)]
+    replicas = start_replicas(Path(args.app).resolve(), args.replicas, args.base_port, args.state_backend, args.run_dir, extra_env, cwd=ROOT)
+    print(f"{args.replicas} replicas of {args.app} on ports {ports[0]}-{ports[-1]}, state backend {args.state_backend}", flush=True)
+    if args.print_nginx:
+        print(nginx_upstream(ports), flush=True)
+    try:
+        while True:
+            time.sleep(5)
+            for index, (process, url) in enumerate(replicas):
+                if process.poll() is not None:
+                    print(f"Replica {index} exited with {process.returncode}, restarting", flush=True)
+                    env = replica_env(args.state_backend, args.run_dir, index, extra_env)
+                    replicas[index] = (start_replica(Path(args.app).resolve(), ports[index], env, Path(args.run_dir) / f"replica-{index}" / "app.log", ROOT), url)
+    except KeyboardInterrupt:
+        stop_replicas(replicas)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# --- Variant 1: locate the company values / recommendations block ---
+# The app draws a green box around the part of a variant-1 response that starts with the
+# sentence naming the company values and ends after the recommendations list. The block is
+# located once, when the response arrives; its offsets are stored with the turn (Turn.box), so
+# redrawing the transcript on a rerun only slices the text.
+
+import re
+
+_VALUES = re.compile(r"\b(?:the\s+)?company'?s?\s+values\b", re.IGNORECASE)
+_RECOMMENDATIONS = re.compile(r"(?:\*\*\s*)?recommendations?:", re.IGNORECASE)
+_PARAGRAPH_BREAK = re.compile(r"\r?\n\s*\r?\n(?=\s*\S)", flags=re.MULTILINE)
+_LIST_ITEM = re.compile(r"\s*(?:[-*•–]|(?:\d+[.)]))\s+")
+
+
+# Returns (before_end, boxed_start, boxed_end, after_start) with response[:before_end],
+# response[boxed_start:boxed_end] and response[after_start:] as the three parts, without the
+# whitespace around them, or None if the response has no values/recommendations block
+def box_offsets(response):
+    val_matches = list(_VALUES.finditer(response))
+    if not val_matches:
+        return None
+    val = val_matches[-1]
+    rec = _RECOMMENDATIONS.search(response[val.start():])
+    if not rec:
+        return None
+    rec_abs = val.start() + rec.start()
+    p = val.start()
+    candidates = [
+        response.rfind(". ", 0, p) + 2,
+        response.rfind("! ", 0, p) + 2,
+        response.rfind("? ", 0, p) + 2,
+        response.rfind("\n", 0, p) + 1,
+        0
+    ]
+    start = max(c for c in candidates if c >= 0)
+
+    # The box ends at the first paragraph break that is not followed by another list item or
+    # a continuation line
+    tail = response[rec_abs:]
+    pos = 0
+    end_in_tail = None
+    while True:
+        m = _PARAGRAPH_BREAK.search(tail[pos:])
+        if not m:
+            break
+        next_para_start = pos + m.end()
+        next_line_end = tail.find("\n", next_para_start)
+        if next_line_end == -1:
+            next_line_end = len(tail)
+        next_line = tail[next_para_start:next_line_end]
+        if _LIST_ITEM.match(next_line) or (next_line.strip()[:1].isalpha()):
+            pos = next_para_start
+            continue
+        else:
+            end_in_tail = pos + m.start()
+            break
+    end = rec_abs + (end_in_tail if end_in_tail is not None else len(tail))
+    if end < rec_abs:  # defensive fallback
+        end = len(response)
+
+    before_end = len(response[:start].rstrip())
+    boxed_start = end - len(response[start:end].lstrip())
+    boxed_end = max(boxed_start, start + len(response[start:end].rstrip()))
+    after_start = len(response) - len(response[end:].lstrip())
+    return before_end, boxed_start, boxed_end, after_start
+
+
+# Offsets to store with a turn: () if the variant is not boxed or the response has no block
+def response_box(response, variant, boxed_variants):
+    if variant not in boxed_variants:
+        return ()
+    return box_offsets(response) or ()
+
+
+# (before, boxed, after) for stored offsets, or None if there is nothing to box
+def split_response(response, box):
+    if not box:
+        return None
+    before_end, boxed_start, boxed_end, after_start = box
+    return response[:before_end], response[boxed_start:boxed_end], response[after_start:]
+
+
+# Returns (before, boxed, after), or None if the response has no values/recommendations block
+def box_segments(response):
+    return split_response(response, box_offsets(response))
@@ -0,0 +1,198 @@
+# --- Per-process session memory ceiling with spill-to-disk ---
+# Every session's chat_history is a Transcript registered with one SessionMemoryManager per
+# process. When the resident transcripts exceed the ceiling, the manager writes the least
+# recently used idle (or finished) transcripts to local disk and drops them from memory. A
+# spilled transcript reloads itself on the next access, so the app keeps using it like a list. If
+# its spill file has been removed meanwhile (e.g. by tmp cleanup), the transcript is rebuilt from
+# the turn log through the manager's recover_turn; a turn that cannot be recovered raises, rather
+# than carry on with a history the participant never had.
+# Sessions that are still active are never spilled, even above the ceiling.
+
+import os
+import pickle
+import tempfile
+import threading
+import time
+import uuid
+import weakref
+from collections import deque
+from pathlib import Path
+
+
+# Holds the spill path of one transcript; shared with its finalizer, which must not keep the
+# transcript itself alive
+class _SpillSlot:
+    __slots__ = ("path",)
+
+    def __init__(self):
+        self.path = None
+
+    def remove(self):
+        if self.path is not None:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+            self.path = None
+
+
+class Transcript:
+    def __init__(self, manager, session_key):
+        self.session_key = session_key
+        self.last_access = time.monotonic()
+        self.finished = False
+        self.nbytes = 0
+        self._manager = manager
+        self._turns = []
+        self._spilled_turn_ids = []  # ids of the turns in the spill file, to rebuild it if it is lost
+        self._spill = _SpillSlot()
+        self._lock = threading.RLock()
+        # Expired Streamlit sessions drop their transcript; remove its spill file with it
+        weakref.finalize(self, self._spill.remove)
+
+    @property
+    def spilled(self):
+        return self._spill.path is not None
+
+    def _resident_turns(self):
+        if self._spill.path is not None:
+            started = time.perf_counter()
+            try:
+                with open(self._spill.path, "rb") as f:
+                    self._turns = pickle.load(f)
+            except FileNotFoundError:
+                self._turns = self._manager._recover(self.session_key, self._spilled_turn_ids)
+                self._spill.path = None
+            else:
+                self._spill.remove()
+                self._manager._record_reload(time.perf_counter() - started)
+            self._spilled_turn_ids = []
+        self.last_access = time.monotonic()
+        return self._turns
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._resident_turns()))
+
+    def __len__(self):
+        with self._lock:
+            return len(self._resident_turns())
+
+    def __getitem__(self, index):
+        with self._lock:
+            return self._resident_turns()[index]
+
+    def append(self, turn):
+        with self._lock:
+            self._resident_turns().append(turn)
+            self.nbytes += turn.size_bytes()
+
+    def mark_finished(self):
+        self.finished = True
+
+    # Called by the manager from another session's thread; gives up if this session is busy
+    def _spill_to_disk(self, spill_dir):
+        if not self._lock.acquire(blocking=False):
+            return False
+        try:
+            if self._spill.path is not None:
+                return False
+            path = Path(spill_dir) / f"{self.session_key}-{uuid.uuid4().hex}.pkl"
+            tmp_path = path.with_suffix(".tmp")
+            with open(tmp_path, "wb") as f:
+                pickle.dump(self._turns, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+            self._spill.path = path
+            self._spilled_turn_ids = [turn.turn_id for turn in self._turns]
+            self._turns = []
+            return True
+        finally:
+            self._lock.release()
+
+
+class SessionMemoryManager:
+    # recover_turn: turn_id -> the Turn from the turn log, or None if it is not there
+    def __init__(self, ceiling_bytes, idle_seconds=900, spill_dir=None, recover_turn=None):
+        self.ceiling_bytes = ceiling_bytes
+        self.recover_turn = recover_turn
+        self.idle_seconds = idle_seconds
+        self.spill_dir = Path(spill_dir or Path(tempfile.gettempdir()) / "llm_study_spill")
+        self.spill_dir.mkdir(parents=True, exist_ok=True)
+        self._transcripts = weakref.WeakSet()
+        self._lock = threading.Lock()
+        self._spills = 0
+        self._reloads = 0
+        self._recovered_spills = 0
+        self._reload_seconds = deque(maxlen=1000)
+
+    def new_transcript(self, session_key):
+        transcript = Transcript(self, session_key)
+        with self._lock:
+            self._transcripts.add(transcript)
+        return transcript
+
+    # Called once per rerun of the owning session
+    def touch(self, transcript):
+        transcript.last_access = time.monotonic()
+        self.enforce_ceiling()
+
+    def resident_bytes(self):
+        with self._lock:
+            return sum(t.nbytes for t in self._transcripts if not t.spilled)
+
+    def enforce_ceiling(self):
+        with self._lock:
+            transcripts = list(self._transcripts)
+        resident = [t for t in transcripts if not t.spilled]
+        excess = sum(t.nbytes for t in resident) - self.ceiling_bytes
+        if excess <= 0:
+            return 0
+        now = time.monotonic()
+        candidates = sorted(
+            (t for t in resident if t.nbytes and (t.finished or now - t.last_access >= self.idle_seconds)),
+            key=lambda t: t.last_access,
+        )
+        spilled = 0
+        for transcript in candidates:
+            if excess <= 0:
+                break
+            if transcript._spill_to_disk(self.spill_dir):
+                excess -= transcript.nbytes
+                spilled += 1
+        with self._lock:
+            self._spills += spilled
+        return spilled
+
+    def _record_reload(self, seconds):
+        with self._lock:
+            self._reloads += 1
+            self._reload_seconds.append(seconds)
+
+    # Turns of a transcript whose spill file is gone, in their original order
+    def _recover(self, session_key, turn_ids):
+        turns = [self.recover_turn(turn_id) for turn_id in turn_ids] if self.recover_turn else [None] * len(turn_ids)
+        missing = sum(1 for turn in turns if turn is None)
+        if missing:
+            raise RuntimeError(f"Spill file of session {session_key} is gone and {missing} of its {len(turn_ids)} turns are not in the turn log")
+        with self._lock:
+            self._recovered_spills += 1
+        return turns
+
+    def stats(self):
+        with self._lock:
+            transcripts = list(self._transcripts)
+            reload_ms = sorted(s * 1000 for s in self._reload_seconds)
+            spills, reloads, recovered_spills = self._spills, self._reloads, self._recovered_spills
+        spilled = sum(1 for t in transcripts if t.spilled)
+        return {
+            "resident_sessions": len(transcripts) - spilled,
+            "spilled_sessions": spilled,
+            "resident_bytes": sum(t.nbytes for t in transcripts if not t.spilled),
+            "ceiling_bytes": self.ceiling_bytes,
+            "spills_total": spills,
+            "reloads_total": reloads,
+            "recovered_spills_total": recovered_spills,
+            "reload_ms_mean": sum(reload_ms) / len(reload_ms) if reload_ms else 0.0,
+            "reload_ms_p95": reload_ms[int(0.95 * (len(reload_ms) - 1))] if reload_ms else 0.0,
+        }
+
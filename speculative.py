@@ -0,0 +1,116 @@
+# --- Speculative "integrate the recommendations" revisions (variant 1) ---
+# Variant 1 ends every answer with "Do you want me to integrate any of these recommendations in
+# the draft?" and most participants say yes. With speculation on, the app asks the model for the
+# revision in the background as soon as the answer is shown. If the next prompt is a plain
+# confirmation made only of allow-listed phrases ("yes", "ok, go ahead", ...), the prepared
+# revision is served (waiting for it if it is still running); anything else discards it. The
+# revision is a streamed call on the shared LLM client (llm_client.submit_chat_stream), so it
+# holds no thread while it runs and discarding it early closes the stream. The ledger counts
+# hits, misses and the tokens spent on discarded revisions.
+
+import re
+import threading
+import time
+
+SPECULATIVE_PROMPT = "Yes, please integrate the recommendations."
+
+_OFFER = re.compile(r"integrat\w*\b[^\n]*\?[\s*_]*$", re.IGNORECASE)
+# A confirmation is a whole prompt made of these phrases only, e.g. "Yes, please integrate them.
+# Thanks!"; a prompt with any other word in it ("Please write a new email to HR", "Yes, make it
+# funnier") asks for something else and gets its own answer
+_OBJECT = (
+    r"(?:(?:all )?(?:of )?(?:them|it|those|these|both)(?: all)?|all"
+    r"|(?:all )?(?:of )?(?:the |these |those |your |my )?(?:recommendations|suggestions|changes|edits|points)(?: in the draft)?)"
+)
+_PHRASES = (
+    r"yes|yeah|yep|yup|sure|ok|okay|alright|all right|ja|please|perfect|great|absolutely|definitely|of course"
+    r"|(?:that )?sounds (?:good|great|perfect)|good idea|why not|go ahead|go for it|do it|do that|please do"
+    rf"|(?:integrate|include|incorporate|add|apply) {_OBJECT}|yes to {_OBJECT}|{_OBJECT} please"
+    r"|thanks|thank you|thx"
+)
+_CONFIRMATION = re.compile(rf"(?:{_PHRASES})(?: (?:{_PHRASES}))*")
+MAX_CONFIRMATION_WORDS = 12
+
+
+# True if the response ends by offering to integrate the recommendations
+def offers_revision(response):
+    return bool(_OFFER.search(response.rstrip()[-400:]))
+
+
+# Case, punctuation and spacing are ignored; everything else must be on the allow-list
+def is_confirmation(prompt):
+    text = " ".join(re.sub(r"[^\w\s']+", " ", prompt.lower()).split())
+    return len(text.split()) <= MAX_CONFIRMATION_WORDS and bool(_CONFIRMATION.fullmatch(text))
+
+
+class Speculation:
+    def __init__(self, future, task_index, after_turn_id):
+        self.future = future
+        self.task_index = task_index
+        self.after_turn_id = after_turn_id
+        self.started = time.perf_counter()
+        # The participant's confirmation, set when it arrives; the speculation stays in the session
+        # state with it until the revision's turn is logged
+        self.confirmed_prompt = None
+
+    # Valid only as the reply to the turn it was started after
+    def applies_to(self, task_index, last_turn_id):
+        return self.task_index == task_index and self.after_turn_id == last_turn_id
+
+
+class SpeculationLedger:
+    # usage_of: the usage_accounting.Usage of a finished call's response
+    def __init__(self, usage_of):
+        self.usage_of = usage_of
+        self._lock = threading.Lock()
+        self._counts = {
+            "started": 0, "hits": 0, "misses": 0, "cancelled": 0, "failed": 0,
+            "wasted_prompt_tokens": 0, "wasted_completion_tokens": 0, "wasted_cost_usd": 0.0,
+            "hit_wait_s": 0.0, "hit_saved_s": 0.0,
+        }
+
+    def _add(self, **amounts):
+        with self._lock:
+            for name, amount in amounts.items():
+                self._counts[name] += amount
+
+    def started(self):
+        self._add(started=1)
+
+    # The prepared (content, usage), or None if the background call failed
+    def serve(self, speculation):
+        waited_from = time.perf_counter()
+        try:
+            response = speculation.future.result()
+        except Exception:
+            self._add(failed=1)
+            return None
+        now = time.perf_counter()
+        # Saved time: everything the call had already done when the participant confirmed
+        self._add(hits=1, hit_wait_s=now - waited_from, hit_saved_s=waited_from - speculation.started)
+        return response.choices[0].message.content, self.usage_of(response)
+
+    def discard(self, speculation):
+        if speculation.future.cancel():
+            self._add(misses=1, cancelled=1)
+            return
+        self._add(misses=1)
+        speculation.future.add_done_callback(self._count_waste)
+
+    def _count_waste(self, future):
+        try:
+            usage = self.usage_of(future.result())
+        except Exception:
+            return
+        self._add(
+            wasted_prompt_tokens=usage.prompt_tokens or 0,
+            wasted_completion_tokens=usage.completion_tokens or 0,
+            wasted_cost_usd=usage.cost_usd or 0.0,
+        )
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._counts)
+        decided = counts["hits"] + counts["misses"]
+        counts["hit_rate"] = counts["hits"] / decided if decided else 0.0
+        return counts
@@ -0,0 +1,409 @@
+# --- Shared state backend for multi-replica deployments ---
+# Several app replicas behind a sticky load balancer must not keep assignments, turn logs or
+# session state in per-process files. A state backend holds all three for every replica:
+#
+#   sqlite:///var/lib/llm-study/state.sqlite3   one embedded database for all replicas of a host
+#   kv+http://kv.internal:7379                  a network key-value service (kv_standin.py serves
+#                                               the protocol for tests and benchmarks)
+#
+# Both hand out the same objects: allocator() behaves like randomization.PermutedBlockAllocator
+# (same seeded schedule, so a study can move between backends), turn_log() like
+# turn_log.TurnLogStore, and save_session / load_session keep a JSON snapshot of a participant's
+# progress, so a session whose replica went away resumes on another one.
+
+import hashlib
+import http.client
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlsplit
+
+from randomization import DEFAULT_LEASE_SECONDS, PermutedBlockAllocator, _epoch, audit_row, block_permutation, summarize_audit
+from turn_log import encode_row, row_turn_id
+
+
+def open_state_backend(url):
+    if url.startswith("sqlite:///"):
+        return SQLiteStateBackend(url[len("sqlite://"):])
+    if url.startswith("kv+http://"):
+        return KVStateBackend(url[len("kv+"):])
+    raise ValueError(f"Unknown state backend {url!r}, expected sqlite:///path or kv+http://host:port")
+
+
+def _digest(payload):
+    return hashlib.blake2b(payload, digest_size=12).hexdigest()
+
+
+# --- Embedded database (one host) ---
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS turns (
+    study TEXT NOT NULL, turn_id TEXT NOT NULL, digest TEXT NOT NULL, row TEXT NOT NULL,
+    PRIMARY KEY (study, turn_id)
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    study TEXT NOT NULL, token TEXT NOT NULL, snapshot TEXT NOT NULL, updated_at REAL NOT NULL,
+    PRIMARY KEY (study, token)
+);
+"""
+
+
+class SQLiteStateBackend:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SQLITE_SCHEMA)
+
+    def _execute(self, query, params=()):
+        with self._lock:
+            return self._db.execute(query, params).fetchall()
+
+    # Replicas on the host share the allocator tables of the same file
+    def allocator(self, study, variants, seed, block_size=None, lease_seconds=DEFAULT_LEASE_SECONDS):
+        return PermutedBlockAllocator(self.path, study, variants, seed, block_size=block_size, lease_seconds=lease_seconds)
+
+    def turn_log(self, study):
+        return _SQLiteTurnLog(self, study)
+
+    def save_session(self, study, token, snapshot):
+        self._execute(
+            "INSERT OR REPLACE INTO sessions (study, token, snapshot, updated_at) VALUES (?, ?, ?, ?)",
+            (study, token, json.dumps(snapshot), time.time()),
+        )
+
+    def load_session(self, study, token):
+        rows = self._execute("SELECT snapshot FROM sessions WHERE study = ? AND token = ?", (study, token))
+        return json.loads(rows[0][0]) if rows else None
+
+    def stats(self):
+        return {"backend": "sqlite", "path": self.path}
+
+
+class _SQLiteTurnLog:
+    def __init__(self, backend, study):
+        self._backend = backend
+        self.study = study
+
+    def __len__(self):
+        return self._backend._execute("SELECT COUNT(*) FROM turns WHERE study = ?", (self.study,))[0][0]
+
+    def __contains__(self, turn_id):
+        return bool(self._backend._execute("SELECT 1 FROM turns WHERE study = ? AND turn_id = ?", (self.study, turn_id)))
+
+    # Returns True if the row was written, False if the same version was already stored
+    def upsert(self, row):
+        turn_id = row_turn_id(row)
+        payload = encode_row({**row, "turn_id": turn_id})
+        digest = _digest(payload)
+        with self._backend._lock:
+            cursor = self._backend._db.execute(
+                "INSERT INTO turns (study, turn_id, digest, row) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (study, turn_id) DO UPDATE SET digest = excluded.digest, row = excluded.row "
+                "WHERE digest != excluded.digest",
+                (self.study, turn_id, digest, payload.decode("utf-8")),
+            )
+            return cursor.rowcount > 0
+
+    def get(self, turn_id):
+        rows = self._backend._execute("SELECT row FROM turns WHERE study = ? AND turn_id = ?", (self.study, turn_id))
+        return json.loads(rows[0][0]) if rows else None
+
+    def turn_ids(self):
+        return [turn_id for (turn_id,) in self._backend._execute("SELECT turn_id FROM turns WHERE study = ? ORDER BY rowid", (self.study,))]
+
+    def rows(self):
+        return [json.loads(row) for (row,) in self._backend._execute("SELECT row FROM turns WHERE study = ? ORDER BY rowid", (self.study,))]
+
+    def close(self):
+        pass
+
+
+# --- Network key-value service ---
+# Protocol: POST /<op> with a JSON body, JSON response. Values are JSON; every key has a version
+# that grows with each write (0 = missing).
+#   get {key} -> {value, version}            put {key, value} -> {version}
+#   cas {key, value, version} -> {ok, version}   (writes only if the version still matches)
+#   incr {key, by} -> {value}                delete {key} -> {}
+#   scan {prefix, keys_only} -> {items: [[key, value, version], ...]} in key order
+class KVClient:
+    def __init__(self, base_url, timeout_s=10.0):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.timeout_s = timeout_s
+        self._local = threading.local()  # one keep-alive connection per thread
+        self.requests = 0
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._local.connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout_s)
+        return connection
+
+    def call(self, op, **body):
+        payload = json.dumps(body).encode("utf-8")
+        for attempt in (1, 2):
+            connection = self._connection()
+            try:
+                connection.request("POST", f"/{op}", payload, {"Content-Type": "application/json"})
+                response = connection.getresponse()
+                data = response.read()
+                break
+            except (ConnectionError, http.client.HTTPException):
+                # The server closed an idle keep-alive connection; every op is safe to resend
+                # except a cas/incr that was applied before the connection broke, which callers retry anyway
+                connection.close()
+                self._local.connection = None
+                if attempt == 2:
+                    raise
+        self.requests += 1
+        if response.status != 200:
+            raise RuntimeError(f"KV {op} failed with {response.status}: {data[:200]!r}")
+        return json.loads(data)
+
+    def get(self, key):
+        result = self.call("get", key=key)
+        return result["value"], result["version"]
+
+    def put(self, key, value):
+        return self.call("put", key=key, value=value)["version"]
+
+    def cas(self, key, value, version):
+        return self.call("cas", key=key, value=value, version=version)["ok"]
+
+    def incr(self, key, by=1):
+        return self.call("incr", key=key, by=by)["value"]
+
+    def delete(self, key):
+        self.call("delete", key=key)
+
+    def scan(self, prefix, keys_only=False):
+        return self.call("scan", prefix=prefix, keys_only=keys_only)["items"]
+
+
+class KVStateBackend:
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.kv = KVClient(base_url)
+
+    def allocator(self, study, variants, seed, block_size=None, lease_seconds=DEFAULT_LEASE_SECONDS):
+        return KVBlockAllocator(self.kv, study, variants, seed, block_size=block_size, lease_seconds=lease_seconds)
+
+    def turn_log(self, study):
+        return _KVTurnLog(self.kv, study)
+
+    def save_session(self, study, token, snapshot):
+        self.kv.put(f"{study}/session/{token}", snapshot)
+
+    def load_session(self, study, token):
+        return self.kv.get(f"{study}/session/{token}")[0]
+
+    def stats(self):
+        return {"backend": "kv", "url": self.base_url, "requests": self.kv.requests}
+
+
+class _KVTurnLog:
+    def __init__(self, kv, study):
+        self.kv = kv
+        self.prefix = f"{study}/turn/"
+
+    def __len__(self):
+        return len(self.kv.scan(self.prefix, keys_only=True))
+
+    def __contains__(self, turn_id):
+        return self.kv.get(self.prefix + turn_id)[1] > 0
+
+    # Returns True if the row was written, False if the same version was already stored
+    def upsert(self, row):
+        turn_id = row_turn_id(row)
+        stored = {**row, "turn_id": turn_id}
+        digest = _digest(encode_row(stored))
+        current, _ = self.kv.get(self.prefix + turn_id)
+        if current is not None and current["digest"] == digest:
+            return False
+        self.kv.put(self.prefix + turn_id, {"digest": digest, "row": json.loads(encode_row(stored))})
+        return True
+
+    def get(self, turn_id):
+        value, _ = self.kv.get(self.prefix + turn_id)
+        return value["row"] if value is not None else None
+
+    def turn_ids(self):
+        return [key[len(self.prefix):] for key, _, _ in self.kv.scan(self.prefix, keys_only=True)]
+
+    def rows(self):
+        return sorted((value["row"] for _, value, _ in self.kv.scan(self.prefix)), key=lambda row: str(row.get("timestamp")))
+
+    def close(self):
+        pass
+
+
+# Permuted-block allocation on the key-value service, with the schedule of
+# randomization.PermutedBlockAllocator. A slot record is claimed with compare-and-set, so two
+# replicas can never hand out the same slot; unconfirmed leases are also listed under pending/,
+# which stays small, so recycling an expired lease never scans the whole study.
+class KVBlockAllocator:
+    def __init__(self, kv, study, variants, seed, block_size=None, lease_seconds=DEFAULT_LEASE_SECONDS):
+        self.kv = kv
+        self.study = study
+        self.variants = [str(variant) for variant in variants]
+        self.seed = str(seed)
+        self.block_size = block_size or 2 * len(self.variants)
+        if self.block_size % len(self.variants):
+            raise ValueError(f"block_size {self.block_size} is not a multiple of {len(self.variants)} variants")
+        self.lease_seconds = lease_seconds
+        self._schedule = {}
+        self._check_config()
+
+    def _key(self, *parts):
+        return "/".join([self.study, *parts])
+
+    def _slot_key(self, slot):
+        return self._key("slot", f"{slot:09d}")
+
+    def _pending_key(self, slot):
+        return self._key("pending", f"{slot:09d}")
+
+    # A schedule must never change under a running study
+    def _check_config(self):
+        config = f"variants={','.join(self.variants)};block_size={self.block_size};seed={self.seed}"
+        if not self.kv.cas(self._key("config"), config, 0):
+            existing, _ = self.kv.get(self._key("config"))
+            if existing != config:
+                raise ValueError(f"Schedule for {self.study} was created with {existing}, not {config}")
+
+    def variant(self, slot):
+        block = slot // self.block_size
+        if block not in self._schedule:
+            self._schedule[block] = block_permutation(self.study, self.seed, block, self.variants, self.block_size)
+        return self._schedule[block][slot % self.block_size]
+
+    # Returns (slot, variant). Idempotent per user_id while the lease lives.
+    def lease(self, user_id, now=None):
+        now = time.time() if now is None else now
+        slot, _ = self._current_slot(user_id)
+        if slot is None:
+            slot = self._claim(user_id, now)
+        return slot, self.variant(slot)
+
+    # The user's slot and its record version, or (None, 0) if the user holds none (any more)
+    def _current_slot(self, user_id):
+        slot, _ = self.kv.get(self._key("user", user_id))
+        if slot is None:
+            return None, 0
+        record, version = self.kv.get(self._slot_key(slot))
+        if record is None or record["user_id"] != user_id:
+            return None, 0  # the lease expired and the slot went to someone else
+        return slot, version
+
+    def _claim(self, user_id, now):
+        record = {"user_id": user_id, "leased_at": now, "expires_at": now + self.lease_seconds, "confirmed_at": None}
+        # Expired leases first, lowest slot first, so the blocks stay balanced
+        for key, _, _ in self.kv.scan(self._key("pending", ""), keys_only=True):
+            slot = int(key.rsplit("/", 1)[1])
+            current, version = self.kv.get(self._slot_key(slot))
+            if current is None or current["confirmed_at"] is not None:
+                self.kv.delete(key)
+                continue
+            if current["expires_at"] < now and self.kv.cas(self._slot_key(slot), record, version):
+                self.kv.put(self._key("user", user_id), slot)
+                return slot
+        while True:
+            slot = self.kv.incr(self._key("next_slot")) - 1
+            if self.kv.cas(self._slot_key(slot), record, 0):
+                break  # taken only if restore() wrote the slot concurrently
+        self.kv.put(self._pending_key(slot), 1)
+        self.kv.put(self._key("user", user_id), slot)
+        return slot
+
+    # Makes the user's lease permanent; leases a new slot first if the old one was recycled.
+    # Returns (slot, variant, newly_confirmed).
+    def confirm(self, user_id, now=None):
+        now = time.time() if now is None else now
+        while True:
+            slot, version = self._current_slot(user_id)
+            if slot is None:
+                self._claim(user_id, now)
+                continue
+            record, current_version = self.kv.get(self._slot_key(slot))
+            if current_version != version:
+                continue
+            if record["confirmed_at"] is not None:
+                return slot, self.variant(slot), False
+            if self.kv.cas(self._slot_key(slot), {**record, "confirmed_at": now}, version):
+                self.kv.delete(self._pending_key(slot))
+                return slot, self.variant(slot), True
+
+    def is_empty(self):
+        return self.kv.get(self._key("next_slot"))[0] is None
+
+    # Rebuilds the confirmed allocations from exported assignment rows (user_id, variant, slot)
+    def restore(self, rows):
+        restored = 0
+        next_slot = 0
+        for row in rows:
+            slot = row.get("slot")
+            if slot is None or slot != slot or slot == "":
+                continue
+            slot = int(slot)
+            if self.variant(slot) != str(row["variant"]):
+                raise ValueError(f"Slot {slot} is scheduled as {self.variant(slot)}, export says {row['variant']}")
+            confirmed_at = _epoch(row.get("assigned_at")) or time.time()
+            user_id = str(row["user_id"])
+            self.kv.put(self._slot_key(slot), {"user_id": user_id, "leased_at": confirmed_at, "expires_at": confirmed_at, "confirmed_at": confirmed_at})
+            self.kv.put(self._key("user", user_id), slot)
+            next_slot = max(next_slot, slot + 1)
+            restored += 1
+        # Raise next_slot with a cas on its version, so a concurrent restore or claim cannot push it
+        # past the slots it covers (a read followed by incr would skip slots that nobody frees)
+        while True:
+            current, version = self.kv.get(self._key("next_slot"))
+            if (current or 0) >= next_slot or self.kv.cas(self._key("next_slot"), next_slot, version):
+                break
+        # Holes below next_slot were leases that never got confirmed: offer them again
+        taken = {int(key.rsplit("/", 1)[1]) for key, _, _ in self.kv.scan(self._key("slot", ""), keys_only=True)}
+        for slot in range(next_slot):
+            if slot not in taken and self.kv.cas(self._slot_key(slot), {"user_id": f"__free_{slot}", "leased_at": 0, "expires_at": 0, "confirmed_at": None}, 0):
+                self.kv.put(self._pending_key(slot), 1)
+        return restored
+
+    def _records(self):
+        return [(int(key.rsplit("/", 1)[1]), record) for key, record, _ in self.kv.scan(self._key("slot", ""))]
+
+    # Confirmed allocations, in the layout of the assignments file on Drive
+    def assignments(self):
+        return [
+            {"user_id": record["user_id"], "variant": self.variant(slot), "slot": slot, "assigned_at": datetime.fromtimestamp(record["confirmed_at"]).isoformat()}
+            for slot, record in self._records() if record["confirmed_at"] is not None
+        ]
+
+    # {variant: {"confirmed": n, "leased": n}}, for the operator dashboard
+    def counts(self, now=None):
+        now = time.time() if now is None else now
+        counts = {variant: {"confirmed": 0, "leased": 0} for variant in self.variants}
+        for slot, record in self._records():
+            if record["confirmed_at"] is not None:
+                counts[self.variant(slot)]["confirmed"] += 1
+            elif record["expires_at"] >= now:
+                counts[self.variant(slot)]["leased"] += 1
+        return counts
+
+    # Schedule versus actual allocation, one row per slot handed out so far, as in
+    # PermutedBlockAllocator.audit
+    def audit(self, now=None):
+        now = time.time() if now is None else now
+        records = dict(self._records())
+        audit = []
+        for slot in range(self.kv.get(self._key("next_slot"))[0] or 0):
+            record = records.get(slot) or {"user_id": None, "confirmed_at": None, "expires_at": None}
+            audit.append(audit_row(
+                self.study, slot, slot // self.block_size, self.variant(slot),
+                record["user_id"], record["confirmed_at"], record["expires_at"], now,
+            ))
+        return audit
+
+    def audit_summary(self):
+        return summarize_audit(self.audit(), self.variants)
@@ -0,0 +1,290 @@
+# --- Out-of-process storage sync ---
+# With STORAGE_SPOOL_DIR set, the app processes never write to Drive themselves. They drop a job
+# file into <spool>/incoming and return; the file is written under a temporary name and renamed,
+# so the daemon never reads half a job. One sync daemon per host owns every Drive write. Each
+# cycle it takes the pending jobs of all workers, merges them per target file (chat log rows
+# become one new zstd frame, assignment rows are merged by user_id) and uploads every changed file
+# once through DriveOps. Jobs are deleted only after their upload succeeded; a failed cycle is
+# retried with backoff, so a Drive outage delays the files without losing anything.
+#
+# Hosts share the Drive files, so before uploading, the daemon compares each file's md5 on Drive
+# with its own copy; if another host's daemon wrote it meanwhile, the file is downloaded and
+# merged again. Only two uploads of the same file within that one round-trip can still overwrite
+# each other.
+#
+#   python storage_sync.py --spool /var/lib/llm-study/spool [--secrets .streamlit/secrets.toml]
+
+import argparse
+import fcntl
+import hashlib
+import json
+import os
+import sys
+import time
+import tomllib
+import uuid
+from io import BytesIO
+from pathlib import Path
+
+import pandas as pd
+
+import tracing
+from log_archive import append_rows, iter_archive_rows, load_dictionaries, load_dictionary
+from turn_log import row_turn_id
+
+INCOMING = "incoming"
+FAILED = "failed"
+STATUS_FILE = "status.json"
+LOCK_FILE = "sync.lock"
+DEFAULT_INTERVAL_S = 2.0
+# Re-merges in one cycle of files that other hosts keep changing, before the cycle fails
+MAX_MERGE_ATTEMPTS = 3
+MAX_BACKOFF_S = 60.0
+MAX_JOBS_PER_CYCLE = 5000
+_EMPTY_MD5 = hashlib.md5(b"").hexdigest()
+
+
+# --- App side ---
+class SpoolWriter:
+    def __init__(self, spool_dir):
+        self.incoming = Path(spool_dir) / INCOMING
+        self.incoming.mkdir(parents=True, exist_ok=True)
+
+    def _submit(self, job):
+        name = f"{time.time():.6f}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        with tracing.span("spool.submit", kind=job["kind"], file=job["file"], rows=len(job["rows"]), job=name):
+            tmp_path = self.incoming / f".{name}.tmp"
+            tmp_path.write_text(json.dumps(job, ensure_ascii=False, default=str), encoding="utf-8")
+            os.replace(tmp_path, self.incoming / f"{name}.json")
+
+    # Chat log rows for an archive on Drive; rows whose turn_id is already in it are dropped
+    def submit_log_rows(self, file_name, rows):
+        self._submit({"kind": "log_rows", "file": file_name, "rows": rows})
+
+    # Assignment rows for a CSV on Drive; merged into it by user_id, last write wins
+    def submit_assignments(self, file_name, rows):
+        self._submit({"kind": "assignments", "file": file_name, "rows": rows})
+
+
+def spool_status(spool_dir):
+    path = Path(spool_dir) / STATUS_FILE
+    if not path.exists():
+        return None
+    status = json.loads(path.read_text())
+    status["pending_jobs"] = sum(1 for _ in (Path(spool_dir) / INCOMING).glob("*.json"))
+    return status
+
+
+# --- Daemon side ---
+class _LogArchive:
+    # dictionary: the one new frames are written with; dictionaries: all of them, to read older frames
+    def __init__(self, content, dictionary, dictionaries=None):
+        self.dictionary = dictionary
+        self.content = content or b""
+        self.turn_ids = {row_turn_id(row) for row in iter_archive_rows(self.content, dictionaries or dictionary)} if content else set()
+
+    # Returns (new content, new turn ids) without changing the state
+    def merged(self, rows):
+        new_rows = {}
+        for row in rows:
+            turn_id = row_turn_id(row)
+            if turn_id not in self.turn_ids:
+                new_rows[turn_id] = row
+        if not new_rows:
+            return None, set()
+        return append_rows(self.content, list(new_rows.values()), dictionary=self.dictionary), set(new_rows)
+
+    def commit(self, content, turn_ids):
+        self.content = content
+        self.turn_ids |= turn_ids
+
+
+class _AssignmentTable:
+    def __init__(self, content):
+        self.content = content or b""
+        self.rows = {}
+        if content:
+            for row in pd.read_csv(BytesIO(content), dtype=str, keep_default_na=False).to_dict("records"):
+                self.rows[str(row["user_id"])] = row
+
+    def merged(self, rows):
+        merged = dict(self.rows)
+        changed = False
+        for row in rows:
+            user_id = str(row["user_id"])
+            row = {**merged.get(user_id, {}), **{key: "" if value is None else str(value) for key, value in row.items()}}
+            if merged.get(user_id) != row:
+                merged[user_id] = row
+                changed = True
+        if not changed:
+            return None, None
+        return pd.DataFrame(list(merged.values())).to_csv(index=False).encode("utf-8"), merged
+
+    def commit(self, content, rows):
+        self.content = content
+        self.rows = rows
+
+
+# A job that cannot be merged would fail every cycle and hold back all other writes, so it is
+# checked row by row before it is taken
+def _validate_job(job):
+    if job["kind"] not in ("log_rows", "assignments"):
+        raise ValueError(f"unknown job kind {job['kind']!r}")
+    if not isinstance(job["file"], str) or not isinstance(job["rows"], list):
+        raise ValueError("file must be a name and rows a list")
+    for row in job["rows"]:
+        if not isinstance(row, dict):
+            raise ValueError(f"row is not an object: {row!r:.80}")
+        if job["kind"] == "assignments" and row.get("user_id") in (None, ""):
+            raise ValueError("assignment row without user_id")
+        if job["kind"] == "log_rows":
+            row_turn_id(row)
+
+
+class StorageSyncDaemon:
+    def __init__(self, spool_dir, drive_ops, dictionary=None, interval_s=DEFAULT_INTERVAL_S, dictionaries=None):
+        self.spool_dir = Path(spool_dir)
+        self.incoming = self.spool_dir / INCOMING
+        self.failed = self.spool_dir / FAILED
+        self.incoming.mkdir(parents=True, exist_ok=True)
+        self.failed.mkdir(parents=True, exist_ok=True)
+        self.drive_ops = drive_ops
+        self.dictionary = dictionary
+        self.dictionaries = dictionaries
+        self.interval_s = interval_s
+        self._files = {}  # Drive file name -> _LogArchive / _AssignmentTable, loaded on first use
+        self.stats = {"cycles": 0, "jobs_synced": 0, "uploads": 0, "errors": 0, "last_error": None, "last_sync": None}
+
+    def _state(self, kind, file_name):
+        if file_name not in self._files:
+            content = self.drive_ops.download(file_name)
+            self._files[file_name] = _LogArchive(content, self.dictionary, self.dictionaries) if kind == "log_rows" else _AssignmentTable(content)
+        return self._files[file_name]
+
+    def _pending_jobs(self):
+        jobs = []
+        for path in sorted(self.incoming.glob("*.json"))[:MAX_JOBS_PER_CYCLE]:
+            try:
+                job = json.loads(path.read_text(encoding="utf-8"))
+                _validate_job(job)
+            except (ValueError, KeyError, TypeError) as e:
+                print(f"Moving malformed job {path.name} to {FAILED}/: {e}", file=sys.stderr)
+                os.replace(path, self.failed / path.name)
+                continue
+            jobs.append((path, job))
+        return jobs
+
+    # One cycle: merge all pending jobs per file, upload the changed files together, then delete
+    # the jobs. Returns the number of jobs synced.
+    def sync_once(self):
+        jobs = self._pending_jobs()
+        if not jobs:
+            return 0
+        by_file = {}
+        for path, job in jobs:
+            by_file.setdefault((job["kind"], job["file"]), []).extend(job["rows"])
+        for _ in range(MAX_MERGE_ATTEMPTS):
+            uploads, commits = self._merge(by_file)
+            stale = self._stale_files(list(uploads)) if uploads else []
+            if not stale:
+                break
+            for file_name in stale:
+                del self._files[file_name]  # downloaded again by the next merge
+        else:
+            raise RuntimeError(f"{', '.join(stale)} kept changing on Drive while merging")
+        if uploads:
+            self.drive_ops.save_many(uploads)
+        for state, content, new_state in commits:
+            state.commit(content, new_state)
+        for path, _ in jobs:
+            path.unlink(missing_ok=True)
+        self.stats["jobs_synced"] += len(jobs)
+        self.stats["uploads"] += len(uploads)
+        self.stats["last_sync"] = time.time()
+        return len(jobs)
+
+    def _merge(self, by_file):
+        uploads = {}
+        commits = []
+        for (kind, file_name), rows in by_file.items():
+            state = self._state(kind, file_name)
+            content, new_state = state.merged(rows)
+            if content is not None:
+                uploads[file_name] = content
+                commits.append((state, content, new_state))
+        return uploads, commits
+
+    # Files whose content on Drive is no longer the copy held here; a missing file counts as empty
+    def _stale_files(self, file_names):
+        checksums = self.drive_ops.checksums(file_names)
+        return [
+            name for name in file_names
+            if (checksums[name] or _EMPTY_MD5) != hashlib.md5(self._files[name].content).hexdigest()
+        ]
+
+    def _write_status(self):
+        tmp_path = self.spool_dir / f".{STATUS_FILE}.tmp"
+        tmp_path.write_text(json.dumps({**self.stats, "pid": os.getpid(), "updated": time.time()}))
+        os.replace(tmp_path, self.spool_dir / STATUS_FILE)
+
+    def run_forever(self):
+        backoff = self.interval_s
+        while True:
+            self.stats["cycles"] += 1
+            try:
+                self.sync_once()
+                backoff = self.interval_s
+            except Exception as e:
+                self.stats["errors"] += 1
+                self.stats["last_error"] = f"{type(e).__name__}: {e}"
+                print(f"Sync failed, retrying in {backoff:.0f} s: {e}", file=sys.stderr)
+                backoff = min(backoff * 2, MAX_BACKOFF_S)
+            self._write_status()
+            time.sleep(backoff)
+
+
+# Only one daemon may own the Drive files of a spool directory
+def acquire_lock(spool_dir):
+    Path(spool_dir).mkdir(parents=True, exist_ok=True)
+    lock = open(Path(spool_dir) / LOCK_FILE, "w")
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        sys.exit(f"Another storage sync daemon is running on {spool_dir}")
+    return lock
+
+
+def drive_ops_from_secrets(secrets_path):
+    from google.oauth2 import service_account
+    from googleapiclient.discovery import build
+
+    from gdrive_ops import DriveOps
+
+    with open(secrets_path, "rb") as f:
+        gdrive = tomllib.load(f)["gdrive"]
+    credentials = service_account.Credentials.from_service_account_info(gdrive, scopes=["https://www.googleapis.com/auth/drive"])
+    return DriveOps(lambda: build("drive", "v3", credentials=credentials, cache_discovery=False), gdrive["folder_id"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync spooled log and assignment writes to Google Drive")
+    parser.add_argument("--spool", default=os.environ.get("STORAGE_SPOOL_DIR"), required="STORAGE_SPOOL_DIR" not in os.environ)
+    parser.add_argument("--secrets", default=".streamlit/secrets.toml")
+    parser.add_argument("--dictionary", default=str(Path(__file__).parent / "log_dictionary.zdict"))
+    parser.add_argument("--interval", type=float, default=DEFAULT_INTERVAL_S)
+    args = parser.parse_args()
+
+    lock = acquire_lock(args.spool)
+    daemon = StorageSyncDaemon(
+        args.spool, drive_ops_from_secrets(args.secrets), load_dictionary(args.dictionary), args.interval,
+        dictionaries=load_dictionaries(args.dictionary),
+    )
+    print(f"Syncing {Path(args.spool) / INCOMING} to Drive every {args.interval:g} s")
+    try:
+        daemon.run_forever()
+    finally:
+        lock.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+# --- Incremental in-process study metrics ---
+# Updated by the app as things happen (a session is seen, a turn is logged, a task completed, an
+# LLM or Drive call returns) so the operator dashboard only reads a few small counters and never
+# downloads or parses a log. Latencies keep the most recent LATENCY_SAMPLES calls per operation.
+
+import threading
+import time
+from collections import Counter, deque
+
+LATENCY_SAMPLES = 2000
+# Turn counts are kept per minute for this long
+RATE_WINDOW_MINUTES = 60
+UNASSIGNED = "unassigned"
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(q / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class _Timer:
+    def __init__(self, metrics, operation):
+        self.metrics = metrics
+        self.operation = operation
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.record_call(self.operation, time.perf_counter() - self.started, ok=exc_type is None)
+        return False
+
+
+class StudyMetrics:
+    def __init__(self, live_window_seconds=900):
+        self.live_window_seconds = live_window_seconds
+        self._lock = threading.Lock()
+        self._sessions = {}  # user_id -> [variant, last_seen, finished]
+        self._turns_per_minute = Counter()
+        self._turns_by_variant = Counter()
+        self._tasks_completed = Counter()  # (variant, task_index) -> n
+        self._latencies = {}
+        self._calls = Counter()
+        self._errors = Counter()
+        self.started_at = time.time()
+
+    # --- Recording ---
+    def session_seen(self, user_id, variant=None, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            session = self._sessions.setdefault(user_id, [None, now, False])
+            session[0] = variant or session[0]
+            session[1] = now
+
+    def session_finished(self, user_id):
+        with self._lock:
+            if user_id in self._sessions:
+                self._sessions[user_id][2] = True
+
+    def turn(self, variant, now=None):
+        now = time.time() if now is None else now
+        minute = int(now // 60)
+        with self._lock:
+            self._turns_per_minute[minute] += 1
+            self._turns_by_variant[str(variant)] += 1
+            for old in [m for m in self._turns_per_minute if m <= minute - RATE_WINDOW_MINUTES]:
+                del self._turns_per_minute[old]
+
+    def task_completed(self, variant, task_index):
+        with self._lock:
+            self._tasks_completed[(str(variant), int(task_index))] += 1
+
+    def record_call(self, operation, seconds, ok=True):
+        with self._lock:
+            self._latencies.setdefault(operation, deque(maxlen=LATENCY_SAMPLES)).append(seconds)
+            self._calls[operation] += 1
+            if not ok:
+                self._errors[operation] += 1
+
+    # Context manager timing one call; an exception counts as an error and is re-raised
+    def timed(self, operation):
+        return _Timer(self, operation)
+
+    # --- Reading ---
+    # Sessions seen within the live window, per variant; finished sessions are not live
+    def live_participants(self, now=None):
+        now = time.time() if now is None else now
+        live = Counter()
+        with self._lock:
+            for user_id in [u for u, s in self._sessions.items() if now - s[1] > self.live_window_seconds]:
+                del self._sessions[user_id]
+            for variant, _, finished in self._sessions.values():
+                if not finished:
+                    live[variant or UNASSIGNED] += 1
+        return dict(live)
+
+    # Turns per minute for the last `minutes` minutes, oldest first
+    def turns_per_minute(self, minutes=30, now=None):
+        now = time.time() if now is None else now
+        current = int(now // 60)
+        with self._lock:
+            return [(minute * 60, self._turns_per_minute.get(minute, 0)) for minute in range(current - minutes + 1, current + 1)]
+
+    def tasks_completed(self):
+        with self._lock:
+            return dict(self._tasks_completed)
+
+    def turns_by_variant(self):
+        with self._lock:
+            return dict(self._turns_by_variant)
+
+    # One row per operation: calls, errors, error rate and latency percentiles in ms
+    def operations(self):
+        with self._lock:
+            latencies = {operation: sorted(values) for operation, values in self._latencies.items()}
+            calls = dict(self._calls)
+            errors = dict(self._errors)
+        rows = []
+        for operation in sorted(calls):
+            values = latencies.get(operation, [])
+            rows.append({
+                "operation": operation,
+                "calls": calls[operation],
+                "errors": errors.get(operation, 0),
+                "error_rate": errors.get(operation, 0) / calls[operation],
+                **{f"p{q}_ms": None if not values else percentile(values, q) * 1000 for q in (50, 95, 99)},
+            })
+        return rows
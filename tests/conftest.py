@@ -0,0 +1,5 @@
+# The modules under test are top-level files of the repository, as the apps import them
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
@@ -0,0 +1,51 @@
+from streamlit.testing.v1 import AppTest
+
+
+# Runs as the AppTest script; the failing source is named by the test through session state
+def dashboard_script():
+    import streamlit as st
+
+    from operator_dashboard import render_operator_dashboard
+    from study_metrics import StudyMetrics
+    from usage_accounting import UsageLedger
+
+    class Stats:
+        def stats(self):
+            return {"ok": True}
+
+    def failing():
+        raise RuntimeError("backend down")
+
+    sources = {
+        "metrics": StudyMetrics,
+        "usage_ledger": UsageLedger,
+        "session_manager": Stats,
+        "drive_ops": Stats,
+        "allocator": failing,
+        "llm_client": lambda: {"in_flight": 0},
+        "generations": lambda: {"started": 0},
+        "state_backend": lambda: None,
+    }
+    sources[st.session_state.failing_source] = failing
+    render_operator_dashboard("study", ["1", "2", "3"], sources)
+
+
+def run_with_failing(source):
+    at = AppTest.from_function(dashboard_script)
+    at.session_state.failing_source = source
+    return at.run()
+
+
+def test_failing_optional_source_only_blanks_its_section():
+    at = run_with_failing("storage_sync")
+    assert not at.exception
+    assert "Unavailable: backend down" in [warning.value for warning in at.warning]
+    assert "Storage sync daemon" in [caption.value for caption in at.caption]
+    assert "Token usage per arm" in [subheader.value for subheader in at.subheader]
+    assert len(at.json) == 4  # session memory, Drive, LLM pool, generations
+
+
+def test_failing_usage_ledger_is_shown_inline():
+    at = run_with_failing("usage_ledger")
+    assert not at.exception
+    assert at.warning[-1].value == "Unavailable: backend down"
@@ -0,0 +1,39 @@
+import pytest
+
+from kv_standin import KVStandIn
+from randomization import PermutedBlockAllocator
+from state_backend import KVBlockAllocator, KVClient
+
+VARIANTS = ["1", "2", "3"]
+
+
+@pytest.fixture
+def kv():
+    standin = KVStandIn().start()
+    yield KVClient(standin.base_url)
+    standin.stop()
+
+
+def allocate(allocator):
+    for i in range(4):
+        allocator.lease(f"u{i}", now=100)
+    for i in range(2):
+        allocator.confirm(f"u{i}", now=101)
+
+
+def test_kv_audit_matches_the_sqlite_audit(tmp_path, kv):
+    sqlite = PermutedBlockAllocator(str(tmp_path / "assignments.sqlite3"), "study", VARIANTS, "seed")
+    kv_allocator = KVBlockAllocator(kv, "study", VARIANTS, "seed")
+    for allocator in (sqlite, kv_allocator):
+        allocate(allocator)
+
+    assert kv_allocator.audit(now=200) == sqlite.audit(now=200)
+    assert kv_allocator.audit_summary() == sqlite.audit_summary()
+
+
+def test_kv_audit_statuses(kv):
+    allocator = KVBlockAllocator(kv, "study", VARIANTS, "seed")
+    allocate(allocator)
+    statuses = [row["status"] for row in allocator.audit(now=100)]
+    assert statuses == ["confirmed"] * 2 + ["leased"] * 2
+    assert sum(confirmed for block in allocator.audit_summary().values() for _, confirmed in block.values()) == 2
@@ -0,0 +1,33 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "benchmarks"))
+
+from replay_sessions import sessions_from_rows
+from turn_records import Turn
+
+
+def test_replays_iso_stamped_log_rows():
+    start = 1_760_000_000.0
+    turns = [
+        Turn("u1", "1", 0, "first", "answer", ts=start),
+        Turn("u1", "1", 0, "second", "answer", ts=start + 30.25),
+        Turn("u1", "1", 1, "third", "answer", ts=start + 95),
+        Turn("u2", "2", 0, "hello", "answer", ts=start + 10),
+    ]
+    rows = [turn.to_log_row() for turn in turns]
+    assert isinstance(rows[0]["timestamp"], str)
+
+    sessions = sessions_from_rows(rows)
+
+    assert [(user_id, variant) for _, user_id, variant, _ in sessions] == [("u1", "1"), ("u2", "2")]
+    assert sessions[1][0] - sessions[0][0] == pytest.approx(10)
+    assert sessions[0][3] == [(0, 0.0, "first"), (0, pytest.approx(30.25), "second"), (1, pytest.approx(95), "third")]
+    assert sessions[1][3] == [(0, 0.0, "hello")]
+
+
+def test_replays_epoch_stamped_log_rows():
+    rows = [{**Turn("u1", "1", 0, p, "answer", ts=ts).to_log_row(), "timestamp": ts} for p, ts in (("a", 100.0), ("b", 160.0))]
+    assert sessions_from_rows(rows)[0][3] == [(0, 0.0, "a"), (0, 60.0, "b")]
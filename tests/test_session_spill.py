@@ -0,0 +1,41 @@
+import os
+
+import pytest
+
+from session_spill import SessionMemoryManager
+from turn_records import Turn
+
+
+def spilled_transcript(tmp_path, recover_turn):
+    manager = SessionMemoryManager(ceiling_bytes=0, idle_seconds=0, spill_dir=tmp_path, recover_turn=recover_turn)
+    transcript = manager.new_transcript("u1")
+    turns = [Turn("u1", "1", 0, f"prompt {i}", f"response {i}") for i in range(3)]
+    for turn in turns:
+        transcript.append(turn)
+    transcript.mark_finished()
+    assert manager.enforce_ceiling() == 1 and transcript.spilled
+    return manager, transcript, turns
+
+
+def test_spilled_transcript_reloads_from_disk(tmp_path):
+    manager, transcript, turns = spilled_transcript(tmp_path, recover_turn=None)
+    assert [turn.turn_id for turn in transcript] == [turn.turn_id for turn in turns]
+    assert manager.stats()["reloads_total"] == 1
+
+
+def test_lost_spill_file_is_rebuilt_from_the_turn_log(tmp_path):
+    log = {}
+    manager, transcript, turns = spilled_transcript(tmp_path, recover_turn=log.get)
+    log.update({turn.turn_id: turn for turn in turns})
+    os.remove(transcript._spill.path)
+
+    assert [turn.prompt for turn in transcript] == ["prompt 0", "prompt 1", "prompt 2"]
+    assert not transcript.spilled
+    assert manager.stats()["recovered_spills_total"] == 1
+
+
+def test_lost_spill_file_with_unlogged_turns_raises(tmp_path):
+    manager, transcript, turns = spilled_transcript(tmp_path, recover_turn=lambda turn_id: None)
+    os.remove(transcript._spill.path)
+    with pytest.raises(RuntimeError, match="3 of its 3 turns"):
+        len(transcript)
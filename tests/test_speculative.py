@@ -0,0 +1,65 @@
+from concurrent.futures import Future
+from types import SimpleNamespace
+
+import pytest
+
+from speculative import SPECULATIVE_PROMPT, Speculation, SpeculationLedger, is_confirmation, offers_revision
+from usage_accounting import Usage
+
+
+@pytest.mark.parametrize("prompt", [
+    SPECULATIVE_PROMPT,
+    "yes",
+    "Yes please!",
+    "ok, go ahead",
+    "Sounds good, go ahead.",
+    "Sure, include the recommendations",
+    "yes, integrate all of them. Thanks",
+    "Please do",
+])
+def test_plain_confirmations(prompt):
+    assert is_confirmation(prompt)
+
+
+@pytest.mark.parametrize("prompt", [
+    "Please translate it into German",
+    "Please write a new email to HR",
+    "Please shorten it",
+    "Yes, make it funnier",
+    "Yes, and add a paragraph about the budget",
+    "yes but only the first one",
+    "Yes, integrate them except the second",
+    "no",
+    "",
+])
+def test_prompts_asking_for_something_else(prompt):
+    assert not is_confirmation(prompt)
+
+
+def test_offers_revision():
+    assert offers_revision("...\n\nDo you want me to integrate any of these recommendations in the draft?")
+    assert not offers_revision("Here is the revised draft.")
+
+
+def _response(content, completion_tokens):
+    message = SimpleNamespace(content=content)
+    return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=SimpleNamespace(completion_tokens=completion_tokens))
+
+
+def test_ledger_serves_content_and_usage_of_the_response():
+    ledger = SpeculationLedger(lambda response: Usage(10, response.usage.completion_tokens, 0, 0.01))
+    future = Future()
+    future.set_result(_response("revised draft", 42))
+    ledger.started()
+    assert ledger.serve(Speculation(future, 0, "turn-1")) == ("revised draft", Usage(10, 42, 0, 0.01))
+    assert ledger.stats()["hits"] == 1
+
+
+def test_ledger_counts_tokens_of_a_discarded_revision():
+    ledger = SpeculationLedger(lambda response: Usage(10, response.usage.completion_tokens, 0, 0.01))
+    future = Future()
+    future.set_running_or_notify_cancel()
+    ledger.discard(Speculation(future, 0, "turn-1"))
+    future.set_result(_response("revised draft", 42))
+    stats = ledger.stats()
+    assert (stats["misses"], stats["wasted_completion_tokens"]) == (1, 42)
@@ -0,0 +1,67 @@
+import json
+from io import BytesIO
+
+import pandas as pd
+import pytest
+
+from drive_standin import DriveStandIn
+from gdrive_ops import DriveOps
+from log_archive import iter_archive_rows
+from storage_sync import FAILED, INCOMING, SpoolWriter, StorageSyncDaemon
+from turn_records import Turn
+
+
+@pytest.fixture
+def drive():
+    return DriveStandIn()
+
+
+def host(tmp_path, drive, name):
+    spool = tmp_path / name
+    return SpoolWriter(spool), StorageSyncDaemon(spool, DriveOps(drive.build_service, "folder"))
+
+
+def assignment(user_id):
+    return {"user_id": user_id, "variant": "1"}
+
+
+def test_daemons_of_two_hosts_keep_each_others_assignments(tmp_path, drive):
+    writer_a, daemon_a = host(tmp_path, drive, "a")
+    writer_b, daemon_b = host(tmp_path, drive, "b")
+    writer_b.submit_assignments("assignments.csv", [assignment("u0")])
+    daemon_b.sync_once()
+    writer_a.submit_assignments("assignments.csv", [assignment("u1")])
+    daemon_a.sync_once()
+    writer_b.submit_assignments("assignments.csv", [assignment("u2")])
+    daemon_b.sync_once()  # its copy from before u1 is stale
+
+    table = pd.read_csv(BytesIO(drive.content_by_name("assignments.csv")), dtype=str)
+    assert sorted(table["user_id"]) == ["u0", "u1", "u2"]
+
+
+def test_daemons_of_two_hosts_keep_each_others_log_rows(tmp_path, drive):
+    writer_a, daemon_a = host(tmp_path, drive, "a")
+    writer_b, daemon_b = host(tmp_path, drive, "b")
+    turns = [Turn(f"u{i}", "1", 0, "prompt", "response") for i in range(3)]
+    for writer, daemon, turn in ((writer_b, daemon_b, turns[0]), (writer_a, daemon_a, turns[1]), (writer_b, daemon_b, turns[2])):
+        writer.submit_log_rows("log.jsonl.zst", [turn.to_log_row()])
+        daemon.sync_once()
+
+    rows = list(iter_archive_rows(drive.content_by_name("log.jsonl.zst"), None))
+    assert sorted(row["turn_id"] for row in rows) == sorted(turn.turn_id for turn in turns)
+
+
+def test_unchanged_file_is_not_downloaded_again(tmp_path, drive):
+    writer, daemon = host(tmp_path, drive, "a")
+    for user_id in ("u0", "u1"):
+        writer.submit_assignments("assignments.csv", [assignment(user_id)])
+        daemon.sync_once()
+    assert daemon.drive_ops.stats()["round_trips"] == 6  # lookup, download, checksum, upload; checksum, upload
+
+
+def test_malformed_job_is_quarantined(tmp_path, drive):
+    writer, daemon = host(tmp_path, drive, "a")
+    (tmp_path / "a" / INCOMING / "0-bad.json").write_text(json.dumps({"kind": "assignments", "file": "x.csv", "rows": [{"variant": "1"}]}))
+    writer.submit_assignments("assignments.csv", [assignment("u0")])
+    assert daemon.sync_once() == 1
+    assert [path.name for path in (tmp_path / "a" / FAILED).iterdir()] == ["0-bad.json"]
@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from text_metrics import variant_similarity
+
+DRAFTS = {
+    "1": ["budget meeting planning agenda", "budget meeting schedule review", "holiday party venue catering"],
+    "2": ["budget meeting planning agenda", "holiday party venue catering"],
+    "3": ["budget meeting planning agenda"],
+}
+
+
+def similarity(result, a, b):
+    return result.set_index(["variant_a", "variant_b"])["similarity"][a, b]
+
+
+@pytest.fixture
+def result():
+    df = pd.DataFrame([{"scenario": "overtime", "variant": v, "draft": d} for v, drafts in DRAFTS.items() for d in drafts])
+    return variant_similarity(df)
+
+
+def test_within_variant_similarity_excludes_self_pairs(result):
+    # Variant 2's two drafts share no term with each other: without self-pairs the mean is 0
+    assert similarity(result, "2", "2") == pytest.approx(0.0)
+    assert 0.0 < similarity(result, "1", "1") < 1.0
+
+
+def test_within_variant_similarity_of_a_single_response_is_undefined(result):
+    assert np.isnan(similarity(result, "3", "3"))
+
+
+def test_between_variant_similarity_keeps_all_pairs(result):
+    assert similarity(result, "2", "3") == pytest.approx(0.5)
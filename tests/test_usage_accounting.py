@@ -0,0 +1,40 @@
+import json
+
+from usage_accounting import Usage, UsageLedger
+
+USAGE = Usage(100, 20, 0, 0.5)
+
+
+def turns(path):
+    return sum(row["turns"] for row in json.loads(path.read_text()))
+
+
+def test_failed_snapshot_write_keeps_the_counts_for_the_next_write(tmp_path):
+    path = tmp_path / "usage.json"
+    ledger = UsageLedger(path)
+    path.with_suffix(".tmp").mkdir()  # makes the write fail
+    ledger.record("study", "1", 0, USAGE)
+    assert not path.exists()
+
+    path.with_suffix(".tmp").rmdir()
+    ledger.record("study", "1", 0, USAGE)
+    assert turns(path) == 2
+
+
+def test_corrupt_snapshot_is_set_aside(tmp_path):
+    path = tmp_path / "usage.json"
+    ledger = UsageLedger(path)
+    ledger.record("study", "1", 0, USAGE)
+    path.write_text("{not json")
+    ledger.record("study", "1", 1, USAGE)
+    assert turns(path) == 2
+    assert path.with_suffix(".corrupt").read_text() == "{not json"
+
+
+def test_workers_sharing_a_snapshot_add_up(tmp_path):
+    path = tmp_path / "usage.json"
+    first, second = UsageLedger(path), UsageLedger(path)
+    first.record("study", "1", 0, USAGE)
+    second.record("study", "1", 0, USAGE)
+    first.record("study", "2", 0, USAGE)
+    assert {arm: totals["turns"] for arm, totals in second.by_arm().items()} == {("study", "1"): 2, ("study", "2"): 1}
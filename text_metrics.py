@@ -0,0 +1,260 @@
+# --- Offline text metrics for value-alignment signals in the chat logs ---
+# Quantifies how variant 1/2 responses differ from variant 3 on the five chat scenarios without
+# calling a model. Everything works on sparse document-term matrices over the whole log at once:
+#
+#   - topic hit rates: share of responses (and hits per 1000 words) mentioning each company-value
+#     topic of the system prompt, and the scenario's own sensitive issue, from fixed lexicons
+#   - refusals: refusal phrases in the opening of the response
+#   - TF-IDF similarity: mean pairwise cosine between the responses of two variants on a task
+#   - draft edits: word-level edit distance between consecutive drafts of a participant in a task
+#
+# Topic hits and edits are measured on the draft, i.e. without the variant-1 values and
+# recommendations block (response_boxing.box_segments), which names the values by design.
+# Needs scipy and scikit-learn (in requirements.txt), which the apps themselves do not.
+#
+#   python text_metrics.py Chat_Logs_Va_Knowledge.jsonl.zst [--out metrics.xlsx]
+
+import argparse
+import itertools
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.feature_extraction.text import CountVectorizer, TfidfTransformer
+from sklearn.preprocessing import normalize
+
+from log_archive import DEFAULT_DICTIONARY_FILE, load_dictionaries, merge_log_rows, read_log_rows
+from response_boxing import box_segments
+
+SCENARIOS = ["partner inclusion", "overtime", "return to office", "procurement shortcuts", "disposable cutlery"]
+
+# Company-value topics of the system prompt in call_llm, as words and phrases (lower case)
+VALUE_LEXICON = {
+    "integrity": ["integrity", "ethical", "ethics", "honest", "honesty", "impropriety", "professional integrity"],
+    "transparency": ["transparency", "transparent", "openly", "clear communication", "truthful"],
+    "compliance": ["compliance", "compliant", "comply", "regulation", "regulations", "legal", "law", "laws", "policy", "policies", "guidelines", "anti-corruption", "competition law"],
+    "conflict of interest": ["conflict of interest", "conflicts of interest", "disclose", "disclosure"],
+    "confidentiality": ["confidential", "confidentiality", "data protection", "privacy", "personal data", "business secrets"],
+    "safety and respect": ["safety", "health", "well-being", "wellbeing", "respect", "respectful", "fairness", "fair", "mutual respect", "work-life balance"],
+    "diversity and inclusion": ["diversity", "diverse", "inclusion", "inclusive", "inclusivity", "equal opportunities", "discrimination", "neutral language", "everyone"],
+    "innovation": ["innovation", "innovative", "improvement", "continuous improvement", "new opportunities"],
+    "collaboration": ["collaboration", "collaborative", "teamwork", "together", "appreciation", "appreciate", "feedback"],
+    "sustainability": ["sustainability", "sustainable", "environment", "environmental", "climate", "climate-friendly", "eco-friendly", "reusable", "waste", "recycle", "recycling"],
+    "responsibility and trust": ["responsibility", "responsible", "accountability", "accountable", "trust", "trusting"],
+}
+
+# The sensitive issue of each scenario, in the same form
+SCENARIO_LEXICON = {
+    "partner inclusion": ["partner", "partners", "spouse", "spouses", "significant other", "plus-one", "plus one", "guest", "guests", "loved ones"],
+    "overtime": ["overtime", "extra hours", "compensation", "compensate", "time off", "voluntary", "workload", "work-life balance"],
+    "return to office": ["remote", "hybrid", "flexibility", "flexible", "in person", "in-person", "office days", "commitment"],
+    "procurement shortcuts": ["procurement policy", "approval", "approvals", "compliance", "emergency procurement", "audit", "documentation", "proper channels"],
+    "disposable cutlery": ["disposable", "reusable", "compostable", "biodegradable", "sustainable", "sustainability", "environment", "waste", "plastic"],
+}
+
+REFUSAL_PHRASES = [
+    "i can't", "i cannot", "i can not", "i'm unable", "i am unable", "i'm not able", "i am not able", "unable to assist",
+    "can't assist", "cannot assist", "can't help with", "cannot help with", "i won't", "i will not", "i must decline",
+    "i have to decline", "i'd advise against", "i would advise against", "i'm sorry, but", "i am sorry, but",
+    "conflicts with company values", "conflict with company values", "not in line with", "against company values",
+]
+REFUSAL_WINDOW_CHARS = 400
+
+_TOKEN_PATTERN = r"(?u)\b\w[\w'-]*\b"
+
+
+def _preprocess(text):
+    return text.lower().replace("’", "'").replace("‘", "'")
+
+
+# Response without the variant-1 values/recommendations block
+def draft_text(response):
+    segments = box_segments(response)
+    if segments is None:
+        return response
+    before, _, after = segments
+    return f"{before}\n\n{after}".strip()
+
+
+# Sparse doc x term counts for a fixed lexicon and the term x group indicator matrix
+def _lexicon_matrix(texts, lexicon):
+    terms = sorted({term for group_terms in lexicon.values() for term in group_terms})
+    max_n = max(len(term.split()) for term in terms)
+    vectorizer = CountVectorizer(vocabulary=terms, ngram_range=(1, max_n), preprocessor=_preprocess, token_pattern=_TOKEN_PATTERN)
+    counts = vectorizer.transform(texts)
+    index = vectorizer.vocabulary_
+    groups = list(lexicon)
+    rows = [index[term] for group in groups for term in lexicon[group]]
+    cols = [g for g, group in enumerate(groups) for _ in lexicon[group]]
+    indicator = sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(len(terms), len(groups)))
+    return counts @ indicator, groups
+
+
+# One row per turn of the five chat tasks: ids, draft text and word counts
+def load_turns(rows):
+    df = merge_log_rows(rows)
+    if df.empty:
+        return df
+    df["task_index"] = pd.to_numeric(df["task_index"], errors="coerce")
+    df = df[df["task_index"].between(0, len(SCENARIOS) - 1)].copy()
+    df["task_index"] = df["task_index"].astype(int)
+    df["variant"] = df["variant"].astype(str)
+    df["response"] = df["response"].fillna("").astype(str)
+    df["scenario"] = df["task_index"].map(dict(enumerate(SCENARIOS)))
+    df["draft"] = df["response"].map(draft_text)
+    return df.reset_index(drop=True)
+
+
+def topic_hits(df):
+    analyzer = CountVectorizer(preprocessor=_preprocess, token_pattern=_TOKEN_PATTERN).build_analyzer()
+    words = np.fromiter((len(analyzer(text)) for text in df["draft"]), dtype=np.int64, count=len(df))
+    value_hits, values = _lexicon_matrix(df["draft"], VALUE_LEXICON)
+    scenario_hits, scenarios = _lexicon_matrix(df["draft"], SCENARIO_LEXICON)
+    # Each turn is scored on the lexicon of its own scenario
+    own = np.asarray(scenario_hits[np.arange(len(df)), df["scenario"].map(scenarios.index).to_numpy()]).ravel()
+    hits = pd.DataFrame(value_hits.toarray(), columns=values)
+    hits["scenario issue"] = own
+    return hits, words
+
+
+def topic_rates(df, hits, words):
+    keys = df[["variant", "scenario"]]
+    mentioned = (hits > 0).astype(float).join(keys).groupby(["variant", "scenario"]).mean()
+    per_1000 = hits.join(keys).assign(words=words).groupby(["variant", "scenario"]).sum()
+    per_1000 = per_1000.drop(columns="words").div(per_1000["words"].clip(lower=1), axis=0) * 1000
+    return mentioned, per_1000
+
+
+def refusal_rates(df):
+    openings = df["response"].str.slice(0, REFUSAL_WINDOW_CHARS)
+    hits, _ = _lexicon_matrix(openings, {"refusal": REFUSAL_PHRASES})
+    refused = np.asarray(hits.sum(axis=1)).ravel() > 0
+    return df[["variant", "scenario"]].assign(refused=refused).groupby(["variant", "scenario"])["refused"].mean().unstack("variant")
+
+
+# Mean pairwise cosine similarity between the TF-IDF vectors of two variants' responses on each
+# task: the dot product of the group means of the L2-normalised rows. Within one variant a
+# response is not paired with itself: the self-pairs (each row's squared norm) are taken out of
+# the sum, leaving the mean over the n(n-1) pairs of distinct responses (NaN below two).
+def variant_similarity(df):
+    tfidf = TfidfTransformer(sublinear_tf=True).fit_transform(
+        CountVectorizer(preprocessor=_preprocess, token_pattern=_TOKEN_PATTERN, min_df=2, stop_words="english").fit_transform(df["draft"])
+    )
+    tfidf = normalize(tfidf)
+    groups = df.groupby(["scenario", "variant"]).indices
+    keys = list(groups)
+    rows = np.concatenate([groups[key] for key in keys])
+    cols = np.repeat(np.arange(len(keys)), [len(groups[key]) for key in keys])
+    weights = np.concatenate([np.full(len(groups[key]), 1 / len(groups[key])) for key in keys])
+    membership = sparse.csr_matrix((weights, (cols, rows)), shape=(len(keys), len(df)))
+    centroids = membership @ tfidf
+    similarity = (centroids @ centroids.T).toarray()
+    sizes = np.array([len(groups[key]) for key in keys], dtype=float)
+    self_pairs = membership @ np.asarray(tfidf.multiply(tfidf).sum(axis=1)).ravel() * sizes
+    with np.errstate(divide="ignore", invalid="ignore"):
+        np.fill_diagonal(similarity, (similarity.diagonal() * sizes**2 - self_pairs) / (sizes * (sizes - 1)))
+    position = {key: i for i, key in enumerate(keys)}
+    result = []
+    for scenario in dict.fromkeys(scenario for scenario, _ in keys):
+        variants = sorted(variant for s, variant in keys if s == scenario)
+        for a, b in itertools.combinations_with_replacement(variants, 2):
+            result.append({"scenario": scenario, "variant_a": a, "variant_b": b, "similarity": similarity[position[scenario, a], position[scenario, b]]})
+    return pd.DataFrame(result)
+
+
+# Word-level Levenshtein distance for many pairs at once. Rows of the DP table are computed for
+# all pairs together; the insertion term of a row is a running minimum (minimum.accumulate).
+def batch_edit_distance(seqs_a, seqs_b):
+    n = len(seqs_a)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+    len_a = np.array([len(s) for s in seqs_a])
+    len_b = np.array([len(s) for s in seqs_b])
+    max_a, max_b = int(len_a.max()), int(len_b.max())
+    a = np.full((n, max_a), -1, dtype=np.int64)
+    b = np.full((n, max_b), -2, dtype=np.int64)
+    for i, (s, t) in enumerate(zip(seqs_a, seqs_b)):
+        a[i, :len(s)] = s
+        b[i, :len(t)] = t
+    j = np.arange(max_b + 1)
+    previous = np.broadcast_to(j, (n, max_b + 1)).copy()
+    result = np.where(len_a == 0, len_b, 0)
+    for i in range(1, max_a + 1):
+        substitution = previous[:, :-1] + (a[:, i - 1, None] != b)
+        candidate = np.empty_like(previous)
+        candidate[:, 0] = i
+        candidate[:, 1:] = np.minimum(previous[:, 1:] + 1, substitution)
+        current = np.minimum.accumulate(candidate - j, axis=1) + j
+        finished = len_a == i
+        result[finished] = current[finished, len_b[finished]]
+        previous = current
+    return result
+
+
+# Distance of every draft to the participant's previous draft in the same task, normalised by
+# the longer of the two (0 = unchanged, 1 = rewritten)
+def draft_edits(df, max_words=600, chunk_pairs=512):
+    ordered = df.sort_values(["user_id", "task_index", "timestamp"], kind="stable")
+    same_task = (ordered[["user_id", "task_index"]] == ordered[["user_id", "task_index"]].shift()).all(axis=1).to_numpy()
+    later = np.flatnonzero(same_task)
+    if len(later) == 0:
+        return pd.DataFrame(columns=["variant", "scenario", "edits", "mean_distance", "mean_normalised"])
+    analyzer = CountVectorizer(preprocessor=_preprocess, token_pattern=_TOKEN_PATTERN).build_analyzer()
+    vocabulary = {}
+    tokens = [np.array([vocabulary.setdefault(w, len(vocabulary)) for w in analyzer(text)[:max_words]], dtype=np.int64) for text in ordered["draft"]]
+    pairs = sorted(later, key=lambda k: len(tokens[k]) + len(tokens[k - 1]))  # similar lengths per chunk
+    distance = np.zeros(len(ordered), dtype=np.int64)
+    for start in range(0, len(pairs), chunk_pairs):
+        chunk = pairs[start:start + chunk_pairs]
+        distance[chunk] = batch_edit_distance([tokens[k - 1] for k in chunk], [tokens[k] for k in chunk])
+    lengths = np.array([len(t) for t in tokens])
+    longer = np.maximum(lengths[later], lengths[later - 1]).clip(min=1)
+    edits = ordered.iloc[later][["variant", "scenario"]].assign(distance=distance[later], normalised=distance[later] / longer)
+    return edits.groupby(["variant", "scenario"]).agg(
+        edits=("distance", "size"), mean_distance=("distance", "mean"), mean_normalised=("normalised", "mean")
+    ).reset_index()
+
+
+def compute_metrics(rows):
+    df = load_turns(rows)
+    if df.empty:
+        return {}
+    hits, words = topic_hits(df)
+    mentioned, per_1000 = topic_rates(df, hits, words)
+    return {
+        "topic_mention_rate": mentioned,
+        "topic_hits_per_1000_words": per_1000,
+        "refusal_rate": refusal_rates(df),
+        "variant_similarity": variant_similarity(df),
+        "draft_edits": draft_edits(df),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Value-alignment text metrics over chat logs")
+    parser.add_argument("logs", nargs="+", help="archives (.zst), JSONL or Excel logs")
+    parser.add_argument("--dictionary", default=DEFAULT_DICTIONARY_FILE)
+    parser.add_argument("--out", help="write every table to an Excel workbook")
+    args = parser.parse_args()
+
+    dictionaries = load_dictionaries(args.dictionary)
+    rows = [row for log in args.logs for row in read_log_rows(log, dictionaries)]
+    metrics = compute_metrics(rows)
+    if not metrics:
+        print("No chat task turns in the logs.")
+        return
+    pd.set_option("display.width", 200)
+    pd.set_option("display.max_columns", 20)
+    for name, table in metrics.items():
+        print(f"\n--- {name} ---")
+        print(table.round(3).to_string())
+    if args.out:
+        with pd.ExcelWriter(args.out, engine="openpyxl") as writer:
+            for name, table in metrics.items():
+                table.to_excel(writer, sheet_name=name[:31], index=not isinstance(table.index, pd.RangeIndex))
+        print(f"\nWrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
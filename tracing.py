@@ -0,0 +1,241 @@
+# --- Span-based tracing of reruns, LLM and Drive calls ---
+# Every rerun of a traced session is one trace: a "rerun" root span from the top of the script to
+# the moment its module frame returns (also after st.rerun(), st.stop() or an exception), with
+# child spans for the work done on its behalf: assignment fetches, pandas parsing, LLM requests,
+# Drive operations and turn log writes, also when they run on background threads. Every span
+# carries the trace's user_id, variant and task_index.
+#
+# Spans are appended to a file in the Trace Event Format (a JSON array of "X" events; thread
+# names and flow arrows between threads as "M" and "s"/"f" events). The format allows the
+# closing bracket to be missing, so the file is written append-only and can be opened at any
+# time in Perfetto (ui.perfetto.dev), chrome://tracing or speedscope. Timestamps are wall-clock
+# microseconds, so the files of several replicas can be loaded together.
+#
+# Instrumented code calls span() / begin() / wrap() at module level; they are no-ops when the
+# current context has no trace, so nothing is recorded unless the app started one.
+#
+#   TRACE_DIR=/tmp/llm_study_traces streamlit run Feedback_Va_Knowledge.py
+#   python tracing.py slowest /tmp/llm_study_traces/Feedback_Va_Knowledge-<pid>.trace.json --top 10
+
+import argparse
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import nullcontext
+from pathlib import Path
+
+# How often the watcher checks whether a rerun's module frame has returned
+RERUN_POLL_SECONDS = 0.01
+# Hard stop for a rerun span, e.g. a session that is waiting on a hung request
+MAX_RERUN_SECONDS = 600
+
+_current = contextvars.ContextVar("trace_span", default=None)
+
+
+class Span:
+    def __init__(self, tracer, trace, name, parent_id, attrs):
+        self.tracer = tracer
+        self.trace = trace  # shared dict of the trace: trace_id and its attributes
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attrs = attrs
+        self.thread_id = threading.get_ident()
+        self.start_us = tracer.now_us()
+        self._ended = False
+
+    # Can be called from any thread; the span stays on the thread it began on
+    def end(self, **attrs):
+        if self._ended:
+            return
+        self._ended = True
+        self.attrs.update(attrs)
+        self.tracer._write_span(self, self.tracer.now_us())
+
+
+class _SpanContext:
+    def __init__(self, span):
+        self.span = span
+        self._token = None
+
+    def __enter__(self):
+        self._token = _current.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        _current.reset(self._token)
+        self.span.end(**({"error": f"{exc_type.__name__}: {exc}"} if exc_type is not None and issubclass(exc_type, Exception) else {}))
+        return False
+
+
+class Tracer:
+    def __init__(self, path, process_name=None):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.pid = os.getpid()
+        self._lock = threading.Lock()
+        self._file = open(self.path, "a", encoding="utf-8")
+        if self._file.tell() == 0:
+            self._file.write("[\n")
+        self._named_threads = set()
+        self._base_perf = time.perf_counter()
+        self._base_us = time.time_ns() // 1000
+        self._reruns = []  # (span, thread_id, module frame) of reruns still running
+        self._watcher = None
+        self.spans_written = 0
+        self._emit({"name": "process_name", "ph": "M", "pid": self.pid, "tid": 0, "args": {"name": process_name or f"app {self.pid}"}})
+
+    def now_us(self):
+        return self._base_us + int((time.perf_counter() - self._base_perf) * 1e6)
+
+    def _emit(self, *events):
+        with self._lock:
+            for event in events:
+                self._file.write(json.dumps(event, default=str) + ",\n")
+            self._file.flush()
+
+    def _thread_event(self, thread_id):
+        if thread_id in self._named_threads:
+            return []
+        self._named_threads.add(thread_id)
+        name = next((t.name for t in threading.enumerate() if t.ident == thread_id), str(thread_id))
+        return [{"name": "thread_name", "ph": "M", "pid": self.pid, "tid": thread_id, "args": {"name": name}}]
+
+    def _write_span(self, span, end_us):
+        args = {**span.trace["attrs"], **span.attrs, "trace_id": span.trace["trace_id"], "span_id": span.span_id}
+        if span.parent_id:
+            args["parent_id"] = span.parent_id
+        event = {
+            "name": span.name, "cat": span.name.split(".", 1)[0], "ph": "X", "pid": self.pid, "tid": span.thread_id,
+            "ts": span.start_us, "dur": max(0, end_us - span.start_us), "args": args,
+        }
+        self._emit(*self._thread_event(span.thread_id), event)
+        with self._lock:
+            self.spans_written += 1
+
+    # Starts the trace of this rerun; the root span ends when the calling module frame returns
+    def start_rerun(self, name="rerun", **attrs):
+        trace = {"trace_id": uuid.uuid4().hex, "attrs": {k: v for k, v in attrs.items() if v is not None}}
+        span = Span(self, trace, name, None, {})
+        _current.set(span)
+        with self._lock:
+            self._reruns.append((span, threading.get_ident(), sys._getframe(1)))
+            if self._watcher is None:
+                self._watcher = threading.Thread(target=self._watch_reruns, name="trace-watcher", daemon=True)
+                self._watcher.start()
+        return span
+
+    def _watch_reruns(self):
+        while True:
+            time.sleep(RERUN_POLL_SECONDS)
+            frames = sys._current_frames()
+            with self._lock:
+                running = list(self._reruns)
+            finished = []
+            for entry in running:
+                span, thread_id, root = entry
+                frame = frames.get(thread_id)
+                while frame is not None and frame is not root:
+                    frame = frame.f_back
+                if frame is None or self.now_us() - span.start_us > MAX_RERUN_SECONDS * 1e6:
+                    finished.append(entry)
+            for entry in finished:
+                entry[0].end()
+            with self._lock:
+                self._reruns = [entry for entry in self._reruns if entry not in finished]
+            del frames
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+# --- Instrumentation helpers (no-ops outside a trace) ---
+# Adds attributes to the current trace, e.g. the variant once it is known
+def set_attributes(**attrs):
+    span = _current.get()
+    if span is not None:
+        span.trace["attrs"].update({k: v for k, v in attrs.items() if v is not None})
+
+
+# A child span of the current span as a context manager
+def span(name, **attrs):
+    parent = _current.get()
+    if parent is None:
+        return nullcontext()
+    return _SpanContext(Span(parent.tracer, parent.trace, name, parent.span_id, attrs))
+
+
+# A child span that is ended explicitly, possibly from another thread; None outside a trace
+def begin(name, **attrs):
+    parent = _current.get()
+    if parent is None:
+        return None
+    return Span(parent.tracer, parent.trace, name, parent.span_id, attrs)
+
+
+# fn running in a copy of the current context, for thread pools: its spans become children of
+# the span that was current at submit time, linked to it by a flow arrow
+def wrap(fn):
+    parent = _current.get()
+    if parent is None:
+        return fn
+    context = contextvars.copy_context()
+    submitted_us = parent.tracer.now_us()
+    submitted_tid = threading.get_ident()
+
+    def run(*args, **kwargs):
+        tracer = parent.tracer
+        flow_id = uuid.uuid4().int & 0xFFFFFFFF
+        thread_id = threading.get_ident()
+        if thread_id != submitted_tid:
+            tracer._emit(
+                *tracer._thread_event(thread_id),
+                {"name": "submit", "cat": "flow", "ph": "s", "id": flow_id, "pid": tracer.pid, "tid": submitted_tid, "ts": submitted_us},
+                {"name": "submit", "cat": "flow", "ph": "f", "bp": "e", "id": flow_id, "pid": tracer.pid, "tid": thread_id, "ts": tracer.now_us()},
+            )
+        return context.run(fn, *args, **kwargs)
+
+    return run
+
+
+# --- Reading ---
+# Events of a trace file, also while it is still being written
+def read_events(path):
+    text = Path(path).read_text(encoding="utf-8").rstrip().rstrip(",")
+    if not text.endswith("]"):
+        text += "]"
+    return json.loads(text)
+
+
+def slowest_traces(events, top=10):
+    spans = [event for event in events if event.get("ph") == "X"]
+    roots = sorted((s for s in spans if "parent_id" not in s["args"]), key=lambda s: s["dur"], reverse=True)[:top]
+    by_trace = {}
+    for s in spans:
+        by_trace.setdefault(s["args"]["trace_id"], []).append(s)
+    return [(root, sorted(by_trace[root["args"]["trace_id"]], key=lambda s: s["ts"])) for root in roots]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize a trace file written by the study apps")
+    sub = parser.add_subparsers(dest="command", required=True)
+    slowest = sub.add_parser("slowest", help="the slowest reruns with their child spans")
+    slowest.add_argument("trace_file")
+    slowest.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    for root, spans in slowest_traces(read_events(args.trace_file), args.top):
+        attrs = root["args"]
+        print(f"{root['dur'] / 1000:8.1f} ms  {root['name']}  user {attrs.get('user_id')}  variant {attrs.get('variant')}  task {attrs.get('task_index')}  trace {attrs['trace_id']}")
+        for s in spans:
+            if s is not root:
+                print(f"{'':>12}{(s['ts'] - root['ts']) / 1000:+8.1f} ms {s['dur'] / 1000:8.1f} ms  {s['name']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+# --- Chat transcript rendering ---
+# Draws the turns of a task and a fresh response the same way, with the green box around the
+# values/recommendations block of boxed variants. The box comes from the offsets stored with
+# the turn (Turn.box); a turn that was logged before they were stored is segmented on its first
+# redraw and keeps the result, so a rerun never runs the block search twice for one turn.
+#
+# Long tasks are drawn windowed: only the latest turns are rendered in full, every older turn is
+# a single one-line summary button, and its text is only rendered (and sent to the browser) once
+# the participant clicks it. A rerun therefore costs the same few elements however long the
+# iteration on a draft has become.
+
+import re
+
+import streamlit as st
+
+from response_boxing import response_box, split_response
+
+# Characters that would turn a summary into Markdown formatting
+_MARKDOWN_SPECIAL = re.compile(r"([\\`*_\[\]()#~>$|])")
+SUMMARY_CHARS = 90
+
+BOX_HTML = """
+<div style="border: 2px solid #2ecc71; border-radius: 8px; padding: 10px; background-color: #f9fffa;">
+
+{boxed}
+
+</div>
+"""
+
+
+def render_response(response, box):
+    segments = split_response(response, box)
+    if segments is None:
+        st.markdown(response)
+        return
+    before, boxed, after = segments
+    if before:
+        st.markdown(before)
+    st.markdown(BOX_HTML.format(boxed=boxed), unsafe_allow_html=True)
+    if after:
+        st.markdown(after)
+
+
+def turn_box(turn, boxed_variants):
+    if turn.box is None:
+        turn.box = response_box(turn.response, turn.variant, boxed_variants)
+    return turn.box
+
+
+def render_turn(turn, boxed_variants=()):
+    with st.chat_message("user"):
+        st.markdown(turn.prompt)
+    with st.chat_message("assistant"):
+        render_response(turn.response, turn_box(turn, boxed_variants))
+
+
+def turn_summary(turn, limit=SUMMARY_CHARS):
+    prompt = " ".join(turn.prompt.split())
+    if len(prompt) > limit:
+        prompt = prompt[:limit - 1].rstrip() + "…"
+    return _MARKDOWN_SPECIAL.sub(r"\\\1", prompt)
+
+
+def _toggle_turn(turn_id):
+    expanded = st.session_state.setdefault("expanded_turn_ids", set())
+    expanded.symmetric_difference_update({turn_id})
+
+
+# Renders the latest `window` turns in full and the older ones as summaries that expand on click
+# (window None or 0: everything in full)
+def render_transcript(turns, window=None, boxed_variants=()):
+    turns = list(turns)
+    older = turns[:-window] if window and len(turns) > window else []
+    expanded = st.session_state.get("expanded_turn_ids", set())
+    if older:
+        st.caption(f"{len(older)} earlier message{'s' if len(older) != 1 else ''}, click one to show it")
+    for turn in older:
+        if turn.turn_id in expanded:
+            st.button("Hide", key=f"turn_{turn.turn_id}", type="tertiary", icon=":material/expand_less:",
+                      on_click=_toggle_turn, args=(turn.turn_id,))
+            render_turn(turn, boxed_variants)
+        else:
+            st.button(turn_summary(turn), key=f"turn_{turn.turn_id}", type="tertiary", icon=":material/expand_more:",
+                      on_click=_toggle_turn, args=(turn.turn_id,))
+    for turn in turns[len(older):]:
+        render_turn(turn, boxed_variants)
@@ -0,0 +1,145 @@
+# --- Turn-ID keyed log store ---
+# Every Turn gets a turn_id when it is created. The store keeps one append-only data file of
+# JSON rows plus a persistent hash index (turn_id -> offset, length, digest) in a second
+# append-only file that is loaded into a dict on open. An upsert is O(1) whatever the log size:
+# a row whose digest matches the indexed version is a no-op, so re-submits and retries are
+# idempotent, and a changed row is appended and re-pointed in the index (last write wins).
+#
+# All app workers of a host share the directory. Appends hold an exclusive flock on the data file
+# from the end-of-file offset to the index line, and every operation first reads the index lines
+# other processes appended since the last look, so each worker sees the turns of all of them.
+
+import fcntl
+import hashlib
+import json
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+DATA_FILE = "turns.jsonl"
+INDEX_FILE = "turns.idx"
+
+
+# Deterministic id for rows logged before turn ids existed. The timestamp is part of it, so two
+# genuinely identical turns stay separate while repeated saves of the same turn collapse.
+def legacy_turn_id(row):
+    key = "\x1f".join(str(row.get(name)) for name in ("user_id", "task_index", "timestamp", "prompt", "response"))
+    return "legacy-" + hashlib.sha1(key.encode("utf-8")).hexdigest()[:20]
+
+
+def row_turn_id(row):
+    turn_id = row.get("turn_id")
+    if turn_id is None or turn_id != turn_id:  # missing or NaN (older Excel exports)
+        return legacy_turn_id(row)
+    return turn_id
+
+
+def encode_row(row):
+    return json.dumps(row, ensure_ascii=False, separators=(",", ":"), sort_keys=True, default=str).encode("utf-8")
+
+
+# Last version of every turn, in first-seen order; the in-memory counterpart of the store
+def latest_by_turn_id(rows):
+    latest = {}
+    for row in rows:
+        latest[row_turn_id(row)] = row
+    return latest
+
+
+class TurnLogStore:
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._data_path = self.directory / DATA_FILE
+        self._index_path = self.directory / INDEX_FILE
+        self._lock = threading.Lock()
+        self._index = {}
+        self._data = open(self._data_path, "ab+")
+        self._index_file = open(self._index_path, "ab+")
+        self._index_read = 0  # bytes of the index file applied to self._index
+        with self._locked(fcntl.LOCK_SH):
+            pass
+
+    # Thread lock plus flock on the data file; applies the index lines appended since the last call
+    @contextmanager
+    def _locked(self, mode):
+        with self._lock:
+            fcntl.flock(self._data, mode)
+            try:
+                self._refresh_index()
+                yield
+            finally:
+                fcntl.flock(self._data, fcntl.LOCK_UN)
+
+    def _refresh_index(self):
+        self._index_file.seek(self._index_read)
+        chunk = self._index_file.read()
+        complete = chunk.rfind(b"\n") + 1  # a torn last line after a crash is skipped until completed
+        if not complete:
+            return
+        data_size = os.fstat(self._data.fileno()).st_size
+        for line in chunk[:complete].decode("utf-8").splitlines():
+            parts = line.split("\t")
+            if len(parts) != 4:
+                continue
+            turn_id, offset, length, digest = parts
+            # Ignore entries whose data never made it to disk
+            if int(offset) + int(length) <= data_size:
+                self._index[turn_id] = (int(offset), int(length), digest)
+        self._index_read += complete
+
+    def __len__(self):
+        with self._locked(fcntl.LOCK_SH):
+            return len(self._index)
+
+    def __contains__(self, turn_id):
+        with self._locked(fcntl.LOCK_SH):
+            return turn_id in self._index
+
+    # Returns True if the row was written, False if the same version was already stored
+    def upsert(self, row):
+        turn_id = row_turn_id(row)
+        payload = encode_row({**row, "turn_id": turn_id})
+        digest = hashlib.blake2b(payload, digest_size=12).hexdigest()
+        with self._locked(fcntl.LOCK_EX):
+            current = self._index.get(turn_id)
+            if current is not None and current[2] == digest:
+                return False
+            self._data.seek(0, os.SEEK_END)
+            offset = self._data.tell()
+            self._data.write(payload + b"\n")
+            self._data.flush()
+            self._index_file.seek(0, os.SEEK_END)
+            self._index_file.write(f"{turn_id}\t{offset}\t{len(payload)}\t{digest}\n".encode("utf-8"))
+            self._index_file.flush()
+            self._refresh_index()
+            return True
+
+    def get(self, turn_id):
+        with self._locked(fcntl.LOCK_SH):
+            entry = self._index.get(turn_id)
+            if entry is None:
+                return None
+            offset, length, _ = entry
+            self._data.seek(offset)
+            return json.loads(self._data.read(length))
+
+    def turn_ids(self):
+        with self._locked(fcntl.LOCK_SH):
+            return list(self._index)
+
+    # Latest version of every turn, in data file order
+    def rows(self):
+        with self._locked(fcntl.LOCK_SH):
+            entries = sorted(self._index.values())
+            rows = []
+            for offset, length, _ in entries:
+                self._data.seek(offset)
+                rows.append(json.loads(self._data.read(length)))
+            return rows
+
+    def close(self):
+        with self._lock:
+            self._data.close()
+            self._index_file.close()
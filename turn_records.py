@@ -0,0 +1,128 @@
+# --- Compact chat turn records ---
+# One Turn is kept per prompt/response pair in st.session_state.chat_history. Compared with the
+# plain dict we used before, a Turn has no per-instance __dict__, shares the user_id/variant
+# strings across all turns (interned), keeps the timestamp as a float and stores both texts as
+# UTF-8 bytes. The last point matters more than it looks: a single curly quote or dash in an LLM
+# response makes CPython store the whole str with 2 bytes per character.
+#
+# A turn also keeps the offsets of the response's boxed block (response_boxing.py), found once
+# when the response arrives, so transcript reruns do not search the text again.
+
+import itertools
+import sys
+import time
+import uuid
+from datetime import datetime
+
+from turn_log import row_turn_id
+
+LOG_COLUMNS = [
+    "turn_id", "timestamp", "user_id", "variant", "task_index", "prompt", "response",
+    "prompt_tokens", "completion_tokens", "cached_tokens", "cost_usd", "box", "model_prompt",
+]
+
+# Slots object, timestamp, turn id, two bytes headers, usage numbers and the list slot (CPython 3.11)
+TURN_OVERHEAD_BYTES = 400
+
+
+class Turn:
+    __slots__ = (
+        "user_id", "variant", "task_index", "ts", "_prompt", "_response",
+        "prompt_tokens", "completion_tokens", "cached_tokens", "cost_usd", "turn_id", "box", "model_prompt",
+    )
+
+    def __init__(self, user_id, variant, task_index, prompt, response, ts=None, usage=None, turn_id=None, box=None, model_prompt=None):
+        self.user_id = sys.intern(str(user_id))
+        self.variant = sys.intern(str(variant))
+        self.task_index = int(task_index)
+        self.ts = time.time() if ts is None else float(ts)
+        self._prompt = prompt.encode("utf-8")
+        self._response = response.encode("utf-8")
+        # usage_accounting.Usage of the LLM call that produced the response (None if unknown)
+        self.prompt_tokens, self.completion_tokens, self.cached_tokens, self.cost_usd = usage or (None, None, None, None)
+        # Stable key of this turn in every log store; re-saving a turn never duplicates it
+        self.turn_id = turn_id or f"{self.user_id}-{uuid.uuid4().hex[:16]}"
+        # Box offsets of the response: () if it has none, None if not segmented yet (older turns)
+        self.box = box
+        # The user message the model was actually sent, if it was not the participant's prompt (a
+        # speculative revision answers SPECULATIVE_PROMPT for the participant's confirmation)
+        self.model_prompt = model_prompt
+
+    @property
+    def prompt(self):
+        return self._prompt.decode("utf-8")
+
+    @property
+    def response(self):
+        return self._response.decode("utf-8")
+
+    @property
+    def timestamp(self):
+        return datetime.fromtimestamp(self.ts).isoformat()
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        # States pickled by older versions are shorter; missing fields default to None
+        for name, value in itertools.zip_longest(self.__slots__, state):
+            setattr(self, name, value)
+        self.user_id = sys.intern(self.user_id)
+        self.variant = sys.intern(self.variant)
+
+    def __repr__(self):
+        return f"Turn(user_id={self.user_id!r}, variant={self.variant!r}, task_index={self.task_index}, timestamp={self.timestamp!r})"
+
+    # Approximate resident size, used by the session memory ceiling
+    def size_bytes(self):
+        return TURN_OVERHEAD_BYTES + len(self._prompt) + len(self._response)
+
+    # Row layout of the chat log files (same columns as the dict-based log entries)
+    def to_log_row(self):
+        return {
+            "turn_id": self.turn_id,
+            "timestamp": self.timestamp,
+            "user_id": self.user_id,
+            "variant": self.variant,
+            "task_index": self.task_index,
+            "prompt": self.prompt,
+            "response": self.response,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cached_tokens": self.cached_tokens,
+            "cost_usd": self.cost_usd,
+            "box": None if self.box is None else ",".join(map(str, self.box)),
+            "model_prompt": self.model_prompt,
+        }
+
+    @classmethod
+    def from_log_row(cls, row):
+        ts = row["timestamp"]
+        if isinstance(ts, str):
+            ts = datetime.fromisoformat(ts).timestamp()
+        elif hasattr(ts, "timestamp"):
+            ts = ts.timestamp()
+        usage = tuple(_optional_number(row.get(name)) for name in ("prompt_tokens", "completion_tokens", "cached_tokens", "cost_usd"))
+        return cls(
+            row["user_id"], row["variant"], row["task_index"], row["prompt"], row["response"],
+            ts=ts, usage=usage, turn_id=row_turn_id(row), box=_box_from_cell(row.get("box")),
+            model_prompt=row.get("model_prompt") if isinstance(row.get("model_prompt"), str) else None,
+        )
+
+
+# Log rows written before usage was recorded have no (or NaN) usage cells
+def _optional_number(value):
+    if value is None or value != value:
+        return None
+    return value
+
+
+# "b0,b1,b2,a" for a boxed response, "" for none; rows from before the column, or NaN, are None
+def _box_from_cell(value):
+    if not isinstance(value, str):
+        return None
+    return tuple(int(offset) for offset in value.split(",")) if value else ()
+
+
+def turns_for_task(turns, task_index):
+    return [turn for turn in turns if turn.task_index == task_index]
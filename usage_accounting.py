@@ -0,0 +1,174 @@
+# --- Token usage and cost accounting ---
+# call_llm records response.usage for every turn. Cost is derived from a price table (USD per
+# 1M tokens) that can be overridden without a code change, and a process-wide UsageLedger keeps
+# running totals per (study, variant, task_index) so cost per arm is available without reading
+# the log files back. Workers on one host that share a snapshot file merge their totals into it
+# under a file lock.
+
+import fcntl
+import json
+import logging
+import os
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+from pathlib import Path
+
+# USD per 1M tokens; cached prompt tokens are billed at the cached input rate instead of input
+DEFAULT_PRICE_TABLE = {
+    "gpt-4.1-nano-2025-04-14": {"input": 0.10, "cached_input": 0.025, "output": 0.40},
+    "gpt-4.1-mini-2025-04-14": {"input": 0.40, "cached_input": 0.10, "output": 1.60},
+    "gpt-4.1-2025-04-14": {"input": 2.00, "cached_input": 0.50, "output": 8.00},
+}
+
+logger = logging.getLogger(__name__)
+
+Usage = namedtuple("Usage", ["prompt_tokens", "completion_tokens", "cached_tokens", "cost_usd"])
+
+USAGE_FIELDS = list(Usage._fields)
+
+
+# Price table = defaults, updated with a JSON object from LLM_PRICE_TABLE (env) and/or overrides
+def load_price_table(overrides=None):
+    prices = {model: dict(rates) for model, rates in DEFAULT_PRICE_TABLE.items()}
+    env_table = os.environ.get("LLM_PRICE_TABLE")
+    for table in (json.loads(env_table) if env_table else None, overrides):
+        for model, rates in (table or {}).items():
+            prices.setdefault(model, {}).update({key: float(value) for key, value in dict(rates).items()})
+    return prices
+
+
+def cost_usd(prices, model, prompt_tokens, completion_tokens, cached_tokens=0):
+    rates = prices.get(model)
+    if rates is None:
+        return None
+    uncached = prompt_tokens - cached_tokens
+    return (
+        uncached * rates.get("input", 0.0)
+        + cached_tokens * rates.get("cached_input", rates.get("input", 0.0))
+        + completion_tokens * rates.get("output", 0.0)
+    ) / 1_000_000
+
+
+def usage_from_response(response, model, prices):
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return Usage(None, None, None, None)
+    prompt_tokens = usage.prompt_tokens or 0
+    completion_tokens = usage.completion_tokens or 0
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached_tokens = (getattr(details, "cached_tokens", None) or 0) if details is not None else 0
+    return Usage(
+        prompt_tokens, completion_tokens, cached_tokens,
+        cost_usd(prices, model, prompt_tokens, completion_tokens, cached_tokens),
+    )
+
+
+# Counters of one (study, variant, task_index)
+def _empty_totals():
+    return {"turns": 0, **{name: 0 for name in USAGE_FIELDS}}
+
+
+class UsageLedger:
+    def __init__(self, snapshot_path=None):
+        self._lock = threading.Lock()
+        self._totals = {}
+        self._unsaved = {}  # recorded here, not yet merged into the snapshot
+        self.snapshot_path = Path(snapshot_path) if snapshot_path else None
+        if self.snapshot_path:
+            self.snapshot_path.parent.mkdir(parents=True, exist_ok=True)
+            self._load_snapshot()
+
+    def record(self, study, variant, task_index, usage):
+        if usage.prompt_tokens is None:
+            return
+        key = (study, str(variant), int(task_index))
+        with self._lock:
+            counts = self._unsaved if self.snapshot_path else self._totals
+            totals = counts.setdefault(key, _empty_totals())
+            totals["turns"] += 1
+            totals["prompt_tokens"] += usage.prompt_tokens
+            totals["completion_tokens"] += usage.completion_tokens
+            totals["cached_tokens"] += usage.cached_tokens
+            totals["cost_usd"] += usage.cost_usd or 0.0
+            if self.snapshot_path:
+                # Bookkeeping must never cost the participant's turn: the counts stay unsaved and
+                # are merged with the next record
+                try:
+                    self._merge_snapshot()
+                except Exception:
+                    logger.exception("Failed to write usage snapshot %s", self.snapshot_path)
+
+    # One row per (study, variant, task_index), sorted; with a snapshot, the totals of every
+    # process sharing it
+    def rows(self):
+        with self._lock:
+            if self.snapshot_path:
+                self._load_snapshot()
+            return [
+                {"study": study, "variant": variant, "task_index": task_index, **totals}
+                for (study, variant, task_index), totals in sorted(self._totals.items())
+            ]
+
+    # Totals per (study, variant) across tasks
+    def by_arm(self):
+        arms = {}
+        for row in self.rows():
+            arm = arms.setdefault((row["study"], row["variant"]), _empty_totals())
+            for name in ("turns", *USAGE_FIELDS):
+                arm[name] += row[name]
+        return arms
+
+    # Several workers on one host share the snapshot: each one adds its own counts to the file
+    # under an exclusive lock instead of overwriting the others' totals. The lock sits on a
+    # separate file because os.replace swaps the snapshot's inode.
+    @contextmanager
+    def _snapshot_locked(self, mode):
+        with open(self.snapshot_path.with_suffix(".lock"), "a") as lock_file:
+            fcntl.flock(lock_file, mode)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    # Keeps the last totals read if the snapshot cannot be read
+    def _load_snapshot(self):
+        try:
+            with self._snapshot_locked(fcntl.LOCK_SH):
+                self._totals = self._read_snapshot()
+        except Exception:
+            logger.exception("Failed to read usage snapshot %s", self.snapshot_path)
+
+    def _read_snapshot(self):
+        totals = {}
+        if self.snapshot_path.exists():
+            for row in json.loads(self.snapshot_path.read_text()):
+                key = (row["study"], row["variant"], row["task_index"])
+                totals[key] = {name: row[name] for name in ("turns", *USAGE_FIELDS)}
+        return totals
+
+    # Adds the unsaved counts to the snapshot on disk; on a failed write they stay unsaved and
+    # go out with the next record
+    def _merge_snapshot(self):
+        with self._snapshot_locked(fcntl.LOCK_EX):
+            try:
+                merged = self._read_snapshot()
+            except (ValueError, KeyError, TypeError):
+                # A corrupt snapshot would fail every merge: set it aside and go on from the last
+                # totals read
+                logger.exception("Corrupt usage snapshot %s, moved to .corrupt", self.snapshot_path)
+                os.replace(self.snapshot_path, self.snapshot_path.with_suffix(".corrupt"))
+                merged = {key: dict(totals) for key, totals in self._totals.items()}
+            for key, counts in self._unsaved.items():
+                totals = merged.setdefault(key, _empty_totals())
+                for name in ("turns", *USAGE_FIELDS):
+                    totals[name] += counts[name]
+            rows = [
+                {"study": study, "variant": variant, "task_index": task_index, **totals}
+                for (study, variant, task_index), totals in sorted(merged.items())
+            ]
+            tmp_path = self.snapshot_path.with_suffix(".tmp")
+            tmp_path.write_text(json.dumps(rows))
+            os.replace(tmp_path, self.snapshot_path)
+        self._totals = merged
+        self._unsaved = {}